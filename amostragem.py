@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Prévia por amostragem estratificada, com os números exatos calculados em segundo plano.
+
+Em bases consolidadas muito grandes, validar e preparar todas as linhas leva
+segundos antes da primeira aba aparecer. `AmostraEstratificada.sortear`
+escolhe, uma vez por fonte (na ingestão, pelo armazém de artefatos), uma
+amostra estratificada por mês da ETA x armador: alocação proporcional com um
+mínimo por estrato, de modo que meses e armadores pequenos também apareçam.
+Cada linha sorteada representa N_h / n_h escalas do seu estrato, e os totais
+(contagens, TEUs, custos) saem do estimador estratificado usual, com
+intervalo de 95%:
+
+    total = Σ_h N_h · ȳ_h        var = Σ_h N_h² · (1 - n_h/N_h) · s_h² / n_h
+
+`CalculoEmSegundoPlano` executa as etapas exatas em sequência numa thread;
+o dashboard pinta a prévia e troca cada número pelo exato quando a etapa
+correspondente termina.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from dados_navios import para_datas
+from enriquecimento import NAO_INFORMADO, TABELAS, remapear
+
+# Linhas sorteadas (aproximadamente) em toda a fonte; fontes menores entram inteiras
+TAMANHO_PADRAO = 20_000
+MINIMO_POR_ESTRATO = 5
+Z_95 = 1.96
+
+
+class Estimativa(NamedTuple):
+    """Total estimado e a margem do intervalo de 95%."""
+    valor: float
+    erro: float
+
+    @property
+    def inferior(self) -> float:
+        return self.valor - self.erro
+
+    @property
+    def superior(self) -> float:
+        return self.valor + self.erro
+
+    def texto(self, formato: str = "{:,.0f}") -> str:
+        return f"≈ {formato.format(self.valor)} ± {formato.format(self.erro)}"
+
+
+class AmostraEstratificada:
+    """Posições sorteadas de uma fonte e os tamanhos de cada estrato (mês x armador)."""
+
+    def __init__(self, posicoes: np.ndarray, codigos: np.ndarray, tamanhos: np.ndarray, estratos: pd.DataFrame):
+        self.posicoes = posicoes
+        self.codigos = codigos
+        self.tamanhos = tamanhos.astype(float)
+        self.sorteados = np.bincount(codigos, minlength=len(tamanhos)).astype(float)
+        self.estratos = estratos
+
+    @classmethod
+    def sortear(cls, df: pd.DataFrame, colunas: dict, tamanho: int = TAMANHO_PADRAO,
+                minimo: int = MINIMO_POR_ESTRATO, semente: int = 0) -> "AmostraEstratificada":
+        """Amostra de ~`tamanho` linhas de `df`, proporcional por estrato e com pelo menos `minimo` em cada um."""
+        # Mês truncado em datetime64 e armador categórico: o agrupamento não passa por strings
+        estratos = {}
+        if colunas.get("data"):
+            estratos["Mês"] = para_datas(df[colunas["data"]]).to_numpy(dtype="datetime64[ns]").astype("datetime64[M]")
+        if colunas.get("armador"):
+            estratos["Armador"] = remapear(df[colunas["armador"]], TABELAS["armador"])[0].to_numpy()
+        if estratos:
+            agrupados = pd.DataFrame(estratos, index=df.index).groupby(list(estratos), sort=True, observed=True,
+                                                                        dropna=False)
+            codigos = agrupados.ngroup().to_numpy()
+            rotulos = agrupados.size().reset_index()[list(estratos)]
+            if "Mês" in rotulos:
+                rotulos["Mês"] = rotulos["Mês"].dt.strftime("%Y-%m").fillna(NAO_INFORMADO)
+        else:
+            codigos, rotulos = np.zeros(len(df), dtype=np.intp), pd.DataFrame(index=[0])
+
+        tamanhos = np.bincount(codigos, minlength=len(rotulos))
+        fracao = min(1.0, tamanho / max(len(df), 1))
+        alocados = np.minimum(tamanhos, np.maximum(np.round(tamanhos * fracao), minimo)).astype(np.int64)
+
+        # Dentro de cada estrato ficam as linhas com as menores chaves aleatórias
+        aleatorio = np.random.default_rng(semente).random(len(df))
+        ordem = np.lexsort((aleatorio, codigos))
+        inicio = np.concatenate([[0], np.cumsum(tamanhos)[:-1]])
+        rank = np.arange(len(df)) - inicio[codigos[ordem]]
+        posicoes = np.sort(ordem[rank < alocados[codigos[ordem]]])
+        return cls(posicoes, codigos[posicoes], tamanhos, rotulos)
+
+    @property
+    def n(self) -> int:
+        return len(self.posicoes)
+
+    @property
+    def total_linhas(self) -> int:
+        return int(self.tamanhos.sum())
+
+    @property
+    def nbytes(self) -> int:
+        return self.posicoes.nbytes + self.codigos.nbytes + self.tamanhos.nbytes
+
+    def linhas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Linhas sorteadas de `df` (a mesma fonte usada no sorteio)."""
+        return df.iloc[self.posicoes]
+
+    def _totais(self, codigos: np.ndarray, y: np.ndarray, grupos: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Total estimado e erro padrão de `y` por grupo (`codigos` = grupo * estratos + estrato)."""
+        k = len(self.tamanhos)
+        soma = np.bincount(codigos, weights=y, minlength=grupos * k).reshape(grupos, k)
+        soma_quadrados = np.bincount(codigos, weights=y * y, minlength=grupos * k).reshape(grupos, k)
+        media = soma / self.sorteados
+        variancia = np.divide(soma_quadrados - self.sorteados * media ** 2, self.sorteados - 1,
+                              out=np.zeros_like(media), where=self.sorteados > 1)
+        total = (self.tamanhos * media).sum(axis=1)
+        fpc = 1 - self.sorteados / self.tamanhos
+        erro_padrao = np.sqrt(np.maximum((self.tamanhos ** 2 * fpc * variancia / self.sorteados).sum(axis=1), 0))
+        return total, erro_padrao
+
+    def _valores(self, valores, mascara) -> np.ndarray:
+        if valores is None:
+            y = np.ones(self.n)
+        else:
+            y = pd.to_numeric(pd.Series(valores), errors="coerce").fillna(0).to_numpy(dtype=float)
+        return y if mascara is None else y * np.asarray(mascara, dtype=bool)
+
+    def estimar(self, valores=None, mascara=None) -> Estimativa:
+        """Total de `valores` (contagem, se None) na fonte inteira, restrito às linhas em `mascara`."""
+        total, erro_padrao = self._totais(self.codigos, self._valores(valores, mascara))
+        return Estimativa(float(total[0]), float(Z_95 * erro_padrao[0]))
+
+    def estimar_grupos(self, grupos, valores=None, mascara=None, nome: str = "Grupo") -> pd.DataFrame:
+        """Totais estimados por grupo (uma linha por valor de `grupos` na amostra), do maior para o menor."""
+        y = self._valores(valores, mascara)
+        rotulos = pd.Series(grupos).astype("string").fillna(NAO_INFORMADO).to_numpy()
+        if mascara is not None:
+            # Grupos que só aparecem fora da máscara não entram no resultado
+            presentes = np.asarray(mascara, dtype=bool)
+            rotulos = np.where(presentes, rotulos, None)
+        codigos_grupo, categorias = pd.factorize(rotulos)
+        codigos_grupo = np.where(codigos_grupo < 0, len(categorias), codigos_grupo)
+        total, erro_padrao = self._totais(codigos_grupo * len(self.tamanhos) + self.codigos, y,
+                                          len(categorias) + 1)
+        resultado = pd.DataFrame({nome: categorias, "Estimativa": total[:-1], "Erro": Z_95 * erro_padrao[:-1]})
+        resultado = resultado[resultado["Estimativa"] > 0]
+        return resultado.sort_values("Estimativa", ascending=False).reset_index(drop=True)
+
+
+class CalculoEmSegundoPlano:
+    """Etapas exatas executadas em sequência numa thread; cada resultado fica disponível ao terminar."""
+
+    def __init__(self, etapas: dict):
+        """`etapas` mapeia o nome da etapa para uma função sem argumentos, na ordem de execução."""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="calculo_exato")
+        self.futuros: dict[str, Future] = {nome: executor.submit(funcao) for nome, funcao in etapas.items()}
+        executor.shutdown(wait=False)
+
+    def pronta(self, nome: str) -> bool:
+        return self.futuros[nome].done()
+
+    def resultado(self, nome: str):
+        """Resultado da etapa, aguardando-a se ainda estiver em cálculo."""
+        return self.futuros[nome].result()
+
+    @property
+    def prontas(self) -> int:
+        return sum(futuro.done() for futuro in self.futuros.values())
+
+    @property
+    def total(self) -> int:
+        return len(self.futuros)
+
+    @property
+    def concluido(self) -> bool:
+        return self.prontas == self.total
@@ -12,10 +12,17 @@ O objetivo deste trabalho é analisar os levantamentos em formato Excel dos port
 # -----------------------------------------------------------
 # 1. Importar bibliotecas necessárias
 # -----------------------------------------------------------
+import sys
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
+from artefatos import cancelamentos, dataset_validado
+from enriquecimento import TABELAS, remapear
+from mapeamento_colunas import CAMPOS_APP
+from processamento_lotes import processar_em_lotes
+
 # Ajustes gerais de exibição
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 200)
@@ -25,7 +32,44 @@ plt.rcParams['figure.figsize'] = (10, 6)
 # 2. Carregar o arquivo Excel
 # -----------------------------------------------------------
 excel_filename = 'ProgramacaoDeNavios (1) (1).xlsx'
-df = pd.read_excel(excel_filename)
+
+# -----------------------------------------------------------
+# 2.1 Modo em lotes (python analise_navios.py --lotes)
+#     Para planilhas maiores que a memória: lê por blocos e
+#     imprime apenas o resumo a partir dos agregados parciais.
+# -----------------------------------------------------------
+if '--lotes' in sys.argv:
+    agregados = processar_em_lotes(
+        excel_filename,
+        col_status='Situação',
+        col_data='Estimativa Chegada ETA',
+        col_teus='Movs',
+        col_armador='Armador',
+        dimensoes=['Navio / Viagem', 'De / Para', 'Tipo', 'Armador', 'Berço', 'Serviço', 'País']
+    )
+    print("\n--- RESUMO (MODO EM LOTES) ---")
+    print(f"- Total de linhas na planilha original: {agregados.total_registros}")
+    print(f"- Total de cancelamentos analisados: {agregados.total_cancelados}")
+    for dimensao in agregados.dimensoes:
+        print(f"\nTop 10 - {dimensao}:")
+        print(agregados.top(dimensao).to_string(index=False))
+    contagem_mensal = agregados.serie_mensal()
+    if len(contagem_mensal) > 0:
+        max_mes = contagem_mensal.loc[contagem_mensal['Cancelamentos'].idxmax()]
+        print(f"\n- Mês com maior incidência de cancelamentos: {max_mes['Y-M'].strftime('%Y-%m')} ({int(max_mes['Cancelamentos'])} cancelamentos)")
+    if agregados.n_teus > 0:
+        print(f"- Média de contêineres em cancelamentos: {agregados.media_teus:.2f}")
+    if agregados.total_cancelados > 0:
+        print(f"- Custo total estimado: R$ {agregados.soma_custo:,.2f} (médio R$ {agregados.custo_medio:,.2f})")
+    print("\nHistograma de contêineres:")
+    print(agregados.histograma().to_string(index=False))
+    print("--- FIM DO RESUMO ---")
+    sys.exit(0)
+
+# Leitura pelo armazém de artefatos: o mesmo dataset validado (Arrow mapeado, datas
+# já convertidas) do dashboard e da API
+fonte = dataset_validado(excel_filename, CAMPOS_APP)
+df, _, validacao = fonte.valor
 
 # -----------------------------------------------------------
 # 3. Inspeção inicial: colunas e primeiras linhas
@@ -67,13 +111,11 @@ print({
 if col_status is None:
     raise ValueError("Não foi possível identificar a coluna de status. Ajuste 'col_status' manualmente.")
 
-df[col_status] = df[col_status].astype(str).str.strip().str.lower()
-valores_cancelados = ['cancelado', 'cancelada', 'rejeitado', 'rej.', 'canceled']
-mask_cancel = df[col_status].isin(valores_cancelados)
-
-df_cancel = df.loc[mask_cancel].copy()
+# Cópia rasa do artefato de cancelamentos: as análises abaixo alteram colunas
+df_cancel = cancelamentos(fonte, col_status).valor.copy(deep=False)
 print(f"\nTotal de linhas na planilha original: {len(df)}")
 print(f"Total de registros de cancelamento identificados: {len(df_cancel)}")
+print(f"Registros inconsistentes apontados pela validação (mantidos aqui): {validacao.n_descartadas}")
 
 # -----------------------------------------------------------
 # 6. Converter coluna de data para datetime e extrair intervalos
@@ -81,7 +123,7 @@ print(f"Total de registros de cancelamento identificados: {len(df_cancel)}")
 if col_data is None:
     raise ValueError("Não foi possível identificar a coluna de data. Ajuste 'col_data' manualmente.")
 
-df_cancel[col_data] = pd.to_datetime(df_cancel[col_data], dayfirst=True, errors='coerce')
+# A ETA já vem convertida do dataset validado
 na_dates = df_cancel[col_data].isna().sum()
 print(f"\nRegistros de cancelamento com data inválida/nula: {na_dates}")
 df_cancel = df_cancel.dropna(subset=[col_data])
@@ -229,7 +271,7 @@ else:
 col_armador = 'Armador' if 'Armador' in df_cancel.columns else None
 
 if col_armador is not None:
-    df_cancel[col_armador] = df_cancel[col_armador].astype(str).str.strip().str.capitalize()
+    df_cancel[col_armador] = remapear(df_cancel[col_armador], TABELAS["armador"])[0]
     contagem_armadores = df_cancel[col_armador].value_counts().reset_index()
     contagem_armadores.columns = ['Armador', 'Cancelamentos']
 
@@ -279,7 +321,7 @@ else:
 col_servico = 'Serviço' if 'Serviço' in df_cancel.columns else None
 
 if col_servico is not None:
-    df_cancel[col_servico] = df_cancel[col_servico].astype(str).str.strip().str.capitalize()
+    df_cancel[col_servico] = remapear(df_cancel[col_servico], TABELAS["servico"])[0]
     contagem_servicos = df_cancel[col_servico].value_counts().reset_index()
     contagem_servicos.columns = ['Serviço', 'Cancelamentos']
 
@@ -304,7 +346,7 @@ else:
 col_pais = 'País' if 'País' in df_cancel.columns else None
 
 if col_pais is not None:
-    df_cancel[col_pais] = df_cancel[col_pais].astype(str).str.strip().str.capitalize()
+    df_cancel[col_pais] = remapear(df_cancel[col_pais], TABELAS["pais"])[0]
     contagem_paises = df_cancel[col_pais].value_counts().reset_index()
     contagem_paises.columns = ['País', 'Cancelamentos']
 
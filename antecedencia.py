@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Antecedência das escalas: prazo de carga antes da ETA e janelas de recebimento.
+
+Para todas as escalas da programação, numa única passada:
+
+- Deadline → ETA (h): horas entre o Deadline Dry e a chegada
+- Janela de cheios (d): dias entre o início do recebimento de cheios e o deadline
+- Janela de vazios (d): dias entre o início do recebimento de vazios e o deadline
+
+Cada data é convertida uma única vez (reaproveitando as já convertidas pela
+validação) e as durações saem da subtração direta dos `datetime64`.
+`comparar_situacoes` contrasta canceladas e concluídas com quantis exatos;
+`cubo_antecedencias` monta um `sketches.CuboQuantis` por armador x mês x
+situação, de onde p50/p90/p99 de qualquer fatia saem mesclando células. O cubo
+é mesclável: exportações novas entram como lotes, sem reler o histórico.
+"""
+
+import numpy as np
+import pandas as pd
+
+from dados_navios import para_datas
+from enriquecimento import NAO_INFORMADO, TABELAS, remapear
+from risco_cancelamento import rotulos
+from sketches import CuboQuantis
+
+# Medida -> (campo de data inicial, campo de data final, unidade em horas)
+MEDIDAS = {
+    "Deadline → ETA (h)": ("deadline", "data", 1),
+    "Janela de cheios (d)": ("recebimento_cheio", "deadline", 24),
+    "Janela de vazios (d)": ("recebimento_vazio", "deadline", 24),
+}
+SITUACOES = {1: "Cancelada", 0: "Concluída", -1: "Programada"}
+QUANTIS = (0.5, 0.9, 0.99)
+DIMENSOES_CUBO = ["Armador", "Y-M", "Situação"]
+
+
+def calcular_antecedencias(df: pd.DataFrame, colunas: dict, convertidas: dict | None = None) -> pd.DataFrame:
+    """Medidas de antecedência, armador canônico, mês da ETA e situação de cada escala.
+
+    Só entram as medidas cujos dois campos de data existem na planilha.
+    `convertidas` (coluna -> Série já convertida) evita converter de novo.
+    """
+    convertidas = convertidas or {}
+    datas = {}
+    for campo in {campo for inicio, fim, _ in MEDIDAS.values() for campo in (inicio, fim)}:
+        coluna = colunas.get(campo)
+        if coluna and coluna in df.columns:
+            # As já convertidas podem cobrir mais linhas que `df` (ex.: antes do descarte)
+            serie = convertidas[coluna].reindex(df.index) if coluna in convertidas else para_datas(df[coluna])
+            datas[campo] = serie.to_numpy(dtype="datetime64[ns]")
+
+    resultado = {}
+    for nome, (inicio, fim, horas) in MEDIDAS.items():
+        if inicio in datas and fim in datas:
+            resultado[nome] = (datas[fim] - datas[inicio]) / np.timedelta64(1, "h") / horas
+
+    if colunas.get("armador"):
+        resultado["Armador"] = remapear(df[colunas["armador"]], TABELAS["armador"])[0].to_numpy()
+    else:
+        resultado["Armador"] = NAO_INFORMADO
+    if "data" in datas:
+        resultado["Y-M"] = pd.Series(datas["data"]).dt.strftime("%Y-%m").fillna(NAO_INFORMADO).to_numpy()
+    else:
+        resultado["Y-M"] = NAO_INFORMADO
+    situacao = rotulos(df[colunas["status"]])
+    resultado["Situação"] = pd.Categorical.from_codes(situacao + 1, [SITUACOES[-1], SITUACOES[0], SITUACOES[1]])
+    return pd.DataFrame(resultado, index=df.index)
+
+
+def medidas_disponiveis(antecedencias: pd.DataFrame) -> list[str]:
+    return [nome for nome in MEDIDAS if nome in antecedencias.columns]
+
+
+def comparar_situacoes(antecedencias: pd.DataFrame, quantis=QUANTIS) -> pd.DataFrame:
+    """Escalas, média e quantis exatos de cada medida, para canceladas e concluídas."""
+    encerradas = antecedencias[antecedencias["Situação"].isin([SITUACOES[1], SITUACOES[0]])]
+    linhas = []
+    for nome in medidas_disponiveis(antecedencias):
+        for situacao, valores in encerradas.groupby("Situação", observed=True)[nome]:
+            valores = valores.dropna()
+            if valores.empty:
+                continue
+            linhas.append({"Medida": nome, "Situação": situacao, "Escalas": len(valores),
+                           "Média": valores.mean(),
+                           **{f"p{round(q * 100):g}": valor
+                              for q, valor in zip(quantis, valores.quantile(list(quantis)))}})
+    return pd.DataFrame(linhas)
+
+
+def cubo_antecedencias(antecedencias: pd.DataFrame, k: int = 200) -> CuboQuantis:
+    """Sketches KLL das medidas por armador x mês x situação."""
+    cubo = CuboQuantis(DIMENSOES_CUBO, medidas_disponiveis(antecedencias), k)
+    cubo.atualizar(antecedencias)
+    return cubo
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+API HTTP local (JSON) com os agregados do dashboard de cancelamentos.
+
+Parte do mesmo dataset validado do dashboard (`artefatos.dataset_validado`:
+campos de `mapeamento_colunas` com as datas já convertidas e a máscara de
+`validacao`, em Arrow mapeado) e monta os cancelamentos com o descarte dos
+registros inconsistentes e o `enriquecimento` de Armador/País/Serviço, então
+os números batem com as abas; resolve os filtros
+com o índice bitmap e guarda cada resposta serializada em um cache LRU com
+ETag. Requisições repetidas são atendidas direto da memória, e clientes que
+enviam `If-None-Match` recebem 304 sem corpo.
+
+Uso:
+
+    python api_analitica.py --porta 8502
+    python api_analitica.py --porta 8502 --processos 4
+    curl "http://localhost:8502/navios/top?n=5&armador=MSC,Maersk&inicio=2024-01&fim=2024-12"
+
+Rotas: /saude, /navios/top, /mensal, /custos/armador, /rotas.
+Filtros (separados por vírgula): armador, servico, berco, pais, tipo; período
+em inicio/fim (AAAA-MM); custos em thc, oper, doc, arm_day, arm_days, insp.
+
+Com `--processos N` (POSIX), N processos atendem na mesma porta. O processo
+principal abre (ou, na primeira vez, grava) o dataset validado antes do fork;
+cada processo monta depois do fork os próprios cancelamentos a partir do
+arquivo mapeado, que todos compartilham pelo page cache, e tem o seu cache de
+respostas. Só as linhas canceladas, com as colunas do enriquecimento, ficam
+na memória privada de cada processo. Ao receber Ctrl+C ou SIGTERM, o
+processo principal encerra e aguarda os filhos.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from artefatos import dataset_validado
+from dados_navios import CUSTOS_PADRAO, custo_por_cancelamento, preparar_cancelamentos
+from enriquecimento import enriquecer
+from indice_bitmap import IndiceBitmap
+from mapeamento_colunas import CAMPOS_APP, aplicar_mapeamento
+from particionamento import DIR_PARTICOES, ler_particoes
+from rotas import MatrizOD
+from validacao import Validacao, validar_dataset
+
+ARQUIVO_PADRAO = "ProgramacaoDeNavios (1) (1).xlsx"
+PORTA_PADRAO = 8502
+
+# Parâmetro da URL -> dimensão do índice bitmap
+FILTROS = {"armador": "Armador", "servico": "Serviço", "berco": "Berço", "pais": "País", "tipo": "Tipo"}
+# Parâmetro da URL -> chave de CUSTOS_PADRAO
+PARAMETROS_CUSTO = {"thc": "THC", "oper": "OPER", "doc": "DOC", "arm_day": "ARM_DAY",
+                    "arm_days": "ARM_DAYS", "insp": "INSP"}
+
+
+class ParametroInvalido(ValueError):
+    """Parâmetro de consulta inválido (respondido com HTTP 400)."""
+
+
+class CacheRespostas:
+    """Cache LRU de respostas serializadas (corpo + ETag), seguro entre threads."""
+
+    def __init__(self, max_itens: int = 1024):
+        self.max_itens = max_itens
+        self._itens: OrderedDict = OrderedDict()
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item
+
+    def guardar(self, chave, corpo: bytes) -> tuple[str, bytes]:
+        item = (f'"{hashlib.sha1(corpo).hexdigest()}"', corpo)
+        with self._trava:
+            self._itens[chave] = item
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+        return item
+
+
+class ServicoAnalitico:
+    """Dataset de cancelamentos carregado em memória e os agregados servidos pela API."""
+
+    def __init__(self, df: pd.DataFrame, colunas: dict, validacao: Validacao | None = None,
+                 descartar_inconsistentes: bool = True):
+        """`df` e `colunas` (campo lógico -> coluna) vêm de `mapeamento_colunas`, como no dashboard.
+
+        Com `validacao`, `df` já é o dataset validado (ex.: `dataset_validado`); sem, é validado aqui.
+        """
+        if not colunas.get("navio") or not colunas.get("status"):
+            raise ValueError("As colunas obrigatórias 'Navio / Viagem1' e 'Situação' não foram encontradas.")
+        self.col_navio = colunas["navio"]
+        self.col_armador = colunas.get("armador")
+        self.col_rota = colunas.get("rota")
+        self.col_teus = colunas.get("conteineres")
+        self.col_data = colunas.get("data")
+
+        if validacao is None:
+            df, validacao = validar_dataset(df, colunas)
+        self.total_registros = int(validacao.limpa.sum()) if descartar_inconsistentes else len(df)
+        df_canc = preparar_cancelamentos(df, colunas["status"], self.col_data, validacao.convertidas,
+                                         validacao.limpa if descartar_inconsistentes else None)
+        if self.col_teus:
+            df_canc[self.col_teus] = df_canc[self.col_teus].fillna(0)
+        df_canc = enriquecer(df_canc, colunas)
+        if self.col_teus:
+            df_canc = df_canc.assign(CUSTO_TOTAL=custo_por_cancelamento(df_canc[self.col_teus]))
+        self.df_canc = df_canc.reset_index(drop=True)
+
+        self.indice = IndiceBitmap(self.df_canc, {
+            "Armador": self.col_armador,
+            "Serviço": colunas.get("servico"),
+            "Berço": colunas.get("berco"),
+            "País": colunas.get("pais"),
+            "Tipo": colunas.get("tipo"),
+            "Mês": "Y-M" if self.col_data else None,
+        })
+        self.rotas = {
+            "/saude": self.saude,
+            "/navios/top": self.top_navios,
+            "/mensal": self.serie_mensal,
+            "/custos/armador": self.custos_por_armador,
+            "/rotas": self.contagem_rotas,
+        }
+
+    @classmethod
+    def de_arquivo(cls, caminho: str, descartar_inconsistentes: bool = True) -> "ServicoAnalitico":
+        # Mesmo dataset validado do dashboard: o artefato do armazém é compartilhado com ele
+        return cls(*dataset_validado(caminho, CAMPOS_APP).valor, descartar_inconsistentes)
+
+    @classmethod
+    def de_particoes(cls, destino: str = DIR_PARTICOES,
+                     descartar_inconsistentes: bool = True) -> "ServicoAnalitico":
+        return cls(*aplicar_mapeamento(ler_particoes(destino), CAMPOS_APP),
+                   descartar_inconsistentes=descartar_inconsistentes)
+
+    # ------------------------------------------------------------------
+    # Filtros e parâmetros
+    # ------------------------------------------------------------------
+    def _filtrar(self, parametros: dict) -> pd.DataFrame:
+        selecoes = {dim: parametros[p].split(",") for p, dim in FILTROS.items() if parametros.get(p)}
+        inicio, fim = parametros.get("inicio"), parametros.get("fim")
+        if (inicio or fim) and not self.col_data:
+            raise ParametroInvalido("O dataset não tem a coluna de ETA; 'inicio'/'fim' não se aplicam.")
+        if inicio or fim:
+            meses = self.indice.valores("Mês")
+            selecoes["Mês"] = [m for m in meses if (not inicio or m >= inicio) and (not fim or m <= fim)]
+            if not selecoes["Mês"]:
+                return self.df_canc.iloc[0:0]
+        if not selecoes:
+            return self.df_canc
+        return self.df_canc.iloc[self.indice.posicoes(selecoes)]
+
+    @staticmethod
+    def _inteiro(parametros: dict, nome: str, padrao: int) -> int:
+        try:
+            return max(1, int(parametros.get(nome, padrao)))
+        except ValueError:
+            raise ParametroInvalido(f"'{nome}' deve ser um número inteiro.")
+
+    def _custos(self, parametros: dict) -> dict | None:
+        if not any(p in parametros for p in PARAMETROS_CUSTO):
+            return None
+        custos = dict(CUSTOS_PADRAO)
+        for param, chave in PARAMETROS_CUSTO.items():
+            if param in parametros:
+                try:
+                    custos[chave] = float(parametros[param])
+                except ValueError:
+                    raise ParametroInvalido(f"'{param}' deve ser numérico.")
+        return custos
+
+    # ------------------------------------------------------------------
+    # Agregados
+    # ------------------------------------------------------------------
+    def saude(self, parametros: dict) -> dict:
+        return {"total_registros": self.total_registros, "total_cancelamentos": len(self.df_canc)}
+
+    def top_navios(self, parametros: dict) -> dict:
+        df_canc = self._filtrar(parametros)
+        cnt_nav = df_canc[self.col_navio].value_counts().loc[lambda c: c > 0].head(self._inteiro(parametros, "n", 10)).reset_index()
+        cnt_nav.columns = ["Navio", "Cancelamentos"]
+        return {"total_cancelamentos": len(df_canc), "dados": cnt_nav.to_dict(orient="records")}
+
+    def serie_mensal(self, parametros: dict) -> dict:
+        if not self.col_data:
+            raise ParametroInvalido("O dataset não tem a coluna de ETA.")
+        df_canc = self._filtrar(parametros)
+        cnt_m = df_canc.groupby("Y-M").size().reset_index(name="Cancelamentos").rename(columns={"Y-M": "Mês"})
+        if "CUSTO_TOTAL" in df_canc:
+            cnt_m["Custo Total"] = df_canc.groupby("Y-M")["CUSTO_TOTAL"].sum().to_numpy()
+        return {"total_cancelamentos": len(df_canc), "dados": cnt_m.to_dict(orient="records")}
+
+    def custos_por_armador(self, parametros: dict) -> dict:
+        if not (self.col_teus and self.col_armador):
+            raise ParametroInvalido("O dataset não tem as colunas de TEUs e armador.")
+        df_canc = self._filtrar(parametros)
+        custos = self._custos(parametros)
+        if custos is not None:
+            df_canc = df_canc.assign(CUSTO_TOTAL=custo_por_cancelamento(df_canc[self.col_teus], custos))
+        cost_arm = (
+            df_canc.groupby(self.col_armador, observed=True)["CUSTO_TOTAL"]
+            .agg(["sum", "mean", "count"])
+            .sort_values("sum", ascending=False)
+            .head(self._inteiro(parametros, "n", 10))
+            .reset_index()
+        )
+        cost_arm.columns = ["Armador", "Custo Total", "Custo Médio", "Quantidade"]
+        return {
+            "total_cancelamentos": len(df_canc),
+            "custo_total": float(df_canc["CUSTO_TOTAL"].sum()),
+            "dados": cost_arm.to_dict(orient="records"),
+        }
+
+    def contagem_rotas(self, parametros: dict) -> dict:
+        if not self.col_rota:
+            raise ParametroInvalido("O dataset não tem a coluna 'De / Para'.")
+        df_canc = self._filtrar(parametros)
+        # Pares origem-destino normalizados ('BRRIO/COCTG' e 'BRRIO / COCTG' contam juntos)
+        cnt_r = MatrizOD.de_serie(df_canc[self.col_rota]).pares(self._inteiro(parametros, "n", 10))
+        cnt_r = cnt_r[["Rota", "Origem", "Destino", "Cancelamentos"]]
+        return {"total_cancelamentos": len(df_canc), "dados": cnt_r.to_dict(orient="records")}
+
+
+class ManipuladorAPI(BaseHTTPRequestHandler):
+    """Atende GET com JSON, ETag/If-None-Match e cache de respostas."""
+
+    servico: ServicoAnalitico = None
+    cache: CacheRespostas = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        consulta = parse_qs(url.query)
+        parametros = {nome: valores[-1] for nome, valores in consulta.items()}
+        chave = (url.path, tuple(sorted(parametros.items())))
+
+        item = self.cache.obter(chave)
+        if item is None:
+            rota = self.servico.rotas.get(url.path.rstrip("/") or "/saude")
+            if rota is None:
+                return self._responder_erro(404, f"Rota '{url.path}' não encontrada.")
+            try:
+                resultado = rota(parametros)
+            except ParametroInvalido as erro:
+                return self._responder_erro(400, str(erro))
+            except Exception as erro:
+                # Sem resposta o cliente veria só a conexão fechada; o traceback vai para o stderr
+                traceback.print_exc()
+                return self._responder_erro(500, f"Erro interno: {erro}")
+            corpo = json.dumps(resultado, ensure_ascii=False, default=str).encode("utf-8")
+            item = self.cache.guardar(chave, corpo)
+
+        etag, corpo = item
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _responder_erro(self, status: int, mensagem: str):
+        corpo = json.dumps({"erro": mensagem}, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        # Sem log por requisição: o volume esperado é de centenas por segundo
+        pass
+
+
+def criar_servidor(servico: ServicoAnalitico | None, porta: int = PORTA_PADRAO,
+                   host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    manipulador = type("Manipulador", (ManipuladorAPI,), {"servico": servico, "cache": CacheRespostas()})
+    return ThreadingHTTPServer((host, porta), manipulador)
+
+
+def atender(servidor: ThreadingHTTPServer, processos: int = 1, carregar=None):
+    """Atende em `processos` processos (fork após abrir o socket); o principal encerra e aguarda os filhos.
+
+    `carregar()`, se informado, monta o `ServicoAnalitico` de cada processo depois do fork.
+    """
+    # SIGTERM sai pelo mesmo caminho do Ctrl+C, fechando o socket e encerrando os filhos
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    filhos = []
+    for _ in range(processos - 1):
+        pid = os.fork()
+        if pid == 0:
+            filhos = []
+            break
+        filhos.append(pid)
+    try:
+        if carregar is not None:
+            servidor.RequestHandlerClass.servico = carregar()
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        for pid in filhos:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in filhos:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API JSON local com os agregados de cancelamentos.")
+    parser.add_argument("--arquivo", default=ARQUIVO_PADRAO, help="Planilha de programação de navios")
+    parser.add_argument("--particoes", action="store_true",
+                        help=f"Ler do dataset particionado em '{DIR_PARTICOES}' em vez da planilha")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--processos", type=int, default=1,
+                        help="Processos atendendo na mesma porta (POSIX); todos leem o mesmo dataset validado "
+                             "mapeado e têm cancelamentos e caches de resposta próprios")
+    parser.add_argument("--manter-inconsistentes", action="store_true",
+                        help="Não descartar os registros inconsistentes (o dashboard descarta por padrão)")
+    args = parser.parse_args()
+
+    descartar = not args.manter_inconsistentes
+    if args.particoes:
+        # O dataset particionado não passa pelo armazém: é validado aqui e herdado pelo fork
+        df, colunas = aplicar_mapeamento(ler_particoes(), CAMPOS_APP)
+        df, validacao = validar_dataset(df, colunas)
+    else:
+        df, colunas, validacao = dataset_validado(args.arquivo, CAMPOS_APP).valor
+    servidor = criar_servidor(None, args.porta, args.host)
+    print(f"API em http://{args.host}:{args.porta} ({len(df)} escalas no dataset validado, "
+          f"{args.processos} processo(s))")
+    atender(servidor, args.processos, lambda: ServicoAnalitico(df, colunas, validacao, descartar))
@@ -12,16 +12,48 @@ Analisar planilhas Excel de portos sobre navios cancelados, gerando
 gráficos interativos e métricas detalhadas.
 """
 
+import time
+
+# Início da execução do script, para medir o tempo até a primeira pintura
+INICIO_SCRIPT = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
 import os
 
+from importacao_tardia import importar_tardio
+from dados_navios import custo_por_cancelamento, mascara_cancelamento, para_datas, preparar_cancelamentos
+from processamento_lotes import ler_cabecalho, processar_em_lotes, recontar_exato
+from particionamento import SEM_DATA, escrever_particoes, ler_particoes, listar_particoes
+from indice_bitmap import IndiceBitmap
+from sketches import CuboDistintos, ResumoTopK
+from comparacao_snapshots import comparar_snapshots
+from mapeamento_colunas import CAMPOS, CAMPOS_APP, aplicar_mapeamento, resolver_mapeamento
+from validacao import validar, validar_dataset
+from exportacao import FORMATOS, IDADE_MAXIMA_EXPORTACAO_S, exportar_em_segundo_plano, nome_arquivo
+from memoria import RelatorioMemoria, rss_atual, rss_pico
+from cache_dados import estatisticas as estatisticas_cache_dados, hash_conteudo, obter_compartilhado
+from artefatos import amostra, armazem_padrao, cubo_por_particao, dataset, dataset_validado, particoes_alteradas
+from enriquecimento import TABELAS, VERSAO_TABELAS, cobertura, enriquecer, remapear
+from rotas import MatrizOD, codificar_rotas
+from snapshot_padrao import ARQUIVO_PADRAO, carregar_snapshot, registrar_primeira_pintura
+from ingestao import carregar_manifesto, registro_mais_recente
+from risco_cancelamento import ModeloRisco, data_referencia, riscos_programados
+from antecedencia import calcular_antecedencias, comparar_situacoes, cubo_antecedencias
+from amostragem import AmostraEstratificada, CalculoEmSegundoPlano, Estimativa
+
+# Intervalo (s) entre as consultas ao manifesto da pasta monitorada
+INTERVALO_ATUALIZACAO_S = 5
+# Intervalo (s) entre as verificações do cálculo exato, no modo prévia
+INTERVALO_PREVIA_S = 1
+# Etapa exata de cancelamentos que encerra a prévia, conforme o descarte de inconsistentes
+ETAPAS_CANCELAMENTOS = {True: "Cancelamentos (sem inconsistentes)", False: "Cancelamentos (todos)"}
+
+# Plotly só é carregado quando o primeiro gráfico é montado
+px = importar_tardio("plotly.express")
+go = importar_tardio("plotly.graph_objects")
+
 # Formatação de moeda BRL
 def br_currency(x: float) -> str:
     return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
@@ -34,6 +66,108 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Índice bitmap dos filtros, construído uma vez por fonte de dados
+@st.cache_resource(max_entries=4)
+def construir_indice(chave_fonte, _df_canc, dimensoes):
+    return IndiceBitmap(_df_canc, dimensoes)
+
+# Sketches Top-K por dimensão, mantidos na ingestão de cada fonte de dados
+@st.cache_resource(max_entries=4)
+def construir_resumos(chave_fonte, _df_canc, colunas):
+    resumos = {}
+    for coluna in colunas:
+        resumos[coluna] = ResumoTopK()
+        resumos[coluna].atualizar(_df_canc[coluna])
+    return resumos
+
+# Cubo mês x armador com HyperLogLog de navios, viagens e rotas distintas, montado mês
+# a mês no armazém de artefatos: numa exportação nova só os meses alterados são recalculados
+@st.cache_resource(max_entries=4)
+def construir_cubo(chave_fonte, _df_canc, dimensoes, medidas, particao):
+    return cubo_por_particao(_df_canc, particao, dimensoes, dict(medidas))
+
+# Rotas 'De / Para' codificadas em IDs de porto e matriz origem-destino completa da fonte
+@st.cache_resource(max_entries=4)
+def construir_rotas(chave_fonte, _df_canc, col_rota, col_conteineres):
+    origem, destino, portos = codificar_rotas(_df_canc[col_rota])
+    teus = _df_canc[col_conteineres].to_numpy() if col_conteineres else None
+    return (origem, destino, portos), MatrizOD(origem, destino, portos, teus)
+
+# Validação e perfil de qualidade, calculados uma vez por fonte de dados: das planilhas,
+# o dataset validado vem do armazém de artefatos (Arrow mapeado, datas já convertidas e
+# máscara gravada), compartilhado com a API e o relatório; das demais fontes, validado aqui
+@st.cache_resource(max_entries=4)
+def validar_fonte(chave_fonte, _df, colunas, _origem=None):
+    if _origem is not None:
+        df, _, validacao = dataset_validado(_origem, CAMPOS_APP).valor
+        return df, validacao
+    return validar_dataset(_df, dict(colunas))
+
+# Cancelamentos da fonte, com descarte opcional das linhas inconsistentes e
+# Armador/País/Serviço remapeados pelas tabelas de enriquecimento
+@st.cache_resource(max_entries=4)
+def preparar_cancelamentos_fonte(chave_fonte, _df, _validacao, colunas, versao_tabelas):
+    colunas = dict(colunas)
+    descartar = chave_fonte[-1]
+    df_canc = preparar_cancelamentos(_df, colunas["status"], colunas.get("data"), _validacao.convertidas,
+                                     _validacao.limpa if descartar else None)
+    if colunas.get("conteineres"):
+        df_canc[colunas["conteineres"]] = df_canc[colunas["conteineres"]].fillna(0)
+    return enriquecer(df_canc, colunas)
+
+# Modelo de risco de cancelamento, treinado uma vez por fonte nas escalas encerradas
+# (com o descarte de inconsistentes, se marcado), e a pontuação das programadas
+@st.cache_resource(max_entries=2)
+def treinar_modelo_risco(chave_fonte, _df, _validacao, colunas):
+    df_modelo = _df.loc[_validacao.limpa] if chave_fonte[-1] else _df
+    return ModeloRisco.treinar(df_modelo, dict(colunas), convertidas=_validacao.convertidas)
+
+@st.cache_resource(max_entries=8)
+def pontuar_programadas(chave_fonte, _modelo, _df, _validacao, colunas, custos, horizonte_dias):
+    df_modelo = _df.loc[_validacao.limpa] if chave_fonte[-1] else _df
+    return riscos_programados(_modelo, df_modelo, dict(colunas), dict(custos), horizonte_dias,
+                              convertidas=_validacao.convertidas)
+
+# Antecedências de todas as escalas: comparação exata canceladas x concluídas e o
+# cubo de sketches KLL (armador x mês x situação) para os quantis de qualquer fatia
+@st.cache_resource(max_entries=4)
+def construir_antecedencias(chave_fonte, _df, _validacao, colunas):
+    df_base = _df.loc[_validacao.limpa] if chave_fonte[-1] else _df
+    antecedencias = calcular_antecedencias(df_base, dict(colunas), _validacao.convertidas)
+    return comparar_situacoes(antecedencias), cubo_antecedencias(antecedencias)
+
+# Amostra estratificada (mês x armador) da prévia: das planilhas vem do armazém de
+# artefatos (o ingestao.py já a sorteia na conversão); das demais fontes, é sorteada aqui
+@st.cache_resource(max_entries=4)
+def amostrar_fonte(chave_fonte, _df, colunas, _origem):
+    if _origem is not None:
+        return amostra(dataset(_origem, CAMPOS_APP)).valor
+    return AmostraEstratificada.sortear(_df, dict(colunas))
+
+# Etapas exatas da prévia, disparadas uma vez por fonte numa thread: preenchem os mesmos
+# caches do caminho normal, que depois encontra a validação e os cancelamentos prontos
+@st.cache_resource(max_entries=4)
+def iniciar_calculo_exato(chave_fonte, _df, colunas, _origem):
+    def cancelamentos(descartar):
+        df, validacao = validar_fonte(chave_fonte, _df, colunas, _origem)
+        return preparar_cancelamentos_fonte((*chave_fonte, descartar), df, validacao, colunas, VERSAO_TABELAS)
+    return CalculoEmSegundoPlano({
+        "Validação": lambda: validar_fonte(chave_fonte, _df, colunas, _origem),
+        **{etapa: lambda descartar=descartar: cancelamentos(descartar)
+           for descartar, etapa in ETAPAS_CANCELAMENTOS.items()},
+    })
+
+# Comparação com um snapshot anterior da programação, feita uma vez por par de arquivos
+@st.cache_resource(max_entries=2)
+def comparar_com_anterior(chave_fonte, chave_anterior, _df_atual, _arquivo_anterior):
+    anterior, _ = dataset(_arquivo_anterior, CAMPOS_APP).valor
+    return comparar_snapshots(anterior, _df_atual)
+
+# Snapshot binário do arquivo padrão (gerado por snapshot_padrao.py), lido uma vez por versão da planilha
+@st.cache_resource(max_entries=1)
+def carregar_snapshot_padrao(hash_padrao):
+    return carregar_snapshot(ARQUIVO_PADRAO)
+
 # Função para ajustar layout dos gráficos
 def ajustar_layout_grafico(fig, altura=500):
     fig.update_layout(
@@ -47,6 +181,161 @@ def ajustar_layout_grafico(fig, altura=500):
     )
     return fig
 
+# Atualização automática: só este fragmento roda no timer e apenas lê o manifesto da
+# pasta monitorada; o app inteiro é reexecutado quando chega uma exportação nova
+@st.fragment(run_every=INTERVALO_ATUALIZACAO_S)
+def acompanhar_manifesto(hash_exibido):
+    recente = registro_mais_recente(carregar_manifesto())
+    if recente is not None and recente["hash"] != hash_exibido:
+        st.rerun(scope="app")
+    st.caption(f"🔄 Verificado às {time.strftime('%H:%M:%S')} (a cada {INTERVALO_ATUALIZACAO_S} s)")
+
+# Prévia: verifica o cálculo exato e reexecuta o app a cada etapa concluída,
+# para que os números exatos substituam as estimativas assim que ficam prontos
+@st.fragment(run_every=INTERVALO_PREVIA_S)
+def acompanhar_calculo(calculo, prontas_exibidas):
+    if calculo.prontas != prontas_exibidas:
+        st.rerun(scope="app")
+    st.caption("Cálculo exato em segundo plano: " + " · ".join(
+        f"{'✅' if calculo.pronta(etapa) else '⏳'} {etapa}" for etapa in calculo.futuros))
+
+# Barras horizontais de totais estimados, com o intervalo de 95%
+def barras_estimadas(tabela, nome, titulo, escala="Viridis", n=10):
+    fig = px.bar(tabela.head(n), x="Estimativa", y=nome, orientation="h", error_x="Erro",
+                 color="Estimativa", color_continuous_scale=escala, title=titulo)
+    fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+    st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
+
+# Todas as abas a partir da amostra estratificada: totais estimados com intervalo de 95%
+# (marcados com ≈) e, das etapas exatas já concluídas, os números exatos
+def pintar_previa(amostra_fonte, df_amostra, colunas, descartar, calculo, total_exato):
+    col_data, col_conteineres = colunas.get("data"), colunas.get("conteineres")
+    validacao_amostra = validar(df_amostra, colunas)
+    limpas = validacao_amostra.limpa if descartar else np.ones(len(df_amostra), dtype=bool)
+    canceladas = mascara_cancelamento(df_amostra[colunas["status"]]).to_numpy() & limpas
+    teus = (pd.to_numeric(df_amostra[col_conteineres], errors="coerce").fillna(0)
+            if col_conteineres else None)
+
+    total = amostra_fonte.estimar(mascara=limpas)
+    canc = amostra_fonte.estimar(mascara=canceladas)
+    st.info(f"🔬 Prévia por amostragem: {amostra_fonte.n:,} de {amostra_fonte.total_linhas:,} escalas, "
+            "estratificadas por mês x armador. Valores com ≈ são estimativas (intervalo de 95%); "
+            "os exatos entram assim que o cálculo em segundo plano termina.")
+    acompanhar_calculo(calculo, calculo.prontas)
+
+    tabs = st.tabs(["📈 Visão Geral", "🚢 Navios", "📅 Temporal", "🌍 Rotas", "🔄 Serviços",
+                    "📊 Dist & Correl", "💰 Custos", "🎯 Risco", "🔁 Comparar Snapshots", "⬇️ Exportar"])
+    with tabs[0]:
+        st.subheader("Visão Geral dos Cancelamentos")
+        col1, col2, col3, col4 = st.columns(4)
+        if total_exato is not None:
+            col1.metric("Total de Registros", f"{total_exato:,}", "exato", delta_color="off")
+            total = Estimativa(total_exato, 0.0)
+        else:
+            col1.metric("Total de Registros", total.texto())
+        col2.metric("Total Cancelado", canc.texto(), f"≈ {canc.valor / total.valor * 100:.1f}%")
+        if teus is not None:
+            col3.metric("TEUs Afetados", amostra_fonte.estimar(teus, canceladas).texto())
+        if col_data:
+            datas = validacao_amostra.convertidas.get(col_data, para_datas(df_amostra[col_data]))[canceladas]
+            if datas.notna().any():
+                col4.metric("Período", f"{datas.min().strftime('%b %Y')} → {datas.max().strftime('%b %Y')}",
+                            "na amostra", delta_color="off")
+        fig = px.pie(names=["Cancelados", "Não Cancelados"], values=[canc.valor, total.valor - canc.valor],
+                     color_discrete_sequence=px.colors.qualitative.Set3, title="Distribuição de Cancelamentos (≈)")
+        st.plotly_chart(ajustar_layout_grafico(fig, 300), use_container_width=True)
+
+    with tabs[1]:
+        st.subheader(" Navios Cancelados (≈)")
+        barras_estimadas(amostra_fonte.estimar_grupos(df_amostra[colunas["navio"]], mascara=canceladas,
+                                                      nome="Navio"), "Navio", "Top 10 Navios (estimativa)")
+    with tabs[2]:
+        st.subheader("Evolução Mensal de Cancelamentos (≈)")
+        if col_data:
+            meses = validacao_amostra.convertidas.get(col_data, para_datas(df_amostra[col_data])).dt.strftime("%Y-%m")
+            mensal = (amostra_fonte.estimar_grupos(meses, mascara=canceladas & meses.notna().to_numpy(),
+                                                   nome="Y-M")
+                      .sort_values("Y-M"))
+            fig = px.line(mensal, x="Y-M", y="Estimativa", error_y="Erro", markers=True)
+            fig.update_layout(xaxis_title="Mês", yaxis_title="Cancelamentos (≈)")
+            st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
+        else:
+            st.info("Coluna de data não encontrada.")
+    with tabs[3]:
+        st.subheader("Top 10 Rotas Canceladas (≈)")
+        if colunas.get("rota"):
+            barras_estimadas(amostra_fonte.estimar_grupos(df_amostra[colunas["rota"]], mascara=canceladas,
+                                                          nome="Rota"), "Rota", "Rotas (estimativa)", "Inferno")
+        else:
+            st.info("Coluna de rota não encontrada.")
+    with tabs[4]:
+        st.subheader("Top 10 Serviços Cancelados (≈)")
+        if colunas.get("servico"):
+            barras_estimadas(amostra_fonte.estimar_grupos(df_amostra[colunas["servico"]], mascara=canceladas,
+                                                          nome="Serviço"), "Serviço", "Serviços (estimativa)")
+        else:
+            st.info("Coluna de serviço não encontrada.")
+    with tabs[5]:
+        st.subheader("Distribuição de TEUs (≈)")
+        if teus is not None:
+            # Cada escala sorteada pesa N_h / n_h escalas do seu estrato
+            pesos = (amostra_fonte.tamanhos / amostra_fonte.sorteados)[amostra_fonte.codigos]
+            fig = px.histogram(x=teus[canceladas], y=pesos[canceladas], histfunc="sum", nbins=30,
+                               labels={"x": "TEUs", "y": "Cancelamentos (≈)"})
+            st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
+        else:
+            st.info("Coluna de TEUs não encontrada.")
+    with tabs[6]:
+        st.subheader("Análise de Custos (≈)")
+        if teus is not None:
+            custos = custo_por_cancelamento(teus, C)
+            custo_total = amostra_fonte.estimar(custos, canceladas)
+            st.metric("Custo Total", f"≈ {br_currency(custo_total.valor)} ± {br_currency(custo_total.erro)}")
+            if colunas.get("armador"):
+                armadores = remapear(df_amostra[colunas["armador"]], TABELAS["armador"])[0]
+                barras_estimadas(amostra_fonte.estimar_grupos(armadores, custos, canceladas, nome="Armador"),
+                                 "Armador", "Prejuízo por Armador (estimativa, R$)")
+        else:
+            st.info("Não há dados de custos (coluna de TEUs ausente).")
+    for aba in tabs[7:]:
+        with aba:
+            st.info("Disponível assim que o cálculo exato terminar.")
+
+# Cartões e pizza da aba Visão Geral (também usados na prévia vinda do snapshot)
+def pintar_visao_geral(total, canc, teus, periodo, chave="visao_geral"):
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.metric("Total de Registros", f"{total:,}")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.metric("Total Cancelado", f"{canc:,}", f"{canc/total*100:.1f}%")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with col3:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        if teus is not None:
+            st.metric("TEUs Afetados", f"{teus:,}")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with col4:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        if periodo:
+            st.metric("Período", f"{periodo[0].strftime('%b %Y')} → {periodo[1].strftime('%b %Y')}")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Gráfico de pizza
+    fig = px.pie(
+        names=["Cancelados","Não Cancelados"],
+        values=[canc, total-canc],
+        color_discrete_sequence=px.colors.qualitative.Set3,
+        title="Distribuição de Cancelamentos"
+    )
+    st.plotly_chart(ajustar_layout_grafico(fig, 300), use_container_width=True, key=chave)
+
 # CSS customizado
 st.markdown("""
 <style>
@@ -101,11 +390,24 @@ st.markdown("""
 with st.sidebar:
     st.header("📂 Upload & Custos")
     
+    # Pasta monitorada pelo ingestao.py: a exportação mais recente, já convertida em segundo plano
+    recente = registro_mais_recente(carregar_manifesto())
+    usar_monitorada = recente is not None and st.checkbox(
+        "Exportação mais recente da pasta monitorada", value=False,
+        help="Arquivos convertidos pelo ingestao.py assim que chegam à pasta compartilhada."
+    )
+
     # Opção para usar arquivo padrão ou upload
-    use_default = st.checkbox("Usar arquivo padrão", value=True)
+    use_default = not usar_monitorada and st.checkbox("Usar arquivo padrão", value=True)
     
-    if use_default:
-        default_file = "ProgramacaoDeNavios (1) (1).xlsx"
+    if usar_monitorada:
+        arquivo_monitorado = recente["caminho"]
+        uploaded_file = open(arquivo_monitorado, 'rb') if os.path.exists(arquivo_monitorado) else None
+        st.caption(f"📥 {recente['arquivo']} · convertido em {recente['convertido_em'].replace('T', ' ')}")
+        if st.toggle("Atualização automática", value=True):
+            acompanhar_manifesto(recente["hash"])
+    elif use_default:
+        default_file = ARQUIVO_PADRAO
         if os.path.exists(default_file):
             uploaded_file = open(default_file, 'rb')
         else:
@@ -113,6 +415,64 @@ with st.sidebar:
             uploaded_file = None
     else:
         uploaded_file = st.file_uploader("Carregue um arquivo Excel (.xlsx)", type="xlsx")
+
+    # Modo em lotes: percorre a planilha por blocos e mantém só os agregados
+    modo_lotes = st.checkbox(
+        "Modo em lotes (baixa memória)", value=False,
+        help="Para planilhas maiores que a memória disponível: os dados são lidos em blocos "
+             "e apenas os agregados ficam em memória."
+    )
+    recontagem_exata = st.checkbox(
+        "Recontagem exata (Top-K)", value=False,
+        help="Os rankings Top 10 vêm de sketches mantidos na ingestão; marque para recontar "
+             "exatamente sobre todas as linhas."
+    )
+    modo_previa = st.checkbox(
+        "Prévia por amostragem", value=False,
+        help="Para bases consolidadas muito grandes: as abas aparecem primeiro a partir de uma "
+             "amostra estratificada (mês x armador), com intervalos de confiança, e os números "
+             "exatos entram assim que o cálculo em segundo plano termina."
+    )
+
+    # Dataset particionado (ano=/mes=/terminal=): a poda acontece antes da leitura
+    st.markdown("---")
+    st.markdown("### 🗂️ Dataset Particionado")
+    if uploaded_file:
+        terminal_ingestao = st.text_input("Terminal da planilha", value="padrao")
+        if st.button("Gravar planilha no dataset particionado"):
+            with st.spinner("Gravando partições..."):
+                linhas = escrever_particoes(uploaded_file, terminal=terminal_ingestao)
+                uploaded_file.seek(0)
+            st.success(f"{linhas:,} linhas gravadas.")
+
+    particoes = listar_particoes()
+    usar_particoes = False
+    if not particoes.empty:
+        usar_particoes = st.checkbox("Ler do dataset particionado", value=False)
+    if usar_particoes:
+        datadas = particoes[particoes["ano"] != SEM_DATA]
+        meses = pd.to_datetime(datadas["ano"] + "-" + datadas["mes"], format="%Y-%m")
+        data_min = meses.min().date()
+        data_max = (meses.max() + pd.offsets.MonthEnd(0)).date()
+
+        janela = st.selectbox(
+            "Período (ETA)",
+            ["Todo o período", "Últimos 3 meses", "Últimos 12 meses", "Personalizado"]
+        )
+        if janela == "Últimos 3 meses":
+            periodo = ((pd.Timestamp(data_max) - pd.DateOffset(months=3) + pd.Timedelta(days=1)).date(), data_max)
+        elif janela == "Últimos 12 meses":
+            periodo = ((pd.Timestamp(data_max) - pd.DateOffset(months=12) + pd.Timedelta(days=1)).date(), data_max)
+        elif janela == "Personalizado":
+            periodo = st.date_input("Intervalo", value=(data_min, data_max),
+                                    min_value=data_min, max_value=data_max)
+        else:
+            periodo = (None, None)
+        if len(periodo) != 2:
+            periodo = (periodo[0], data_max)
+
+        terminais_disp = sorted(particoes["terminal"].unique())
+        terminais_sel = st.multiselect("Terminais", terminais_disp, default=terminais_disp)
     
     st.markdown("---")
     st.markdown("### 💰 Custos de Referência (2024-25)")
@@ -125,62 +485,353 @@ with st.sidebar:
     arm_days = st.number_input("Dias de Armazenagem", value=2, min_value=1, max_value=30)
     insp = st.number_input("Inspeção (R$/contêiner)", value=95.0, step=5.0)
 
-if not uploaded_file:
+# Snapshot do arquivo padrão: evita ler o .xlsx e permite pintar a Visão Geral antes do resto
+snapshot = None
+if use_default and uploaded_file and not modo_lotes and not usar_particoes:
+    snapshot = carregar_snapshot_padrao(hash_conteudo(default_file))
+
+# Primeira execução da sessão: a Visão Geral do snapshot aparece enquanto os índices
+# e caches são montados, e o tempo até essa primeira pintura é registrado
+primeira_execucao = "primeira_pintura_ms" not in st.session_state
+previa = st.empty()
+if primeira_execucao and snapshot is not None:
+    with previa.container():
+        st.subheader("Visão Geral dos Cancelamentos")
+        resumo = snapshot["visao_geral"][True]
+        pintar_visao_geral(resumo["total"], resumo["cancelados"], resumo["teus"], resumo["periodo"],
+                           chave="previa_visao_geral")
+    st.session_state["primeira_pintura_ms"] = (time.perf_counter() - INICIO_SCRIPT) * 1000
+    registrar_primeira_pintura(st.session_state["primeira_pintura_ms"], "snapshot")
+
+if not uploaded_file and not usar_particoes:
     st.warning("Por favor, carregue um arquivo Excel ou selecione o arquivo padrão para iniciar a análise.")
     st.stop()
 
-# Leitura e pré-processamento
-df = pd.read_excel(uploaded_file)
-df.columns = df.columns.str.strip()
+# Calcular custos por cancelamento
+C = {
+    "THC": thc,
+    "OPER": oper,
+    "DOC": doc,
+    "ARM_DAY": arm_day,
+    "ARM_DAYS": arm_days,
+    "INSP": insp
+}
+
+if modo_lotes and uploaded_file:
+    # Mapeamento a partir do cabeçalho, sem carregar a planilha; as chaves são os nomes canônicos
+    campos_cabecalho = resolver_mapeamento(ler_cabecalho(uploaded_file))
+    mapa = {CAMPOS[campo][0]: campos_cabecalho.get(campo) for campo in [
+        "navio", "viagem", "status", "data", "rota", "servico", "armador", "conteineres"
+    ]}
+    if not mapa['Navio / Viagem1'] or not mapa['Situação']:
+        st.error("As colunas obrigatórias 'Navio / Viagem1' e 'Situação' não foram encontradas.")
+        st.stop()
+
+    with st.spinner("Processando a planilha em lotes..."):
+        ag = processar_em_lotes(
+            uploaded_file,
+            col_status=mapa['Situação'],
+            col_data=mapa['Estimativa Chegada ETA'],
+            col_teus=mapa['Movs'],
+            col_armador=mapa['Armador'],
+            dimensoes=[mapa['Navio / Viagem1'], mapa['De / Para'], mapa['Serviço']],
+            custos=C,
+            medidas_distintas={
+                "Navios distintos": mapa['Navio / Viagem1'],
+                "Viagens distintas": mapa['Navio / Viagem'],
+                "Rotas distintas": mapa['De / Para'],
+            }
+        )
+
+    def top_lotes(coluna, nome):
+        if recontagem_exata:
+            uploaded_file.seek(0)
+            top = recontar_exato(uploaded_file, mapa['Situação'], coluna)
+        else:
+            top = ag.top(coluna)
+        return top.rename(columns={coluna: nome})
+
+    st.info("Modo em lotes ativo: os gráficos são montados a partir de agregados parciais mesclados.")
+    total, canc = ag.total_registros, ag.total_cancelados
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total de Registros", f"{total:,}")
+    col2.metric("Total Cancelado", f"{canc:,}", f"{canc/total*100:.1f}%" if total else None)
+    if mapa['Movs']:
+        col3.metric("TEUs Afetados", f"{int(ag.soma_teus):,}")
+    if ag.data_min is not None:
+        col4.metric("Período", f"{ag.data_min.strftime('%b %Y')} → {ag.data_max.strftime('%b %Y')}")
+
+    tabs = st.tabs(["🚢 Navios", "📅 Temporal", "🌍 Rotas", "🔄 Serviços", "📊 TEUs", "💰 Custos"])
+    with tabs[0]:
+        cnt_nav = top_lotes(mapa['Navio / Viagem1'], "Navio")
+        fig = px.bar(cnt_nav, x="Cancelamentos", y="Navio", orientation="h",
+                     color="Cancelamentos", color_continuous_scale="Viridis")
+        fig.update_layout(yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
+        st.dataframe(cnt_nav, use_container_width=True)
+    with tabs[1]:
+        if mapa['Estimativa Chegada ETA']:
+            cnt_m = ag.serie_mensal()
+            fig = px.line(cnt_m, x="Y-M", y="Cancelamentos", markers=True)
+            fig.update_layout(xaxis_title="Mês", yaxis_title="Cancelamentos")
+            st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
+            st.dataframe(ag.cubo.agregar(["Y-M"]).rename(columns={"Y-M":"Mês"}), use_container_width=True)
+            st.caption("Distintos estimados por HyperLogLog (erro padrão ~2,3%).")
+        else:
+            st.info("Coluna de data não encontrada.")
+    with tabs[2]:
+        if mapa['De / Para']:
+            cnt_r = top_lotes(mapa['De / Para'], "Rota")
+            fig = px.bar(cnt_r, x="Cancelamentos", y="Rota", orientation="h",
+                         color="Cancelamentos", color_continuous_scale="Inferno")
+            fig.update_layout(yaxis={'categoryorder':'total ascending'})
+            st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
+            st.dataframe(cnt_r, use_container_width=True)
+        else:
+            st.info("Coluna de rota não encontrada.")
+    with tabs[3]:
+        if mapa['Serviço']:
+            cnt_s = top_lotes(mapa['Serviço'], "Serviço")
+            fig = px.pie(cnt_s, names="Serviço", values="Cancelamentos", color_discrete_sequence=px.colors.qualitative.Set3)
+            st.plotly_chart(ajustar_layout_grafico(fig, 350), use_container_width=True)
+            st.dataframe(cnt_s, use_container_width=True)
+        else:
+            st.info("Coluna de serviço não encontrada.")
+    with tabs[4]:
+        if mapa['Movs']:
+            hist = ag.histograma()
+            hist["Faixa"] = hist["Início"].astype(str) + "–" + hist["Fim"].astype(str)
+            fig = px.bar(hist, x="Faixa", y="Frequência", title="Histograma de TEUs")
+            st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
+        else:
+            st.info("Coluna de TEUs não encontrada.")
+    with tabs[5]:
+        if mapa['Movs']:
+            colA, colB = st.columns(2)
+            colA.metric("Custo Total", br_currency(ag.soma_custo))
+            colB.metric("Custo Médio", br_currency(ag.custo_medio))
+            if mapa['Armador']:
+                cost_arm = ag.custos_por_armador()
+                cost_arm["Prejuízo BRL"] = cost_arm["Prejuízo"].apply(br_currency)
+                dist_arm = ag.cubo.agregar([mapa['Armador']]).drop(columns="Cancelamentos")
+                cost_arm = cost_arm.merge(dist_arm.rename(columns={mapa['Armador']: "Armador"}), on="Armador", how="left")
+                st.dataframe(cost_arm.drop(columns="Prejuízo"), use_container_width=True)
+                fig2 = px.bar(cost_arm, x="Armador", y="Prejuízo", color="Prejuízo",
+                              color_continuous_scale="Viridis", title="Prejuízo por Armador")
+                st.plotly_chart(ajustar_layout_grafico(fig2), use_container_width=True)
+        else:
+            st.info("Não há dados de custos (coluna de TEUs ausente).")
+    st.stop()
+
+# Chave da fonte: hash do conteúdo da planilha (a mesma para todas as sessões que
+# abrem o mesmo arquivo) ou, no dataset particionado, a seleção e o estado das partições
+if usar_particoes:
+    chave_fonte = ("particoes", str(periodo), tuple(terminais_sel),
+                   tuple((c, os.stat(c).st_mtime_ns) for c in particoes["caminho"]))
+else:
+    origem = default_file if use_default else arquivo_monitorado if usar_monitorada else uploaded_file
+    chave_fonte = ("conteudo", hash_conteudo(origem))
+
+# Leitura e pré-processamento: cabeçalhos resolvidos pelo mapeamento e renomeados
+# para os nomes canônicos; colunas sem uso não são lidas. A leitura fica no cache
+# compartilhado entre sessões (e, para planilhas, no armazém de artefatos em disco) e é
+# somente leitura: as etapas seguintes trabalham com vistas
+if usar_particoes:
+    df, colunas = obter_compartilhado(chave_fonte, lambda: aplicar_mapeamento(
+        ler_particoes(inicio=periodo[0], fim=periodo[1], terminais=terminais_sel), CAMPOS_APP))
+elif snapshot is not None:
+    df, colunas = obter_compartilhado(("snapshot", *chave_fonte), lambda: (snapshot["df"], snapshot["colunas"]))
+else:
+    df, colunas = dataset(origem, CAMPOS_APP).valor
+# Planilhas passam pelo armazém de artefatos também na validação e na amostra da prévia
+origem_artefatos = origem if snapshot is None and not usar_particoes else None
+if df.empty:
+    st.warning("Nenhuma partição corresponde ao período e aos terminais selecionados."
+               if usar_particoes else "A planilha não tem linhas.")
+    st.stop()
+memoria = RelatorioMemoria()
+memoria.registrar("Leitura", df)
 
 # Mapeamento de colunas essenciais
-col_navio       = 'Navio / Viagem1'         if 'Navio / Viagem1'         in df.columns else None
-col_status      = 'Situação'               if 'Situação'               in df.columns else None
-col_data        = 'Estimativa Chegada ETA' if 'Estimativa Chegada ETA' in df.columns else None
-col_etd         = 'Estimativa Saída ETD'   if 'Estimativa Saída ETD'   in df.columns else None
-col_rota        = 'De / Para'              if 'De / Para'              in df.columns else None
-col_servico     = 'Serviço'                if 'Serviço'                in df.columns else None
-col_armador     = 'Armador'                if 'Armador'                in df.columns else None
-col_conteineres = 'Movs'                   if 'Movs'                   in df.columns else None
+col_navio       = colunas.get("navio")
+col_status      = colunas.get("status")
+col_data        = colunas.get("data")
+col_etd         = colunas.get("etd")
+col_rota        = colunas.get("rota")
+col_servico     = colunas.get("servico")
+col_armador     = colunas.get("armador")
+col_conteineres = colunas.get("conteineres")
+col_berco       = colunas.get("berco")
+col_pais        = colunas.get("pais")
+col_tipo        = colunas.get("tipo")
+col_viagem      = colunas.get("viagem")
 
 if not col_navio or not col_status:
     st.error("As colunas obrigatórias 'Navio / Viagem1' e 'Situação' não foram encontradas.")
     st.stop()
 
-# Filtrar apenas cancelamentos
-df[col_status] = df[col_status].astype(str).str.strip().str.lower()
-mask_cancel = df[col_status].isin(['cancelado','cancelada','rejeitado','rej.','canceled'])
-df_canc = df.loc[mask_cancel].copy()
+with st.sidebar:
+    st.markdown("---")
+    st.markdown("### 🧪 Qualidade dos Dados")
+    descartar_inconsistentes = st.checkbox(
+        "Descartar registros inconsistentes", value=True,
+        help="Remove linhas com ETA ausente ou fora da janela dos dados, datas da escala muito "
+             "distantes da ETA, durações negativas/implausíveis ou Movs não numérico."
+    )
+    qualidade = st.container()
 
-# Converter datas e extrair período mês-ano
-if col_data:
-    df_canc[col_data] = pd.to_datetime(df_canc[col_data], dayfirst=True, errors='coerce')
-    df_canc.dropna(subset=[col_data], inplace=True)
-    df_canc['Y-M'] = df_canc[col_data].dt.to_period('M').astype(str)
+# Prévia por amostragem: enquanto a validação e os cancelamentos exatos são calculados
+# em segundo plano, as abas saem da amostra estratificada e a execução para aqui
+if modo_previa:
+    calculo = iniciar_calculo_exato(chave_fonte, df, tuple(colunas.items()), origem_artefatos)
+    if not (calculo.pronta("Validação") and calculo.pronta(ETAPAS_CANCELAMENTOS[descartar_inconsistentes])):
+        amostra_fonte = amostrar_fonte(chave_fonte, df, tuple(colunas.items()), origem_artefatos)
+        total_exato = None
+        if not descartar_inconsistentes:
+            total_exato = len(df)
+        elif calculo.pronta("Validação"):
+            total_exato = int(calculo.resultado("Validação")[1].limpa.sum())
+        with previa.container():
+            pintar_previa(amostra_fonte, amostra_fonte.linhas(df), colunas, descartar_inconsistentes,
+                          calculo, total_exato)
+        st.session_state["previa_exibida"] = True
+        st.stop()
+    if st.session_state.pop("previa_exibida", False):
+        st.toast("Números exatos carregados.", icon="✅")
 
-# Converter TEUs para numérico
-if col_conteineres:
-    df_canc[col_conteineres] = pd.to_numeric(df_canc[col_conteineres], errors='coerce').fillna(0)
+# Validação na ingestão: datas e números convertidos uma única vez e máscara de
+# linhas limpas aplicada antes de todas as abas; daqui em diante `df` é o dataset
+# validado, com as colunas convertidas no lugar das brutas
+df, validacao = validar_fonte(chave_fonte, df, tuple(colunas.items()), origem_artefatos)
+memoria.registrar("Validação", df)
+with qualidade:
+    st.caption(f"{validacao.n_descartadas:,} registros inconsistentes · validação em {validacao.tempo_ms:.0f} ms")
+    with st.expander("Relatório por coluna"):
+        st.dataframe(validacao.relatorio, hide_index=True, use_container_width=True)
+# A comparação entre snapshots usa o arquivo inteiro, sem o descarte
+df_snapshot = df
 
-# Calcular custos por cancelamento
-C = {
-    "THC": thc,
-    "OPER": oper,
-    "DOC": doc,
-    "ARM_DAY": arm_day,
-    "ARM_DAYS": arm_days,
-    "INSP": insp
+# Cancelamentos já com as conversões da validação e 'Y-M', montados uma vez por
+# fonte: só as linhas canceladas são copiadas, e só uma vez
+# (a chave inclui o descarte, que muda as linhas selecionadas)
+chave_fonte = (*chave_fonte, descartar_inconsistentes)
+df_canc = preparar_cancelamentos_fonte(chave_fonte, df, validacao, tuple(colunas.items()), VERSAO_TABELAS)
+total = int(validacao.limpa.sum()) if descartar_inconsistentes else len(df)
+memoria.registrar("Cancelamentos", df_canc)
+
+# Filtros combinados resolvidos pelo índice bitmap; o resultado alimenta todas as abas
+dimensoes_filtro = {
+    "Armador": col_armador,
+    "Aliança": "Aliança" if col_armador else None,
+    "Serviço": col_servico,
+    "Rota Comercial": "Rota Comercial" if col_servico else None,
+    "Berço":   col_berco,
+    "País":    col_pais,
+    "Região":  "Região" if col_pais else None,
+    "Tipo":    col_tipo,
+    "Mês":     "Y-M" if col_data else None,
 }
+indice = construir_indice(chave_fonte, df_canc, dimensoes_filtro)
+resumos = construir_resumos(chave_fonte, df_canc, tuple(c for c in (col_navio, col_servico) if c))
+if col_rota:
+    rotas_ids, matriz_od = construir_rotas(chave_fonte, df_canc, col_rota, col_conteineres)
+
+dimensoes_cubo = tuple(d for d in ("Y-M" if col_data else None, col_armador) if d)
+medidas_cubo = tuple((nome, col) for nome, col in [
+    ("Navios distintos", col_navio), ("Viagens distintas", col_viagem), ("Rotas distintas", col_rota)
+] if col)
+cubo, assinaturas_cubo = (construir_cubo(chave_fonte, df_canc, dimensoes_cubo, medidas_cubo,
+                                          "Y-M" if col_data else None)
+                           if dimensoes_cubo else (None, {}))
+
+# Exportação nova chegando na mesma sessão (pasta monitorada): meses do cubo que mudaram
+# em relação à exportação exibida antes (os demais vieram prontos do armazém)
+exibida = st.session_state.get("exportacao_exibida")
+if (usar_monitorada and exibida and exibida["fonte"] != chave_fonte[:-1]
+        and exibida["descartar"] == descartar_inconsistentes):
+    st.session_state["atualizacao"] = {
+        "arquivo": recente["arquivo"],
+        "momento": time.strftime("%H:%M:%S"),
+        "meses": particoes_alteradas(exibida["assinaturas"], assinaturas_cubo),
+        "cancelados": len(df_canc) - exibida["cancelados"],
+    }
+st.session_state["exportacao_exibida"] = {"fonte": chave_fonte[:-1], "descartar": descartar_inconsistentes,
+                                          "assinaturas": assinaturas_cubo, "cancelados": len(df_canc)}
+
+with st.sidebar:
+    st.markdown("---")
+    st.markdown("### 🔎 Filtros")
+    selecoes = {}
+    if "Mês" in indice.dimensoes:
+        meses_disp = indice.valores("Mês")
+        mes_ini, mes_fim = st.select_slider("Mês (ETA)", options=meses_disp, value=(meses_disp[0], meses_disp[-1]))
+        selecoes["Mês"] = [m for m in meses_disp if mes_ini <= m <= mes_fim]
+    for dimensao in indice.dimensoes:
+        if dimensao != "Mês":
+            selecoes[dimensao] = st.multiselect(dimensao, indice.valores(dimensao))
 
+    inicio_filtro = time.perf_counter()
+    linhas_filtradas = indice.posicoes(selecoes)
+    tempo_filtro = (time.perf_counter() - inicio_filtro) * 1000
+    st.caption(f"{len(linhas_filtradas):,} de {indice.n_linhas:,} cancelamentos · filtro em {tempo_filtro:.2f} ms")
+    st.caption(f"🏷️ Tabelas de enriquecimento v{VERSAO_TABELAS} · cobertura: "
+               + ", ".join(f"{atributo} {fracao:.0%}" for atributo, fracao in cobertura(df_canc).items()))
+
+filtro_ativo = len(linhas_filtradas) < indice.n_linhas
+if filtro_ativo:
+    if len(linhas_filtradas) == 0:
+        st.warning("Nenhum cancelamento corresponde aos filtros selecionados.")
+        st.stop()
+    df_canc = df_canc.iloc[linhas_filtradas]
+    memoria.registrar("Filtros", df_canc)
+    # A matriz O-D filtrada sai dos IDs já codificados, sem voltar às strings
+    if col_rota:
+        matriz_od = MatrizOD(rotas_ids[0][linhas_filtradas], rotas_ids[1][linhas_filtradas], rotas_ids[2],
+                             df_canc[col_conteineres].to_numpy() if col_conteineres else None)
+
+# Custo por cancelamento derivado dos custos da sidebar: só a coluna total é
+# materializada, e apenas sobre as linhas filtradas (as demais colunas são compartilhadas)
 if col_conteineres:
-    df_canc["C_TEUS"]      = df_canc[col_conteineres] * C["THC"]
-    df_canc["C_OPER"]      = C["OPER"]
-    df_canc["C_DOC"]       = C["DOC"]
-    df_canc["C_ARM"]       = df_canc[col_conteineres] * C["ARM_DAY"] * C["ARM_DAYS"]
-    df_canc["C_INSP"]      = C["INSP"]
-    df_canc["CUSTO_TOTAL"] = df_canc[["C_TEUS","C_OPER","C_DOC","C_ARM","C_INSP"]].sum(axis=1)
-
-# Criação das abas
+    df_canc = df_canc.assign(CUSTO_TOTAL=custo_por_cancelamento(df_canc[col_conteineres], C))
+    memoria.registrar("Custos", df_canc[["CUSTO_TOTAL"]])
+
+with st.sidebar:
+    with st.expander("🧠 Memória por etapa"):
+        st.dataframe(memoria.tabela(), hide_index=True, use_container_width=True)
+        rss, pico = rss_atual(), rss_pico()
+        st.caption(f"Dados mantidos: {memoria.mb_mantidos:.1f} MB"
+                   + (f" · RSS {rss / 1e6:.0f} MB (pico {pico / 1e6:.0f} MB)" if rss and pico else ""))
+        cache = estatisticas_cache_dados()
+        st.caption(f"🗄️ Cache compartilhado: {cache['conjuntos']} conjuntos, {cache['bytes'] / 1e6:.1f} MB · "
+                   f"{cache['acertos']} acertos / {cache['falhas']} falhas / {cache['remocoes']} remoções")
+        armazem = armazem_padrao().estatisticas()
+        st.caption(f"📦 Artefatos em disco: {armazem['artefatos']}, {armazem['bytes'] / 1e6:.1f} MB · "
+                   f"{armazem['acertos']} lidos / {armazem['falhas']} calculados neste processo")
+
+# O cubo responde a filtros de mês e armador mesclando células; os demais filtros
+# pedem um cubo novo sobre as linhas filtradas
+filtros_cubo = {"Y-M": selecoes.get("Mês"), col_armador: selecoes.get("Armador")}
+if cubo is not None and any(valores for d, valores in selecoes.items() if d not in ("Mês", "Armador")):
+    cubo = CuboDistintos(list(dimensoes_cubo), dict(medidas_cubo))
+    cubo.atualizar(df_canc)
+    filtros_cubo = {}
+
+def distintos_por(dimensao):
+    """Navios, viagens e rotas distintas (HyperLogLog) agrupados por uma dimensão do cubo."""
+    filtros = {d: v for d, v in filtros_cubo.items() if d in cubo.dimensoes}
+    return cubo.agregar([dimensao], filtros).drop(columns="Cancelamentos")
+
+def top_k(coluna, nome, n=10):
+    """Top-K lido do sketch; recontagem exata quando pedida ou com filtros ativos."""
+    if recontagem_exata or filtro_ativo:
+        # Colunas enriquecidas são categóricas: categorias sem linhas após o filtro ficam de fora
+        cnt = df_canc[coluna].value_counts().loc[lambda c: c > 0].head(n).reset_index()
+        cnt.columns = [nome, "Cancelamentos"]
+        return cnt
+    return resumos[coluna].top(n, nome=nome)
+
+# Criação das abas (no lugar da prévia, se houver)
+previa.empty()
 tabs = st.tabs([
     "📈 Visão Geral",
     "🚢 Navios",
@@ -188,56 +839,41 @@ tabs = st.tabs([
     "🌍 Rotas",
     "🔄 Serviços",
     "📊 Dist & Correl",
-    "💰 Custos"
+    "💰 Custos",
+    "🎯 Risco",
+    "🔁 Comparar Snapshots",
+    "⬇️ Exportar"
 ])
 
 # Aba 1: Visão Geral
 with tabs[0]:
     st.subheader("Visão Geral dos Cancelamentos")
+    atualizacao = st.session_state.get("atualizacao") if usar_monitorada else None
+    if atualizacao:
+        meses = atualizacao["meses"]
+        st.info(f"🔄 {atualizacao['arquivo']} carregado às {atualizacao['momento']}: "
+                f"{atualizacao['cancelados']:+,} cancelamentos · {len(meses)} de {len(assinaturas_cubo)} "
+                f"meses alterados" + (f" ({', '.join(meses[:12])}{'…' if len(meses) > 12 else ''})" if meses else ""))
     
     # Métricas principais
-    total = len(df)
     canc  = len(df_canc)
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.metric("Total de Registros", f"{total:,}")
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.metric("Total Cancelado", f"{canc:,}", f"{canc/total*100:.1f}%")
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        if col_conteineres:
-            st.metric("TEUs Afetados", f"{int(df_canc[col_conteineres].sum()):,}")
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col4:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        if col_data and not df_canc.empty:
-            periodo = f"{df_canc[col_data].min().strftime('%b %Y')} → {df_canc[col_data].max().strftime('%b %Y')}"
-            st.metric("Período", periodo)
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Gráfico de pizza
-    fig = px.pie(
-        names=["Cancelados","Não Cancelados"],
-        values=[canc, total-canc],
-        color_discrete_sequence=px.colors.qualitative.Set3,
-        title="Distribuição de Cancelamentos"
+    pintar_visao_geral(
+        total, canc,
+        int(df_canc[col_conteineres].sum()) if col_conteineres else None,
+        (df_canc[col_data].min(), df_canc[col_data].max()) if col_data and not df_canc.empty else None,
     )
-    st.plotly_chart(ajustar_layout_grafico(fig, 300), use_container_width=True)
+
+if primeira_execucao and "primeira_pintura_ms" not in st.session_state:
+    st.session_state["primeira_pintura_ms"] = (time.perf_counter() - INICIO_SCRIPT) * 1000
+    registrar_primeira_pintura(st.session_state["primeira_pintura_ms"], "planilha")
+with st.sidebar:
+    st.caption(f"⏱️ Primeira pintura da sessão: {st.session_state['primeira_pintura_ms']:.0f} ms")
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Aba 2: Navios
 with tabs[1]:
     st.subheader(" Navios Cancelados")
-    cnt_nav = df_canc[col_navio].value_counts().head(10).reset_index()
-    cnt_nav.columns = ["Navio","Cancelamentos"]
+    cnt_nav = top_k(col_navio, "Navio")
     fig = px.bar(
         cnt_nav,
         x="Cancelamentos", y="Navio",
@@ -258,26 +894,59 @@ with tabs[2]:
         fig = px.line(cnt_m, x="Y-M", y="Cancelamentos", markers=True)
         fig.update_layout(xaxis_title="Mês", yaxis_title="Cancelamentos")
         st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
-        st.dataframe(cnt_m.rename(columns={"Y-M":"Mês"}), use_container_width=True)
+        tabela_m = cnt_m.assign(**{"Y-M": cnt_m["Y-M"].dt.strftime("%Y-%m")})
+        tabela_m = tabela_m.merge(distintos_por("Y-M"), on="Y-M", how="left")
+        st.dataframe(tabela_m.rename(columns={"Y-M":"Mês"}), use_container_width=True)
+        st.caption("Distintos estimados por HyperLogLog (erro padrão ~2,3%).")
     else:
         st.info("Coluna de data não encontrada.")
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Aba 4: Rotas
 with tabs[3]:
-    st.subheader("Top 10 Rotas Canceladas")
+    st.subheader("Top 10 Rotas Canceladas (Origem → Destino)")
     if col_rota:
-        cnt_r = df_canc[col_rota].value_counts().head(10).reset_index()
-        cnt_r.columns = ["Rota","Cancelamentos"]
+        medida_rota = st.radio("Medida", ["Cancelamentos", "TEUs"] if col_conteineres else ["Cancelamentos"],
+                               horizontal=True, key="medida_rota")
+        cnt_r = matriz_od.pares(10, medida_rota)
         fig = px.bar(
             cnt_r,
-            x="Cancelamentos", y="Rota",
+            x=medida_rota, y="Rota",
             orientation="h",
-            color="Cancelamentos", color_continuous_scale="Inferno"
+            color=medida_rota, color_continuous_scale="Inferno"
         )
         fig.update_layout(yaxis={'categoryorder':'total ascending'})
         st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
         st.dataframe(cnt_r, use_container_width=True)
+        st.caption(f"{matriz_od.n_portos - 1:,} portos · {matriz_od.nnz:,} pares origem-destino · "
+                   f"{matriz_od.sem_porto_informado:,} cancelamentos sem porto anterior ou próximo informado")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("**Top 10 Origens (porto anterior)**")
+            st.dataframe(matriz_od.top_origens(10, medida_rota), hide_index=True, use_container_width=True)
+        with col2:
+            st.markdown("**Top 10 Destinos (próximo porto)**")
+            st.dataframe(matriz_od.top_destinos(10, medida_rota), hide_index=True, use_container_width=True)
+
+        # Rede das rotas: portos de origem à esquerda, de destino à direita
+        st.markdown("**Rede de Rotas (30 maiores pares com os dois portos informados)**")
+        arestas = matriz_od.pares(30, medida_rota, incluir_nao_informado=False)
+        if not arestas.empty:
+            origens = list(dict.fromkeys(arestas["Origem"]))
+            destinos = list(dict.fromkeys(arestas["Destino"]))
+            fig = go.Figure(go.Sankey(
+                node=dict(label=origens + destinos, pad=12, thickness=14),
+                link=dict(
+                    source=[origens.index(o) for o in arestas["Origem"]],
+                    target=[len(origens) + destinos.index(d) for d in arestas["Destino"]],
+                    value=arestas[medida_rota],
+                ),
+            ))
+            st.plotly_chart(ajustar_layout_grafico(fig, 600), use_container_width=True)
+
+        with st.expander("Totais por porto"):
+            st.dataframe(matriz_od.por_porto(), hide_index=True, use_container_width=True)
     else:
         st.info("Coluna de rota não encontrada.")
 
@@ -286,13 +955,20 @@ with tabs[3]:
 with tabs[4]:
     st.subheader("Top 10 Serviços Cancelados")
     if col_servico:
-        cnt_s = df_canc[col_servico].value_counts().head(10).reset_index()
-        cnt_s.columns = ["Serviço","Cancelamentos"]
+        cnt_s = top_k(col_servico, "Serviço")
         top = cnt_s.iloc[0]
         st.metric("Serviço Mais Cancelado", top["Serviço"], f"{top['Cancelamentos']} vezes")
         fig = px.pie(cnt_s, names="Serviço", values="Cancelamentos", color_discrete_sequence=px.colors.qualitative.Set3)
         st.plotly_chart(ajustar_layout_grafico(fig, 350), use_container_width=True)
         st.dataframe(cnt_s, use_container_width=True)
+
+        st.subheader("Cancelamentos por Rota Comercial")
+        cnt_rc = df_canc["Rota Comercial"].value_counts().loc[lambda c: c > 0].reset_index()
+        cnt_rc.columns = ["Rota Comercial", "Cancelamentos"]
+        fig = px.bar(cnt_rc, x="Cancelamentos", y="Rota Comercial", orientation="h",
+                     color="Cancelamentos", color_continuous_scale="Teal")
+        fig.update_layout(yaxis={'categoryorder':'total ascending'})
+        st.plotly_chart(ajustar_layout_grafico(fig, 350), use_container_width=True)
     else:
         st.info("Coluna de serviço não encontrada.")
 
@@ -330,9 +1006,8 @@ with tabs[6]:
         st.plotly_chart(ajustar_layout_grafico(fig), use_container_width=True)
         if col_armador:
             st.subheader("Top 10 Armadores por Prejuízo")
-            df_canc[col_armador] = df_canc[col_armador].fillna("Não Informado")
             cost_arm = (
-                df_canc.groupby(col_armador)["CUSTO_TOTAL"]
+                df_canc.groupby(col_armador, observed=True)["CUSTO_TOTAL"]
                 .sum()
                 .sort_values(ascending=False)
                 .head(10)
@@ -340,16 +1015,246 @@ with tabs[6]:
             )
             cost_arm.columns = ["Armador","Prejuízo"]
             cost_arm["Prejuízo BRL"] = cost_arm["Prejuízo"].apply(br_currency)
-            st.dataframe(cost_arm[["Armador","Prejuízo BRL"]], use_container_width=True)
+            dist_arm = distintos_por(col_armador).rename(columns={col_armador: "Armador"})
+            cost_arm = cost_arm.merge(dist_arm, on="Armador", how="left")
+            st.dataframe(cost_arm.drop(columns="Prejuízo"), use_container_width=True)
             # Gráfico
-            cost_chart = cost_arm.copy()
-            cost_chart["Prejuízo"] = cost_chart["Prejuízo"]
             fig2 = px.bar(
-                cost_chart,
+                cost_arm,
                 x="Armador", y="Prejuízo",
                 color="Prejuízo", color_continuous_scale="Viridis",
                 title="Prejuízo por Armador"
             )
             st.plotly_chart(ajustar_layout_grafico(fig2), use_container_width=True)
+
+            st.subheader("Prejuízo por Aliança")
+            cost_ali = df_canc.groupby("Aliança", observed=True)["CUSTO_TOTAL"].agg(["sum", "count"])
+            cost_ali = cost_ali.sort_values("sum", ascending=False).reset_index()
+            cost_ali.columns = ["Aliança", "Prejuízo", "Cancelamentos"]
+            fig3 = px.bar(cost_ali, x="Aliança", y="Prejuízo", color="Prejuízo",
+                          color_continuous_scale="Viridis", hover_data=["Cancelamentos"])
+            st.plotly_chart(ajustar_layout_grafico(fig3), use_container_width=True)
     else:
         st.info("Não há dados de custos (coluna de TEUs ausente).")
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Aba 8: Risco de cancelamento das escalas ainda programadas
+HORIZONTES_RISCO = {"Próximas 2 semanas": 14, "Próximas 4 semanas": 28, "Próximas 8 semanas": 56,
+                    "Todas as programadas": None}
+riscos = comparacao_antecedencia = None
+with tabs[7]:
+    st.subheader("Risco de Cancelamento das Escalas Programadas")
+    st.caption("Regressão logística sobre as escalas já encerradas da planilha (sem os filtros da barra "
+               "lateral), com probabilidades calibradas numa validação temporal (últimos 20% por ETA).")
+    modelo_risco = None
+    if col_data:
+        try:
+            modelo_risco = treinar_modelo_risco(chave_fonte, df, validacao, tuple(colunas.items()))
+        except ValueError as erro:
+            st.info(str(erro))
+    else:
+        st.info("Coluna de data não encontrada.")
+
+    if modelo_risco is not None:
+        referencia = data_referencia(df, colunas)
+        horizonte = st.selectbox(f"Horizonte (a partir de {referencia:%d/%m/%Y}, última ETA encerrada)",
+                                 list(HORIZONTES_RISCO), index=1)
+        riscos = pontuar_programadas(chave_fonte, modelo_risco, df, validacao, tuple(colunas.items()),
+                                     tuple(C.items()), HORIZONTES_RISCO[horizonte])
+        colA, colB, colC, colD = st.columns(4)
+        colA.metric("Escalas Programadas", f"{len(riscos):,}")
+        colB.metric("Cancelamentos Esperados", f"{riscos['Probabilidade'].sum():.1f}")
+        if "TEUs em risco" in riscos:
+            colC.metric("TEUs em Risco", f"{riscos['TEUs em risco'].sum():,.0f}")
+            colD.metric("Custo Esperado", br_currency(riscos["Custo esperado"].sum()))
+
+        if riscos.empty:
+            st.info("Nenhuma escala programada no horizonte escolhido.")
+        else:
+            tabela_risco = riscos.assign(Probabilidade=riscos["Probabilidade"] * 100)
+            st.dataframe(
+                tabela_risco, hide_index=True, use_container_width=True,
+                column_config={
+                    "ETA": st.column_config.DatetimeColumn("ETA", format="DD/MM/YYYY HH:mm"),
+                    "Probabilidade": st.column_config.ProgressColumn("Risco", format="%.0f%%",
+                                                                     min_value=0, max_value=100),
+                    "TEUs em risco": st.column_config.NumberColumn(format="%.1f"),
+                    "Custo esperado": st.column_config.NumberColumn(format="R$ %.0f"),
+                },
+            )
+
+        metricas = modelo_risco.metricas
+        st.caption(f"{metricas['escalas_treino']:,} escalas encerradas no treino e "
+                   f"{metricas['escalas_validacao']:,} na calibração · {metricas['atributos']} atributos · "
+                   f"taxa base {metricas['taxa_base']:.1%} · AUC (validação) {metricas['auc_validacao']:.2f} · "
+                   f"Brier {metricas['brier_validacao']:.3f} · treino em {metricas['tempo_treino_s']:.2f} s")
+        col1, col2 = st.columns(2)
+        with col1:
+            fig = px.line(modelo_risco.calibracao, x="Prevista", y="Observada", markers=True,
+                          hover_data=["Escalas"], title="Calibração (validação temporal)")
+            limite = float(modelo_risco.calibracao[["Prevista", "Observada"]].max().max())
+            fig.add_shape(type="line", x0=0, y0=0, x1=limite, y1=limite, line=dict(dash="dot", color="gray"))
+            fig.update_layout(xaxis_tickformat=".0%", yaxis_tickformat=".0%")
+            st.plotly_chart(ajustar_layout_grafico(fig, altura=400), use_container_width=True)
+        with col2:
+            st.markdown("**Fatores de maior peso**")
+            st.dataframe(modelo_risco.fatores(10), hide_index=True, use_container_width=True)
+
+    st.markdown("---")
+    st.markdown("#### ⏱️ Antecedência e Janelas de Recebimento")
+    comparacao_antecedencia, cubo_antecedencia = construir_antecedencias(chave_fonte, df, validacao,
+                                                                         tuple(colunas.items()))
+    if not cubo_antecedencia.medidas:
+        st.info("Colunas de Deadline / Início de Recebimento não encontradas.")
+    else:
+        st.caption("Todas as escalas da planilha: horas do Deadline Dry até a ETA e dias do início do "
+                   "recebimento (cheios / vazios) até o deadline. Quantis exatos por situação:")
+        st.dataframe(comparacao_antecedencia.round(1), hide_index=True, use_container_width=True)
+
+        # Fatia dos filtros de mês e armador da barra lateral, mesclando os sketches das células
+        filtros_antecedencia = {"Armador": selecoes.get("Armador")}
+        if selecoes.get("Mês"):
+            filtros_antecedencia["Y-M"] = sorted({chave[1] for chave in cubo_antecedencia.celulas
+                                                  if selecoes["Mês"][0] <= chave[1] <= selecoes["Mês"][-1]})
+        medida = st.selectbox("Medida", cubo_antecedencia.medidas)
+        inicio_quantis = time.perf_counter()
+        por_situacao = cubo_antecedencia.agregar(medida, ["Situação"], filtros_antecedencia)
+        por_armador = cubo_antecedencia.agregar(medida, ["Armador", "Situação"], filtros_antecedencia)
+        tempo_quantis = (time.perf_counter() - inicio_quantis) * 1000
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            st.dataframe(por_situacao.round(1), hide_index=True, use_container_width=True)
+            st.caption(f"Quantis aproximados (KLL) da fatia de mês e armador da barra lateral · "
+                       f"{len(cubo_antecedencia.celulas):,} células · {tempo_quantis:.1f} ms")
+        with col2:
+            encerradas = por_armador[por_armador["Situação"] != "Programada"]
+            fig = px.bar(encerradas, x="Armador", y="p50", color="Situação", barmode="group",
+                         hover_data=["Escalas", "p90", "p99"], title=f"Mediana de {medida} por armador")
+            st.plotly_chart(ajustar_layout_grafico(fig, altura=400), use_container_width=True)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Aba 9: Comparação entre snapshots
+with tabs[8]:
+    st.subheader("Comparação com um Snapshot Anterior")
+    st.caption("Compara a programação carregada (todas as situações, sem os filtros da barra lateral) "
+               "com uma exportação anterior, pela chave 'Navio / Viagem'.")
+    arquivo_anterior = st.file_uploader("Snapshot anterior (.xlsx)", type="xlsx", key="snapshot_anterior")
+    if arquivo_anterior is None:
+        st.info("Carregue uma exportação anterior da programação para ver o que mudou.")
+    elif not col_viagem:
+        st.info("Coluna 'Navio / Viagem' não encontrada no arquivo atual.")
+    else:
+        inicio_diff = time.perf_counter()
+        diff = comparar_com_anterior(chave_fonte, hash_conteudo(arquivo_anterior), df_snapshot, arquivo_anterior)
+        tempo_diff = time.perf_counter() - inicio_diff
+
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("Viagens em Comum", f"{len(diff['comuns']):,}")
+        col2.metric("Mudaram de Situação", f"{len(diff['mudancas']):,}")
+        col3.metric("Novos Cancelamentos", f"{len(diff['novos_cancelamentos']):,}")
+        col4.metric("Escalas Adicionadas", f"{len(diff['adicionadas']):,}")
+        col5.metric("Escalas Removidas", f"{len(diff['removidas']):,}")
+        st.caption(f"Leitura e comparação em {tempo_diff:.2f} s (reaproveitadas nas próximas interações)")
+
+        if not diff["transicoes"].empty:
+            st.markdown("**Transições de Situação**")
+            transicoes = diff["transicoes"].assign(
+                Transição=lambda d: d["Situação anterior"] + " → " + d["Situação atual"]
+            )
+            fig = px.bar(transicoes, x="Viagens", y="Transição", orientation="h",
+                         color="Viagens", color_continuous_scale="Viridis")
+            st.plotly_chart(ajustar_layout_grafico(fig, 350), use_container_width=True)
+            st.dataframe(diff["transicoes"], use_container_width=True, hide_index=True)
+
+        if not diff["novos_cancelamentos"].empty:
+            st.markdown("**Viagens que passaram a cancelado/rejeitado**")
+            st.dataframe(diff["novos_cancelamentos"], use_container_width=True, hide_index=True)
+
+        deslocadas = diff["comuns"].loc[diff["comuns"]["Δ ETA (h)"].fillna(0) != 0]
+        if not deslocadas.empty:
+            st.markdown("**Deslocamentos de ETA**")
+            fig = px.histogram(deslocadas, x="Δ ETA (h)", nbins=40, title="Variação da ETA entre os snapshots (horas)")
+            st.plotly_chart(ajustar_layout_grafico(fig, 350), use_container_width=True)
+            maiores = deslocadas.reindex(deslocadas["Δ ETA (h)"].abs().sort_values(ascending=False).index).head(10)
+            st.dataframe(maiores, use_container_width=True, hide_index=True)
+
+        with st.expander(f"Escalas adicionadas ({len(diff['adicionadas']):,})"):
+            st.dataframe(diff["adicionadas"], use_container_width=True, hide_index=True)
+        with st.expander(f"Escalas removidas ({len(diff['removidas']):,})"):
+            st.dataframe(diff["removidas"], use_container_width=True, hide_index=True)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Aba 10: Exportação das linhas filtradas e das tabelas agregadas
+def tabelas_exportaveis():
+    """Linhas filtradas e agregados completos (sem o corte de Top 10), montados sob demanda."""
+    def contagem(coluna, nome):
+        cnt = df_canc[coluna].value_counts().loc[lambda c: c > 0].reset_index()
+        cnt.columns = [nome, "Cancelamentos"]
+        return cnt
+
+    def serie_mensal():
+        mensal = df_canc.groupby("Y-M").size().rename("Cancelamentos").to_frame()
+        if "CUSTO_TOTAL" in df_canc:
+            mensal["Custo Total"] = df_canc.groupby("Y-M")["CUSTO_TOTAL"].sum()
+        return mensal.reset_index().rename(columns={"Y-M": "Mês"})
+
+    def armadores_por_custo():
+        cost_arm = (
+            df_canc.groupby(col_armador, observed=True)["CUSTO_TOTAL"]
+            .agg(["sum", "mean", "count"])
+            .sort_values("sum", ascending=False)
+            .reset_index()
+        )
+        cost_arm.columns = ["Armador", "Custo Total", "Custo Médio", "Quantidade"]
+        return cost_arm
+
+    tabelas = {"Cancelamentos filtrados": lambda: df_canc}
+    if col_navio:
+        tabelas["Navios"] = lambda: contagem(col_navio, "Navio")
+    if col_data:
+        tabelas["Série mensal"] = serie_mensal
+    if col_armador and "CUSTO_TOTAL" in df_canc:
+        tabelas["Armadores por custo"] = armadores_por_custo
+    if col_berco:
+        tabelas["Berços"] = lambda: contagem(col_berco, "Berço")
+    if col_rota:
+        tabelas["Rotas"] = lambda: matriz_od.pares()
+    if col_servico:
+        tabelas["Serviços"] = lambda: contagem(col_servico, "Serviço")
+    if riscos is not None:
+        tabelas["Risco das programadas"] = lambda: riscos
+    if comparacao_antecedencia is not None and not comparacao_antecedencia.empty:
+        tabelas["Antecedência por situação"] = lambda: comparacao_antecedencia
+    return tabelas
+
+with tabs[9]:
+    st.subheader("Exportar Dados")
+    st.caption("Os arquivos são gravados em lotes na pasta 'exportacoes/' por uma tarefa em segundo plano; "
+               "o dashboard continua respondendo enquanto a exportação roda. Cada arquivo fica disponível "
+               f"por {IDADE_MAXIMA_EXPORTACAO_S // 3600:.0f} h.")
+    tabelas = tabelas_exportaveis()
+    col1, col2 = st.columns([2, 1])
+    nome_tabela = col1.selectbox("Tabela", list(tabelas))
+    formato = col2.radio("Formato", list(FORMATOS), horizontal=True)
+    if st.button("Gerar arquivo"):
+        st.session_state.setdefault("exportacoes", []).append(
+            (nome_tabela, formato, exportar_em_segundo_plano(tabelas[nome_tabela](), nome_tabela, formato))
+        )
+
+    exportacoes = st.session_state.get("exportacoes", [])
+    if exportacoes:
+        st.button("🔄 Atualizar status")
+    for nome, fmt, futuro in reversed(exportacoes):
+        if not futuro.done():
+            st.info(f"⏳ {nome} ({fmt}): gerando...")
+        elif futuro.exception() is not None:
+            st.error(f"{nome} ({fmt}): falha na exportação — {futuro.exception()}")
+        elif not os.path.exists(futuro.result()):
+            st.warning(f"{nome} ({fmt}): o arquivo expirou; gere-o novamente.")
+        else:
+            caminho = futuro.result()
+            with open(caminho, "rb") as arquivo:
+                st.download_button(
+                    f"📥 {nome} ({fmt}, {os.path.getsize(caminho) / 1e6:.1f} MB)",
+                    data=arquivo, file_name=nome_arquivo(nome, fmt), key=f"download_{id(futuro)}"
+                )
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+"""
+Armazém de artefatos endereçado por conteúdo, compartilhado entre os scripts.
+
+`analise_navios.py`, `app.py`, `backup.py`, `backupsemiofc.py` e a API
+refaziam a leitura da planilha, o filtro de cancelamentos e os agregados
+cada um por conta própria. Aqui cada etapa do pipeline grava o seu resultado
+em disco (`artefatos/<etapa>/<chave>.pkl`) sob o hash das suas entradas e
+parâmetros; qualquer ponto de entrada que pedir a mesma etapa com as mesmas
+entradas reaproveita o que outro já calculou.
+
+Etapas:
+- `dataset`: planilha lida (todas as colunas ou só os campos mapeados),
+  chaveada pelo hash do conteúdo do arquivo
+- `dataset_validado`: o dataset mapeado depois da validação, com as datas e
+  números já convertidos, a máscara de linhas limpas e o relatório
+- `cancelamentos`: linhas canceladas com datas convertidas e 'Y-M'
+- `tabela_custos`: cancelamentos com as colunas de custo
+- `cubo`: cubo de distintos (HyperLogLog) por dimensões
+- `cubo_por_particao`: o mesmo cubo em fatias por partição (ex.: mês), cada
+  uma no cache do processo sob o hash do conteúdo da partição: uma
+  exportação nova só recalcula os meses que mudaram
+- `amostra`: amostra estratificada (mês x armador) da prévia do dashboard
+- `artefato`: etapa avulsa com uma função própria
+
+O `dataset` e o `dataset_validado` são gravados em Arrow IPC (`tabela_arrow`)
+e abertos por mapeamento de memória: os processos que usam o dataset
+validado (dashboard, relatório, API, conversão) compartilham uma única cópia
+física, colunas de data incluídas, pelo page cache, e nenhum deles refaz a
+validação. Por isso o `.valor` dessas etapas é somente leitura: quem precisa
+escrever células ou alterar colunas no lugar deve fazer `.copy()` antes. As
+demais etapas, e datasets que o Arrow não representa, continuam em pickle.
+
+A chave de uma etapa inclui a chave do artefato de entrada, então uma
+planilha nova invalida toda a cadeia. Dentro do processo os artefatos também
+passam pelo cache compartilhado de `cache_dados`. `coletar_lixo` remove os
+arquivos não usados há mais de N dias e, em seguida, os menos recentes até o
+armazém caber no tamanho máximo.
+
+Uso:
+    python artefatos.py --listar
+    python artefatos.py --gc --idade-dias 30 --max-mb 1024
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import time
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from amostragem import TAMANHO_PADRAO, AmostraEstratificada
+from cache_dados import consultar_compartilhado, hash_conteudo, obter_compartilhado
+from dados_navios import calcular_custos, preparar_cancelamentos
+from mapeamento_colunas import ler_com_mapeamento
+from sketches import CuboDistintos
+from tabela_arrow import abrir_arrow, gravar_arrow
+from validacao import Validacao, validar_dataset
+
+DIR_ARTEFATOS = "artefatos"
+# Incrementar quando o formato de alguma etapa mudar: invalida todos os artefatos
+VERSAO_ARTEFATOS = 3
+IDADE_MAXIMA_DIAS = 30
+TAMANHO_MAXIMO_BYTES = 2 * 1024 ** 3
+# Intervalo mínimo entre coletas automáticas (após gravações), para rajadas de artefatos pequenos
+INTERVALO_COLETA_S = 60
+# Etapas cujos DataFrames vão para Arrow IPC mapeado em vez de pickle
+ETAPAS_ARROW = {"dataset", "dataset_validado"}
+EXTENSOES = (".arrow", ".pkl")
+# Coluna do arquivo Arrow com a máscara de linhas limpas do `dataset_validado`
+COLUNA_LIMPA = "__linha_limpa"
+
+
+class Artefato(NamedTuple):
+    """Resultado de uma etapa e a chave que o identifica no armazém."""
+    chave: str
+    valor: Any
+
+
+def _normalizar(valor):
+    """Forma estável das entradas e parâmetros para o hash (artefatos entram pela chave)."""
+    if isinstance(valor, Artefato):
+        return ("artefato", valor.chave)
+    if isinstance(valor, dict):
+        return tuple(sorted((str(k), _normalizar(v)) for k, v in valor.items()))
+    if isinstance(valor, (list, tuple)):
+        return tuple(_normalizar(v) for v in valor)
+    return valor
+
+
+class ArmazemArtefatos:
+    """Artefatos em disco sob o hash de (etapa, entradas, parâmetros), com coleta de lixo."""
+
+    def __init__(self, raiz: str = DIR_ARTEFATOS, idade_maxima_dias: float | None = IDADE_MAXIMA_DIAS,
+                 tamanho_maximo_bytes: int | None = TAMANHO_MAXIMO_BYTES):
+        self.raiz = raiz
+        self.idade_maxima_dias = idade_maxima_dias
+        self.tamanho_maximo_bytes = tamanho_maximo_bytes
+        self.acertos = 0
+        self.falhas = 0
+        self._ultima_coleta = float("-inf")
+
+    def chave(self, etapa: str, entradas: tuple = (), parametros: dict | None = None) -> str:
+        conteudo = repr((VERSAO_ARTEFATOS, etapa, _normalizar(entradas), _normalizar(parametros or {})))
+        return hashlib.blake2b(conteudo.encode(), digest_size=20).hexdigest()
+
+    def caminho(self, etapa: str, chave: str, extensao: str = ".pkl") -> str:
+        return os.path.join(self.raiz, etapa, f"{chave}{extensao}")
+
+    def obter(self, etapa: str, calcular, entradas: tuple = (), **parametros) -> Artefato:
+        """Artefato da etapa: do cache do processo, do disco ou, na falta dos dois, de `calcular()`."""
+        chave = self.chave(etapa, entradas, parametros)
+        valor = obter_compartilhado(("artefato", self.raiz, etapa, chave),
+                                    lambda: self._carregar_ou_calcular(etapa, chave, calcular))
+        return Artefato(chave, valor)
+
+    def _carregar_ou_calcular(self, etapa, chave, calcular):
+        for extensao in EXTENSOES if etapa in ETAPAS_ARROW else (".pkl",):
+            caminho = self.caminho(etapa, chave, extensao)
+            try:
+                valor = _ler_arrow(caminho) if extensao == ".arrow" else _ler_pickle(caminho)
+                os.utime(caminho)  # marca o último uso para a coleta de lixo
+                self.acertos += 1
+                return valor
+            except (OSError, pa.ArrowInvalid, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                pass
+
+        valor = calcular()
+        self.falhas += 1
+        try:
+            os.makedirs(os.path.join(self.raiz, etapa), exist_ok=True)
+            if etapa in ETAPAS_ARROW and _gravar_arrow(valor, self.caminho(etapa, chave, ".arrow")):
+                # Reabre pelo mapeamento: este processo também passa a usar a cópia do page cache
+                valor = _ler_arrow(self.caminho(etapa, chave, ".arrow"))
+            else:
+                # Grava em um temporário e renomeia, para nunca deixar um artefato pela metade
+                caminho = self.caminho(etapa, chave)
+                temporario = f"{caminho}.{os.getpid()}.tmp"
+                with open(temporario, "wb") as arquivo:
+                    pickle.dump(valor, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temporario, caminho)
+            if time.monotonic() - self._ultima_coleta >= INTERVALO_COLETA_S:
+                self.coletar_lixo()
+        except OSError:
+            pass  # diretório somente leitura: o artefato continua no cache do processo
+        return valor
+
+    def listar(self) -> pd.DataFrame:
+        """Etapa, chave, tamanho e último uso de cada artefato em disco."""
+        linhas = []
+        if os.path.isdir(self.raiz):
+            for etapa in os.scandir(self.raiz):
+                if not etapa.is_dir():
+                    continue
+                for entrada in os.scandir(etapa.path):
+                    nome, extensao = os.path.splitext(entrada.name)
+                    if extensao in EXTENSOES:
+                        info = entrada.stat()
+                        linhas.append((etapa.name, nome, info.st_size, info.st_mtime, entrada.path))
+        artefatos = pd.DataFrame(linhas, columns=["etapa", "chave", "bytes", "ultimo_uso", "caminho"])
+        artefatos["ultimo_uso"] = pd.to_datetime(artefatos["ultimo_uso"], unit="s")
+        return artefatos.sort_values("ultimo_uso", ascending=False, ignore_index=True)
+
+    def coletar_lixo(self, idade_maxima_dias: float | None = None,
+                     tamanho_maximo_bytes: int | None = None) -> dict:
+        """Remove artefatos velhos e, se ainda passar do tamanho máximo, os menos usados."""
+        idade = self.idade_maxima_dias if idade_maxima_dias is None else idade_maxima_dias
+        limite = self.tamanho_maximo_bytes if tamanho_maximo_bytes is None else tamanho_maximo_bytes
+        self._ultima_coleta = time.monotonic()
+        artefatos = self.listar()
+        remover = pd.Series(False, index=artefatos.index)
+        if idade is not None:
+            remover |= artefatos["ultimo_uso"] < pd.Timestamp(time.time() - idade * 86400, unit="s")
+        if limite is not None:
+            # Do mais recente para o mais antigo: sai tudo o que passar do limite acumulado
+            remover |= artefatos["bytes"].where(~remover, 0).cumsum() > limite
+        removidos = artefatos[remover]
+        for caminho in removidos["caminho"]:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+        return {"removidos": len(removidos), "bytes": int(removidos["bytes"].sum())}
+
+    def estatisticas(self) -> dict:
+        artefatos = self.listar()
+        return {"artefatos": len(artefatos), "bytes": int(artefatos["bytes"].sum()),
+                "acertos": self.acertos, "falhas": self.falhas}
+
+
+_armazem = ArmazemArtefatos()
+
+
+def _ler_pickle(caminho: str):
+    with open(caminho, "rb") as arquivo:
+        return pickle.load(arquivo)
+
+
+def _ler_arrow(caminho: str):
+    """DataFrame mapeado, (DataFrame, colunas) ou (DataFrame, colunas, Validacao), conforme os metadados."""
+    df, metadados = abrir_arrow(caminho)
+    if metadados is None:
+        return df
+    if "validacao" not in metadados:
+        return df, metadados["colunas"]
+    limpa = df[COLUNA_LIMPA].to_numpy()
+    df = df.drop(columns=COLUNA_LIMPA)
+    return df, metadados["colunas"], Validacao.de_metadados(metadados["validacao"], df, limpa)
+
+
+def _gravar_arrow(valor, caminho: str) -> bool:
+    """Grava um DataFrame, (DataFrame, colunas) ou (DataFrame, colunas, Validacao) em Arrow IPC.
+
+    False se o valor não couber no Arrow.
+    """
+    df, colunas, validacao = (*valor, None)[:3] if isinstance(valor, tuple) else (valor, None, None)
+    if not isinstance(df, pd.DataFrame):
+        return False
+    metadados = None if colunas is None else {"colunas": colunas}
+    if validacao is not None:
+        df = df.assign(**{COLUNA_LIMPA: validacao.limpa})
+        metadados["validacao"] = validacao.metadados()
+    try:
+        gravar_arrow(df, caminho, metadados)
+    except (pa.ArrowException, TypeError, ValueError):
+        return False  # ex.: coluna object com tipos misturados; o artefato vai para pickle
+    return True
+
+
+def armazem_padrao() -> ArmazemArtefatos:
+    return _armazem
+
+
+def artefato(etapa: str, calcular, *entradas, armazem: ArmazemArtefatos | None = None, **parametros) -> Artefato:
+    """Etapa avulsa: `calcular()` chaveado por `entradas` (artefatos, hashes, tuplas) e `parametros`."""
+    return (armazem or _armazem).obter(etapa, calcular, entradas, **parametros)
+
+
+def _ler_planilha(origem, campos):
+    try:
+        return ler_com_mapeamento(origem, list(campos)) if campos is not None else pd.read_excel(origem)
+    finally:
+        if hasattr(origem, "seek"):
+            origem.seek(0)
+
+
+def dataset(origem, campos=None, armazem: ArmazemArtefatos | None = None) -> Artefato:
+    """Planilha lida: DataFrame bruto ou, com `campos`, (DataFrame, colunas) do mapeamento.
+
+    O DataFrame vem do arquivo mapeado e é somente leitura; `.copy()` antes de escrever nele.
+    """
+    campos = tuple(campos) if campos is not None else None
+    return artefato("dataset", lambda: _ler_planilha(origem, campos), hash_conteudo(origem),
+                    armazem=armazem, campos=campos)
+
+
+def dataset_validado(origem, campos, armazem: ArmazemArtefatos | None = None) -> Artefato:
+    """(DataFrame, colunas, Validacao) do dataset lido com `campos`, com as colunas já convertidas.
+
+    Como o `dataset`, vem do arquivo mapeado e é somente leitura.
+    """
+    entrada = dataset(origem, campos, armazem)
+
+    def calcular():
+        df, colunas = entrada.valor
+        convertido, validacao = validar_dataset(df, colunas)
+        return convertido, colunas, validacao
+    return artefato("dataset_validado", calcular, entrada, armazem=armazem)
+
+
+def _dataframe(entrada: Artefato) -> pd.DataFrame:
+    return entrada.valor[0] if isinstance(entrada.valor, tuple) else entrada.valor
+
+
+def cancelamentos(entrada: Artefato, col_status: str, col_data: str | None = None,
+                  armazem: ArmazemArtefatos | None = None) -> Artefato:
+    """Linhas canceladas do dataset, com `col_data` convertida e 'Y-M' (se informada)."""
+    return artefato("cancelamentos", lambda: preparar_cancelamentos(_dataframe(entrada), col_status, col_data),
+                    entrada, armazem=armazem, col_status=col_status, col_data=col_data)
+
+
+def tabela_custos(entrada: Artefato, col_teus: str, custos: dict | None = None,
+                  armazem: ArmazemArtefatos | None = None) -> Artefato:
+    """Cancelamentos com as colunas C_* e CUSTO_TOTAL para os custos informados."""
+    return artefato("tabela_custos",
+                    lambda: calcular_custos(_dataframe(entrada).copy(deep=False), col_teus, custos),
+                    entrada, armazem=armazem, col_teus=col_teus, custos=custos)
+
+
+def cubo(entrada: Artefato, dimensoes, medidas: dict, armazem: ArmazemArtefatos | None = None) -> Artefato:
+    """Cubo de distintos (HyperLogLog) dos cancelamentos por `dimensoes`."""
+    def calcular():
+        resultado = CuboDistintos(list(dimensoes), dict(medidas))
+        resultado.atualizar(_dataframe(entrada))
+        return resultado
+    return artefato("cubo", calcular, entrada, armazem=armazem, dimensoes=tuple(dimensoes), medidas=dict(medidas))
+
+
+def amostra(entrada: Artefato, tamanho: int = TAMANHO_PADRAO,
+            armazem: ArmazemArtefatos | None = None) -> Artefato:
+    """Amostra estratificada por mês x armador de um dataset lido com `campos`."""
+    return artefato("amostra", lambda: AmostraEstratificada.sortear(*entrada.valor, tamanho=tamanho),
+                    entrada, armazem=armazem, tamanho=tamanho)
+
+
+def assinaturas_particoes(particoes: pd.Series, df: pd.DataFrame, colunas) -> dict[str, str]:
+    """Hash do conteúdo (`colunas`) das linhas de cada partição, independente da ordem das linhas."""
+    hashes = pd.util.hash_pandas_object(df[list(colunas)], index=False).to_numpy()
+    return {particao: hashlib.blake2b(np.sort(hashes[posicoes]).tobytes(), digest_size=16).hexdigest()
+            for particao, posicoes in particoes.groupby(particoes, sort=True).indices.items()}
+
+
+def _fatia(cubo: CuboDistintos, posicao: int | None, particao: str) -> CuboDistintos:
+    fatia = CuboDistintos(cubo.dimensoes, cubo.medidas, cubo.precisao)
+    fatia.celulas = {chave: celula for chave, celula in cubo.celulas.items()
+                     if posicao is None or chave[posicao] == particao}
+    return fatia
+
+
+def cubo_por_particao(df: pd.DataFrame, coluna_particao: str | None, dimensoes,
+                      medidas: dict) -> tuple[CuboDistintos, dict[str, str]]:
+    """Cubo de distintos montado por partição e as assinaturas de cada partição.
+
+    `coluna_particao` precisa ser uma das dimensões (ex.: 'Y-M'). Cada fatia
+    do cubo fica no cache compartilhado sob a assinatura da sua partição; só
+    as partições ainda sem fatia passam por `atualizar`, todas de uma vez, e o
+    resultado é a mescla das fatias. Sem `coluna_particao`, o DataFrame
+    inteiro é uma partição.
+    """
+    medidas = dict(medidas)
+    colunas = list(dict.fromkeys([*dimensoes, *medidas.values()]))
+    posicao = list(dimensoes).index(coluna_particao) if coluna_particao else None
+    # Mesmo rótulo que o cubo usa para valores ausentes, para a partição coincidir com as células
+    particoes = (df[coluna_particao].astype("string").fillna("Não Informado") if coluna_particao
+                 else pd.Series("Todos", index=df.index, dtype="string"))
+    assinaturas = assinaturas_particoes(particoes, df, colunas)
+    chaves = {particao: ("cubo_particao", assinatura, tuple(dimensoes), _normalizar(medidas))
+              for particao, assinatura in assinaturas.items()}
+
+    fatias = {particao: consultar_compartilhado(chave) for particao, chave in chaves.items()}
+    faltantes = [particao for particao, fatia in fatias.items() if fatia is None]
+    if faltantes:
+        posicoes = particoes.groupby(particoes, sort=True).indices
+        novo = CuboDistintos(list(dimensoes), medidas)
+        novo.atualizar(df.iloc[np.concatenate([posicoes[particao] for particao in faltantes])])
+        for particao in faltantes:
+            fatias[particao] = obter_compartilhado(chaves[particao],
+                                                   lambda particao=particao: _fatia(novo, posicao, particao))
+
+    total = CuboDistintos(list(dimensoes), medidas)
+    for fatia in fatias.values():
+        total.mesclar(fatia)
+    return total, assinaturas
+
+
+def particoes_alteradas(anteriores: dict[str, str], atuais: dict[str, str]) -> list[str]:
+    """Partições novas, removidas ou com conteúdo diferente entre dois conjuntos de assinaturas."""
+    return sorted(p for p in anteriores.keys() | atuais.keys() if anteriores.get(p) != atuais.get(p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lista ou limpa o armazém de artefatos.")
+    parser.add_argument("--raiz", default=DIR_ARTEFATOS, help="Diretório do armazém")
+    parser.add_argument("--listar", action="store_true", help="Lista os artefatos em disco")
+    parser.add_argument("--gc", action="store_true", help="Executa a coleta de lixo")
+    parser.add_argument("--idade-dias", type=float, default=IDADE_MAXIMA_DIAS,
+                        help="Remove artefatos sem uso há mais dias que isso")
+    parser.add_argument("--max-mb", type=float, default=TAMANHO_MAXIMO_BYTES / 1024 ** 2,
+                        help="Tamanho máximo do armazém após a coleta")
+    args = parser.parse_args()
+
+    armazem = ArmazemArtefatos(args.raiz)
+    if args.gc:
+        resultado = armazem.coletar_lixo(args.idade_dias, int(args.max_mb * 1024 ** 2))
+        print(f"{resultado['removidos']} artefatos removidos ({resultado['bytes'] / 1e6:.1f} MB liberados)")
+    if args.listar or not args.gc:
+        artefatos = armazem.listar()
+        print(artefatos.drop(columns="caminho").to_string(index=False) if not artefatos.empty
+              else "Nenhum artefato em disco.")
+
+
+if __name__ == "__main__":
+    main()
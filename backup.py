@@ -11,12 +11,47 @@ O objetivo deste trabalho é analisar os levantamentos em formato Excel dos port
 
 import streamlit as st
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
+
+from precomputacao import PreComputacao
+from sketches import ResumoTopK
+from artefatos import dataset
+from cache_dados import hash_conteudo
+from dados_navios import para_datas
+from cache_figuras import estatisticas as estatisticas_figuras, figura_em_cache
+from enriquecimento import TABELAS, remapear
+from padroes_calendario import DIAS_SEMANA, MatrizCalendario
+
+# Padrão exibido -> (eixo das linhas, eixo das colunas) da matriz de calendário
+PADROES_CALENDARIO = {
+    "Dia da semana × hora": ("dia_semana", "hora"),
+    "Mês × dia da semana": ("mes", "dia_semana"),
+}
+
+# Sketches Top-K por dimensão, mantidos na ingestão de cada arquivo carregado
+@st.cache_resource(max_entries=4)
+def construir_resumos(chave_arquivo, _df_cancel, colunas):
+    resumos = {}
+    for coluna in colunas:
+        resumos[coluna] = ResumoTopK()
+        resumos[coluna].atualizar(_df_cancel[coluna])
+    return resumos
+
+# Padrões de calendário sobre todas as escalas programadas, uma matriz por arquivo,
+# campo de data, eixos e divisão
+@st.cache_resource(max_entries=16)
+def construir_calendario(chave_arquivo, _df, coluna, linhas, colunas, divisao):
+    grupos = None
+    if divisao == 'Armador':
+        grupos = remapear(_df[divisao], TABELAS['armador'])[0]
+    elif divisao:
+        grupos = _df[divisao].astype('string').str.strip()
+    return MatrizCalendario(_df[coluna], linhas, colunas, grupos)
+
+# Análises de todas as abas calculadas em segundo plano, uma vez por arquivo carregado
+@st.cache_resource(max_entries=4)
+def iniciar_precomputacao(chave_arquivo, _df_cancel, colunas):
+    return PreComputacao(_df_cancel, dict(colunas))
 
 def ajustar_layout_grafico(fig, altura=500):
     fig.update_layout(
@@ -58,6 +93,9 @@ with st.sidebar:
         ["Análise Completa", "Análise de Custos", "Análise por Armador", "Análise Temporal"]
     )
     
+    # Rankings Top 10 vêm dos sketches; a recontagem exata é feita só sob demanda
+    recontagem_exata = st.checkbox("Recontagem exata (Top-K)", value=False)
+
     # Botão para aplicar modelo
     if st.button("Aplicar Modelo"):
         st.session_state['modelo_atual'] = modelo_selecionado
@@ -212,7 +250,10 @@ uploaded_file = st.file_uploader("📁 Faça o upload do arquivo Excel", type=["
 
 if uploaded_file is not None:
     # Carregar dados
-    df = pd.read_excel(uploaded_file)
+    # Leitura pelo armazém de artefatos (compartilhada entre sessões e processos pelo hash
+    # do conteúdo); a mesma chave identifica o arquivo nos caches de sketches e de pré-cálculo
+    chave_arquivo = hash_conteudo(uploaded_file)
+    df = dataset(uploaded_file).valor
     
     # Identificar colunas
     col_navio = 'Navio / Viagem' if 'Navio / Viagem' in df.columns else None
@@ -226,36 +267,59 @@ if uploaded_file is not None:
 
     # Filtrar cancelamentos
     if col_status is not None:
-        df[col_status] = df[col_status].astype(str).str.strip().str.lower()
+        # Só as linhas canceladas são copiadas (a seleção por máscara já gera um DataFrame
+        # próprio); o `df` completo fica intacto e serve apenas para os totais
+        status = df[col_status].astype(str).str.strip().str.lower()
         valores_cancelados = ['cancelado', 'cancelada', 'rejeitado', 'rej.', 'canceled']
-        mask_cancel = df[col_status].isin(valores_cancelados)
-        df_cancel = df.loc[mask_cancel].copy()
+        mask_cancel = status.isin(valores_cancelados)
+        df_cancel = df.loc[mask_cancel]
+        df_cancel[col_status] = status[mask_cancel]
 
         # Converter colunas numéricas
         if col_conteineres is not None:
             df_cancel[col_conteineres] = pd.to_numeric(df_cancel[col_conteineres], errors='coerce').fillna(0)
-            df[col_conteineres] = pd.to_numeric(df[col_conteineres], errors='coerce').fillna(0)
 
         # Converter datas
         if col_data is not None:
-            df_cancel[col_data] = pd.to_datetime(df_cancel[col_data], errors='coerce')
-            df[col_data] = pd.to_datetime(df[col_data], errors='coerce')
+            df_cancel[col_data] = para_datas(df_cancel[col_data])
+
+    # Sketches Top-K de navio, berço e país, construídos uma vez por arquivo
+    resumos = construir_resumos(
+        chave_arquivo,
+        df_cancel,
+        tuple(c for c in (col_navio, 'Berço', 'País') if c in df_cancel.columns)
+    )
+
+    def contar_top(coluna, nome, n=10):
+        """Top-K lido do sketch da ingestão; recontagem exata sob demanda."""
+        if recontagem_exata or coluna not in resumos:
+            contagem = df_cancel[coluna].value_counts().head(n).reset_index()
+            contagem.columns = [nome, 'Cancelamentos']
+            return contagem
+        return resumos[coluna].top(n, nome=nome)
 
     # Preparar dados para o resumo
-    contagem_navios = df_cancel[col_navio].value_counts().reset_index()
-    contagem_navios.columns = ['Navio', 'QuantidadeCancelamentos']
+    contagem_navios = contar_top(col_navio, 'Navio').rename(columns={'Cancelamentos': 'QuantidadeCancelamentos'})
     
     # Converter data e preparar análise temporal
     df_cancel[col_data] = pd.to_datetime(df_cancel[col_data], dayfirst=True, errors='coerce')
     df_cancel['Ano'] = df_cancel[col_data].dt.year
     df_cancel['Mês'] = df_cancel[col_data].dt.month
-    # Remover registros sem data válida antes de criar 'Y-M'
-    df_cancel_valid = df_cancel.dropna(subset=[col_data]).copy()
-    df_cancel_valid['Y-M'] = df_cancel_valid[col_data].dt.to_period('M').astype(str)
-    contagem_mensal = df_cancel_valid.groupby('Y-M').size().reset_index(name='Cancelamentos')
+    # Mês (Y-M) apenas dos registros com data válida, como série alinhada a df_cancel
+    meses_validos = df_cancel[col_data].dropna().dt.to_period('M').astype(str).rename('Y-M')
+    contagem_mensal = meses_validos.groupby(meses_validos).size().reset_index(name='Cancelamentos')
     contagem_mensal['Y-M'] = pd.to_datetime(contagem_mensal['Y-M'], format='%Y-%m')
     contagem_mensal = contagem_mensal.sort_values('Y-M')
 
+    # Dispara o cálculo das demais abas enquanto a primeira é renderizada
+    pre = iniciar_precomputacao(
+        chave_arquivo,
+        df_cancel,
+        (('navio', col_navio), ('status', col_status), ('data', col_data), ('rota', col_rota),
+         ('tipo', col_tipo_navio), ('conteineres', col_conteineres), ('armador', col_armador),
+         ('servico', 'Serviço' if 'Serviço' in df_cancel.columns else None))
+    )
+
     # Resumo final na sidebar
     with st.sidebar:
         st.markdown("### 📊 Resumo dos Resultados")
@@ -276,6 +340,10 @@ if uploaded_file is not None:
             """
         
         st.markdown(resumo_texto)
+        st.caption(f"⚙️ Análises pré-calculadas: {pre.prontas}/{pre.total}")
+        cache_fig = estatisticas_figuras()
+        st.caption(f"🖼️ Cache de figuras: {cache_fig['figuras']} figuras, {cache_fig['bytes'] / 1e6:.1f} MB, "
+                   f"{cache_fig['acertos']} acertos / {cache_fig['falhas']} falhas")
 
     # Criar abas para diferentes análises
     tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
@@ -329,7 +397,7 @@ if uploaded_file is not None:
             try:
                 # Preparar dados para o gráfico
                 if dimensao_x == "Mês":
-                    dados_x = df_cancel_valid['Y-M'].astype(str)
+                    dados_x = meses_validos
                 elif dimensao_x == "Navio":
                     dados_x = df_cancel[col_navio].astype(str)
                 elif dimensao_x == "Armador":
@@ -359,15 +427,15 @@ if uploaded_file is not None:
                     df_grafico = df_grafico.sort_values(by=dimensao_y, ascending=False)
 
                     # Criar gráfico com layout ajustado
-                    fig = px.bar(
-                        df_grafico,
+                    fig = figura_em_cache(
+                        px.bar, df_grafico,
                         x=dimensao_x,
                         y=dimensao_y,
                         title=f"{dimensao_y} por {dimensao_x}",
                         color=dimensao_y,
-                        color_continuous_scale='Viridis'
+                        color_continuous_scale='Viridis',
+                        ajuste=ajustar_layout_grafico, altura=500,
                     )
-                    fig = ajustar_layout_grafico(fig, altura=500)
                     st.plotly_chart(fig, use_container_width=True)
                 else:
                     st.warning(f"Não há dados disponíveis para a dimensão {dimensao_x}")
@@ -376,13 +444,14 @@ if uploaded_file is not None:
                 st.info("Tente selecionar outras dimensões para análise")
 
         # Gráfico de pizza com Plotly
-        fig = px.pie(
+        fig = figura_em_cache(
+            px.pie,
             values=[len(df_cancel), len(df) - len(df_cancel)],
             names=['Cancelados', 'Não Cancelados'],
             title='Distribuição de Cancelamentos',
-            color_discrete_sequence=px.colors.qualitative.Set3
+            color_discrete_sequence=px.colors.qualitative.Set3,
+            ajuste=ajustar_layout_grafico, altura=400,
         )
-        fig = ajustar_layout_grafico(fig, altura=400)
         st.plotly_chart(fig, use_container_width=True)
 
         # Exibir primeiros registros com estilo
@@ -415,21 +484,21 @@ if uploaded_file is not None:
                 )
             with col2:
                 # Gráfico de barras horizontal para melhor visualização
-                fig = px.bar(
-                    contagem_navios.head(5),
+                fig = figura_em_cache(
+                    px.bar, contagem_navios.head(5),
                     y='Navio',
                     x='QuantidadeCancelamentos',
                     orientation='h',
                     title='Top 5 Navios com Mais Cancelamentos',
                     color='QuantidadeCancelamentos',
                     color_continuous_scale='Viridis',
-                    height=350
-                )
-                fig.update_layout(
-                    xaxis_title="Quantidade de Cancelamentos",
-                    yaxis_title="Navio",
-                    showlegend=False,
-                    margin=dict(l=60, r=20, t=50, b=40)
+                    height=350,
+                    layout=dict(
+                        xaxis_title="Quantidade de Cancelamentos",
+                        yaxis_title="Navio",
+                        showlegend=False,
+                        margin=dict(l=60, r=20, t=50, b=40),
+                    ),
                 )
                 st.plotly_chart(fig, use_container_width=True)
 
@@ -447,17 +516,17 @@ if uploaded_file is not None:
         
         with col2:
             # Gráfico de linha com Plotly
-            fig = px.line(
-                contagem_mensal,
+            fig = figura_em_cache(
+                px.line, contagem_mensal,
                 x='Y-M',
                 y='Cancelamentos',
                 title='Evolução Mensal de Cancelamentos',
-                markers=True
-            )
-            fig.update_layout(
-                xaxis_title="Mês",
-                yaxis_title="Número de Cancelamentos",
-                showlegend=False
+                markers=True,
+                layout=dict(
+                    xaxis_title="Mês",
+                    yaxis_title="Número de Cancelamentos",
+                    showlegend=False,
+                ),
             )
             st.plotly_chart(fig, use_container_width=True)
 
@@ -465,8 +534,7 @@ if uploaded_file is not None:
         st.header("🌍 Análise de Rotas")
         
         if col_rota is not None:
-            contagem_rotas = df_cancel[col_rota].value_counts().reset_index()
-            contagem_rotas.columns = ['Rota', 'Cancelamentos']
+            contagem_rotas = pre.resultado("rotas")
             
             col1, col2 = st.columns(2)
             with col1:
@@ -479,18 +547,18 @@ if uploaded_file is not None:
             
             with col2:
                 # Gráfico de barras com Plotly
-                fig = px.bar(
-                    contagem_rotas.head(5),
+                fig = figura_em_cache(
+                    px.bar, contagem_rotas.head(5),
                     x='Rota',
                     y='Cancelamentos',
                     title='Top 5 Rotas com Mais Cancelamentos',
                     color='Cancelamentos',
-                    color_continuous_scale='Viridis'
-                )
-                fig.update_layout(
-                    xaxis_title="Rota",
-                    yaxis_title="Quantidade de Cancelamentos",
-                    showlegend=False
+                    color_continuous_scale='Viridis',
+                    layout=dict(
+                        xaxis_title="Rota",
+                        yaxis_title="Quantidade de Cancelamentos",
+                        showlegend=False,
+                    ),
                 )
                 st.plotly_chart(fig, use_container_width=True)
 
@@ -502,9 +570,7 @@ if uploaded_file is not None:
         
         with sub_tab1:
             if col_tipo_navio is not None:
-                df_cancel[col_tipo_navio] = df_cancel[col_tipo_navio].astype(str).str.strip().str.capitalize()
-                contagem_tipo_navio = df_cancel[col_tipo_navio].value_counts().reset_index()
-                contagem_tipo_navio.columns = ['TipoNavio', 'Cancelamentos']
+                contagem_tipo_navio = pre.resultado("tipos")
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -517,43 +583,43 @@ if uploaded_file is not None:
                 
                 with col2:
                     # Gráfico de pizza com Plotly
-                    fig = px.pie(
-                        contagem_tipo_navio,
+                    fig = figura_em_cache(
+                        px.pie, contagem_tipo_navio,
                         values='Cancelamentos',
                         names='TipoNavio',
                         title='Distribuição de Cancelamentos por Tipo de Navio',
-                        color_discrete_sequence=px.colors.qualitative.Set3
+                        color_discrete_sequence=px.colors.qualitative.Set3,
                     )
                     st.plotly_chart(fig, use_container_width=True)
         
         with sub_tab2:
             if col_conteineres is not None:
-                df_cancel[col_conteineres] = pd.to_numeric(df_cancel[col_conteineres], errors='coerce')
-                df_cancel_conteineres = df_cancel.dropna(subset=[col_conteineres])
+                conteineres = pre.resultado("conteineres")
+                df_cancel_conteineres = conteineres["validos"]
                 
                 if len(df_cancel_conteineres) > 0:
                     col1, col2 = st.columns(2)
                     with col1:
                         st.subheader("📊 Estatísticas de Contêineres")
                         st.dataframe(
-                            df_cancel_conteineres[col_conteineres].describe().reset_index(),
+                            conteineres["estatisticas"],
                             use_container_width=True,
                             hide_index=True
                         )
                     
                     with col2:
                         # Histograma com Plotly
-                        fig = px.histogram(
-                            df_cancel_conteineres,
+                        fig = figura_em_cache(
+                            px.histogram, df_cancel_conteineres,
                             x=col_conteineres,
                             title='Distribuição da Quantidade de Contêineres',
                             nbins=20,
-                            color_discrete_sequence=['#4CAF50']
-                        )
-                        fig.update_layout(
-                            xaxis_title="Quantidade de Contêineres",
-                            yaxis_title="Frequência",
-                            showlegend=False
+                            color_discrete_sequence=['#4CAF50'],
+                            layout=dict(
+                                xaxis_title="Quantidade de Contêineres",
+                                yaxis_title="Frequência",
+                                showlegend=False,
+                            ),
                         )
                         st.plotly_chart(fig, use_container_width=True)
         
@@ -562,14 +628,8 @@ if uploaded_file is not None:
             if col_armador is not None:
                 st.subheader("🏢 Análise por Armador")
                 
-                # Limpar e preparar dados do armador
-                df_cancel[col_armador] = df_cancel[col_armador].astype(str).str.strip().str.capitalize()
-                df_cancel[col_armador] = df_cancel[col_armador].replace('', 'Não Informado')
-                df_cancel[col_armador] = df_cancel[col_armador].replace('Nan', 'Não Informado')
-                df_cancel[col_armador] = df_cancel[col_armador].replace('None', 'Não Informado')
-                
-                contagem_armadores = df_cancel[col_armador].value_counts().reset_index()
-                contagem_armadores.columns = ['Armador', 'Cancelamentos']
+                # Armadores normalizados (vazio/Nan/None -> Não Informado) no pré-cálculo
+                contagem_armadores = pre.resultado("armadores")
                 
                 if not contagem_armadores.empty and len(contagem_armadores) > 0:
                     col1, col2 = st.columns(2)
@@ -591,33 +651,33 @@ if uploaded_file is not None:
 
                     with col2:
                         if len(contagem_armadores) >= 5:
-                            fig = px.bar(
-                                contagem_armadores.head(5),
+                            fig = figura_em_cache(
+                                px.bar, contagem_armadores.head(5),
                                 x='Armador',
                                 y='Cancelamentos',
                                 title='Top 5 Armadores com Mais Cancelamentos',
                                 color='Cancelamentos',
-                                color_continuous_scale='Viridis'
-                            )
-                            fig.update_layout(
-                                xaxis_title="Armador",
-                                yaxis_title="Quantidade de Cancelamentos",
-                                showlegend=False
+                                color_continuous_scale='Viridis',
+                                layout=dict(
+                                    xaxis_title="Armador",
+                                    yaxis_title="Quantidade de Cancelamentos",
+                                    showlegend=False,
+                                ),
                             )
                             st.plotly_chart(fig, use_container_width=True)
                         else:
-                            fig = px.bar(
-                                contagem_armadores,
+                            fig = figura_em_cache(
+                                px.bar, contagem_armadores,
                                 x='Armador',
                                 y='Cancelamentos',
                                 title='Armadores com Cancelamentos',
                                 color='Cancelamentos',
-                                color_continuous_scale='Viridis'
-                            )
-                            fig.update_layout(
-                                xaxis_title="Armador",
-                                yaxis_title="Quantidade de Cancelamentos",
-                                showlegend=False
+                                color_continuous_scale='Viridis',
+                                layout=dict(
+                                    xaxis_title="Armador",
+                                    yaxis_title="Quantidade de Cancelamentos",
+                                    showlegend=False,
+                                ),
                             )
                             st.plotly_chart(fig, use_container_width=True)
                     
@@ -631,12 +691,12 @@ if uploaded_file is not None:
                     
                     with col2:
                         # Gráfico de pizza para distribuição
-                        fig = px.pie(
-                            contagem_armadores.head(10),
+                        fig = figura_em_cache(
+                            px.pie, contagem_armadores.head(10),
                             values='Cancelamentos',
                             names='Armador',
                             title='Distribuição dos 10 Maiores Armadores',
-                            color_discrete_sequence=px.colors.qualitative.Set3
+                            color_discrete_sequence=px.colors.qualitative.Set3,
                         )
                         st.plotly_chart(fig, use_container_width=True)
                 else:
@@ -662,26 +722,11 @@ if uploaded_file is not None:
         with sub_tab1:
             st.subheader("⏱️ Tempo de Permanência no Porto")
             
-            # Verificar colunas necessárias
-            col_eta = 'Estimativa Chegada ETA' if 'Estimativa Chegada ETA' in df_cancel.columns else None
-            col_etd = 'Estimativa Saída ETD' if 'Estimativa Saída ETD' in df_cancel.columns else None
-            col_inicio = 'Início Operação' if 'Início Operação' in df_cancel.columns else None
-            col_fim = 'Fim Operação' if 'Fim Operação' in df_cancel.columns else None
+            # Tempo em horas (ETA/ETD ou início/fim de operação), já sem valores inválidos
+            permanencia = pre.resultado("permanencia")
             
-            if (col_eta and col_etd) or (col_inicio and col_fim):
-                # Converter datas
-                if col_eta and col_etd:
-                    df_cancel[col_eta] = pd.to_datetime(df_cancel[col_eta], errors='coerce')
-                    df_cancel[col_etd] = pd.to_datetime(df_cancel[col_etd], errors='coerce')
-                    df_cancel['Tempo_Permanencia'] = (df_cancel[col_etd] - df_cancel[col_eta]).dt.total_seconds() / 3600  # em horas
-                else:
-                    df_cancel[col_inicio] = pd.to_datetime(df_cancel[col_inicio], errors='coerce')
-                    df_cancel[col_fim] = pd.to_datetime(df_cancel[col_fim], errors='coerce')
-                    df_cancel['Tempo_Permanencia'] = (df_cancel[col_fim] - df_cancel[col_inicio]).dt.total_seconds() / 3600  # em horas
-                
-                # Remover valores inválidos
-                df_tempo = df_cancel.dropna(subset=['Tempo_Permanencia'])
-                df_tempo = df_tempo[df_tempo['Tempo_Permanencia'] > 0]
+            if permanencia is not None:
+                df_tempo = permanencia["tempos"]
                 
                 if not df_tempo.empty:
                     col1, col2 = st.columns(2)
@@ -692,33 +737,34 @@ if uploaded_file is not None:
                     
                     with col2:
                         # Boxplot
-                        fig = px.box(
-                            df_tempo,
+                        fig = figura_em_cache(
+                            px.box, df_tempo,
                             y='Tempo_Permanencia',
                             title='Distribuição do Tempo de Permanência',
-                            color_discrete_sequence=['#4CAF50']
+                            color_discrete_sequence=['#4CAF50'],
+                            layout=dict(
+                                    yaxis_title="Tempo (horas)",
+                            ),
                         )
-                        fig.update_layout(yaxis_title="Tempo (horas)")
                         st.plotly_chart(fig, use_container_width=True)
                     
                     # Análise por armador
                     if col_armador is not None:
                         st.subheader("Tempo de Permanência por Armador")
-                        tempo_por_armador = df_tempo.groupby(col_armador)['Tempo_Permanencia'].mean().reset_index()
-                        tempo_por_armador = tempo_por_armador.sort_values('Tempo_Permanencia', ascending=False)
+                        tempo_por_armador = permanencia["por_armador"]
                         
-                        fig = px.bar(
-                            tempo_por_armador.head(10),
+                        fig = figura_em_cache(
+                            px.bar, tempo_por_armador.head(10),
                             x=col_armador,
                             y='Tempo_Permanencia',
                             title='Top 10 Armadores por Tempo Médio de Permanência',
                             color='Tempo_Permanencia',
-                            color_continuous_scale='Viridis'
-                        )
-                        fig.update_layout(
-                            xaxis_title="Armador",
-                            yaxis_title="Tempo Médio (horas)",
-                            showlegend=False
+                            color_continuous_scale='Viridis',
+                            layout=dict(
+                                xaxis_title="Armador",
+                                yaxis_title="Tempo Médio (horas)",
+                                showlegend=False,
+                            ),
                         )
                         st.plotly_chart(fig, use_container_width=True)
                 else:
@@ -729,11 +775,8 @@ if uploaded_file is not None:
         with sub_tab2:
             st.subheader("🔄 Análise por Serviço")
             
-            col_servico = 'Serviço' if 'Serviço' in df_cancel.columns else None
-            if col_servico is not None:
-                contagem_servicos = df_cancel[col_servico].value_counts().reset_index()
-                contagem_servicos.columns = ['Serviço', 'Cancelamentos']
-                
+            contagem_servicos = pre.resultado("servicos")
+            if contagem_servicos is not None:
                 col1, col2 = st.columns(2)
                 with col1:
                     st.write("Top 10 Serviços com Mais Cancelamentos:")
@@ -745,12 +788,12 @@ if uploaded_file is not None:
                 
                 with col2:
                     # Gráfico de pizza
-                    fig = px.pie(
-                        contagem_servicos.head(10),
+                    fig = figura_em_cache(
+                        px.pie, contagem_servicos.head(10),
                         values='Cancelamentos',
                         names='Serviço',
                         title='Distribuição dos 10 Maiores Serviços',
-                        color_discrete_sequence=px.colors.qualitative.Set3
+                        color_discrete_sequence=px.colors.qualitative.Set3,
                     )
                     st.plotly_chart(fig, use_container_width=True)
             else:
@@ -761,8 +804,7 @@ if uploaded_file is not None:
             
             col_pais = 'País' if 'País' in df_cancel.columns else None
             if col_pais is not None:
-                contagem_paises = df_cancel[col_pais].value_counts().reset_index()
-                contagem_paises.columns = ['País', 'Cancelamentos']
+                contagem_paises = contar_top(col_pais, 'País')
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -775,18 +817,18 @@ if uploaded_file is not None:
                 
                 with col2:
                     # Gráfico de barras
-                    fig = px.bar(
-                        contagem_paises.head(10),
+                    fig = figura_em_cache(
+                        px.bar, contagem_paises.head(10),
                         x='País',
                         y='Cancelamentos',
                         title='Top 10 Países com Mais Cancelamentos',
                         color='Cancelamentos',
-                        color_continuous_scale='Viridis'
-                    )
-                    fig.update_layout(
-                        xaxis_title="País",
-                        yaxis_title="Quantidade de Cancelamentos",
-                        showlegend=False
+                        color_continuous_scale='Viridis',
+                        layout=dict(
+                            xaxis_title="País",
+                            yaxis_title="Quantidade de Cancelamentos",
+                            showlegend=False,
+                        ),
                     )
                     st.plotly_chart(fig, use_container_width=True)
             else:
@@ -799,26 +841,22 @@ if uploaded_file is not None:
             col_largura = 'Largura' if 'Largura' in df_cancel.columns else None
             
             if col_comprimento and col_largura:
-                # Converter para numérico
-                df_cancel[col_comprimento] = pd.to_numeric(df_cancel[col_comprimento], errors='coerce')
-                df_cancel[col_largura] = pd.to_numeric(df_cancel[col_largura], errors='coerce')
-                
-                # Remover valores inválidos
-                df_dimensoes = df_cancel.dropna(subset=[col_comprimento, col_largura])
+                # Dimensões numéricas, sem valores inválidos
+                df_dimensoes = pre.resultado("dimensoes")
                 
                 if not df_dimensoes.empty:
                     # Gráfico de dispersão
-                    fig = px.scatter(
-                        df_dimensoes,
+                    fig = figura_em_cache(
+                        px.scatter, df_dimensoes,
                         x=col_comprimento,
                         y=col_largura,
                         title='Relação entre Comprimento e Largura dos Navios',
                         color=col_status if col_status else None,
-                        color_discrete_sequence=px.colors.qualitative.Set3
-                    )
-                    fig.update_layout(
-                        xaxis_title="Comprimento",
-                        yaxis_title="Largura"
+                        color_discrete_sequence=px.colors.qualitative.Set3,
+                        layout=dict(
+                            xaxis_title="Comprimento",
+                            yaxis_title="Largura",
+                        ),
                     )
                     st.plotly_chart(fig, use_container_width=True)
                     
@@ -833,19 +871,16 @@ if uploaded_file is not None:
         with sub_tab5:
             st.subheader("📊 Correlação entre Variáveis Operacionais")
             
-            # Selecionar colunas numéricas
-            colunas_numericas = df_cancel.select_dtypes(include=[np.number]).columns.tolist()
+            # Correlação entre as colunas numéricas
+            corr_matrix = pre.resultado("correlacao")
             
-            if len(colunas_numericas) > 1:
-                # Calcular correlação
-                corr_matrix = df_cancel[colunas_numericas].corr()
-                
+            if corr_matrix is not None:
                 # Heatmap
-                fig = px.imshow(
-                    corr_matrix,
+                fig = figura_em_cache(
+                    px.imshow, corr_matrix,
                     title='Matriz de Correlação',
                     color_continuous_scale='RdBu',
-                    aspect='auto'
+                    aspect='auto',
                 )
                 st.plotly_chart(fig, use_container_width=True)
                 
@@ -860,8 +895,7 @@ if uploaded_file is not None:
             
             col_berco = 'Berço' if 'Berço' in df_cancel.columns else None
             if col_berco is not None:
-                contagem_bercos = df_cancel[col_berco].value_counts().reset_index()
-                contagem_bercos.columns = ['Berço', 'Cancelamentos']
+                contagem_bercos = contar_top(col_berco, 'Berço')
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -874,45 +908,76 @@ if uploaded_file is not None:
                 
                 with col2:
                     # Gráfico de barras horizontais
-                    fig = px.bar(
-                        contagem_bercos.head(10),
+                    fig = figura_em_cache(
+                        px.bar, contagem_bercos.head(10),
                         y='Berço',
                         x='Cancelamentos',
                         title='Top 10 Berços com Mais Cancelamentos',
                         color='Cancelamentos',
                         color_continuous_scale='Viridis',
-                        orientation='h'
-                    )
-                    fig.update_layout(
-                        yaxis_title="Berço",
-                        xaxis_title="Quantidade de Cancelamentos",
-                        showlegend=False
+                        orientation='h',
+                        layout=dict(
+                            yaxis_title="Berço",
+                            xaxis_title="Quantidade de Cancelamentos",
+                            showlegend=False,
+                        ),
                     )
                     st.plotly_chart(fig, use_container_width=True)
             else:
                 st.warning("⚠️ Coluna 'Berço' não encontrada nos dados.")
         
         with sub_tab7:
-            st.subheader("📅 Cancelamentos por Dia da Semana")
+            st.subheader("📅 Padrões de Calendário dos Cancelamentos")
             
-            if col_data is not None:
-                # Converter data e extrair dia da semana
-                df_cancel[col_data] = pd.to_datetime(df_cancel[col_data], errors='coerce')
-                df_cancel['Dia_Semana'] = df_cancel[col_data].dt.day_name()
-                
-                # Contagem por dia da semana
-                contagem_dias = df_cancel['Dia_Semana'].value_counts().reset_index()
-                contagem_dias.columns = ['Dia da Semana', 'Cancelamentos']
-                
-                # Ordenar dias da semana
-                ordem_dias = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-                contagem_dias['Dia da Semana'] = pd.Categorical(
-                    contagem_dias['Dia da Semana'],
-                    categories=ordem_dias,
-                    ordered=True
+            campos_data = [c for c in ('Estimativa Chegada ETA', 'Chegada na Barra ') if c in df.columns]
+            if campos_data and col_status is not None:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    campo_data = st.selectbox("Data", campos_data, format_func=str.strip)
+                with col2:
+                    padrao = st.selectbox("Padrão", list(PADROES_CALENDARIO))
+                with col3:
+                    divisao = st.selectbox(
+                        "Dividir por", ["Nenhum"] + [c for c in ('Armador', 'Berço') if c in df.columns]
+                    )
+                linhas, colunas = PADROES_CALENDARIO[padrao]
+                calendario = construir_calendario(
+                    chave_arquivo, df, campo_data, linhas, colunas, None if divisao == "Nenhum" else divisao
                 )
-                contagem_dias = contagem_dias.sort_values('Dia da Semana')
-                
+                grupo = None
+                if divisao != "Nenhum":
+                    grupo = st.selectbox(divisao, list(calendario.grupos))
+                normalizar = st.checkbox(
+                    "Normalizar pelas escalas programadas",
+                    help="Mostra a taxa de cancelamento de cada célula: cancelamentos ÷ escalas programadas."
+                )
+
+                # Matriz das escalas canceladas; a taxa divide pela das escalas programadas
+                cancelados = mask_cancel.to_numpy()
+                contagens = calendario.contar(cancelados, grupo)
+                if normalizar:
+                    tabela = calendario.tabela(calendario.taxa(cancelados, grupo) * 100).round(1)
+                    rotulo = "Taxa de cancelamento (%)"
+                else:
+                    tabela = calendario.tabela(contagens)
+                    rotulo = "Cancelamentos"
+
+                fig = figura_em_cache(
+                    px.imshow, tabela,
+                    title=f"{rotulo} — {padrao} ({campo_data.strip()})" + (f" — {grupo}" if grupo else ""),
+                    color_continuous_scale='Viridis',
+                    aspect='auto',
+                    labels=dict(color=rotulo),
+                    ajuste=ajustar_layout_grafico,
+                    altura=450,
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
+                # Totais por dia da semana a partir da mesma matriz
+                contagem_dias = pd.DataFrame({
+                    'Dia da Semana': DIAS_SEMANA,
+                    'Cancelamentos': contagens.sum(axis=1 if linhas == 'dia_semana' else 0),
+                })
                 col1, col2 = st.columns(2)
                 with col1:
                     st.write("Cancelamentos por Dia da Semana:")
@@ -924,18 +989,18 @@ if uploaded_file is not None:
                 
                 with col2:
                     # Gráfico de barras
-                    fig = px.bar(
-                        contagem_dias,
+                    fig = figura_em_cache(
+                        px.bar, contagem_dias,
                         x='Dia da Semana',
                         y='Cancelamentos',
                         title='Cancelamentos por Dia da Semana',
                         color='Cancelamentos',
-                        color_continuous_scale='Viridis'
-                    )
-                    fig.update_layout(
-                        xaxis_title="Dia da Semana",
-                        yaxis_title="Quantidade de Cancelamentos",
-                        showlegend=False
+                        color_continuous_scale='Viridis',
+                        layout=dict(
+                            xaxis_title="Dia da Semana",
+                            yaxis_title="Quantidade de Cancelamentos",
+                            showlegend=False,
+                        ),
                     )
                     st.plotly_chart(fig, use_container_width=True)
             else:
@@ -944,79 +1009,33 @@ if uploaded_file is not None:
         with sub_tab8:
             st.subheader("💰 Análise de Custos de Exportação")
             
-            # Parâmetros de custos
-            CUSTOS = {
-                "TEU":               1200.0,   # R$ / TEU (valor médio armadores Santos)
-                "OPERACAO_PORTO":    1150.0,   # R$ fixo (taxa de cancelamento terminal)
-                "DOCUMENTACAO":       950.0,   # R$ / operação (honorários despachante)
-                "ARMAZENAGEM_DIA":    575.0,   # R$ / TEU / dia (armazenagem média)
-                "ARMAZENAGEM_DIAS":      2,    # dias extras
-                "INSPECAO":            95.0    # R$ / cont. (scanner/fitossanitária)
-            }
-
-            def calcular_custos(df: pd.DataFrame,
-                              coluna_teu: str,
-                              coluna_data: str | None = None) -> pd.DataFrame:
-                """Adiciona colunas de custo e devolve cópia do dataframe."""
-                df = df.copy()
-
-                # TEUs numéricos
-                df[coluna_teu] = pd.to_numeric(df[coluna_teu], errors="coerce").fillna(0)
-
-                # Custos principais
-                df["C_TEUS"]     = df[coluna_teu] * CUSTOS["TEU"]          # THC
-                df["C_OPER"]     = CUSTOS["OPERACAO_PORTO"]                 # cancelamento terminal
-                df["C_DOC"]      = CUSTOS["DOCUMENTACAO"]                   # despachante
-
-                # Armazenagem (2 dias)
-                df["C_ARM"]      = (
-                    df[coluna_teu] * CUSTOS["ARMAZENAGEM_DIA"] * CUSTOS["ARMAZENAGEM_DIAS"]
-                )
-
-                # Inspeção
-                df["C_INSP"]     = CUSTOS["INSPECAO"]                       # scanner/fitossanitária
-
-                # Custo total
-                colunas_custos = ["C_TEUS", "C_OPER", "C_DOC", "C_ARM", "C_INSP"]
-                df["CUSTO_TOTAL"] = df[colunas_custos].sum(axis=1)
-
-                return df
-
             if col_conteineres is not None:
-                # Calcular custos
-                df_cancel = calcular_custos(df_cancel, col_conteineres, col_data)
+                # Custos calculados no pré-cálculo (mesmas regras de dados_navios)
+                custos = pre.resultado("custos")
 
                 # Métricas principais
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     st.metric("Custo Total Perdido",
-                            f"R$ {df_cancel['CUSTO_TOTAL'].sum():,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
+                            f"R$ {custos['total'].sum():,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
                 with col2:
                     st.metric("Custo Médio por Cancelamento",
-                            f"R$ {df_cancel['CUSTO_TOTAL'].mean():,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
+                            f"R$ {custos['total'].mean():,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
                 with col3:
                     st.metric("Total de TEUs Afetados",
-                            f"{df_cancel[col_conteineres].sum():,.0f}".replace(",", "."))
+                            f"{custos['teus']:,.0f}".replace(",", "."))
 
                 # Gráficos de distribuição e evolução temporal
                 st.plotly_chart(
-                    px.box(df_cancel, y="CUSTO_TOTAL",
+                    figura_em_cache(px.box, custos['total'].to_frame(), y="CUSTO_TOTAL",
                         title="Distribuição do Custo por Cancelamento",
                         labels={"CUSTO_TOTAL": "Custo Total (R$)"}),
                     use_container_width=True
                 )
 
-                if col_data is not None:
-                    df_cancel["Mes"] = pd.to_datetime(df_cancel[col_data]).dt.to_period("M")
-                    custos_mensais = (df_cancel.groupby("Mes")["CUSTO_TOTAL"]
-                                    .sum()
-                                    .reset_index()
-                                    .assign(Mes=lambda d: d["Mes"].astype(str)))
-
-                    custos_mensais["CUSTO_TOTAL"] = custos_mensais["CUSTO_TOTAL"].apply(lambda x: float(f"{x:.2f}"))
-
+                if custos['mensais'] is not None:
                     st.plotly_chart(
-                        px.line(custos_mensais, x="Mes", y="CUSTO_TOTAL",
+                        figura_em_cache(px.line, custos['mensais'], x="Mes", y="CUSTO_TOTAL",
                                 title="Evolução Mensal dos Custos", 
                                 markers=True,
                                 labels={"CUSTO_TOTAL": "Custo Total (R$)"}),
@@ -1025,8 +1044,7 @@ if uploaded_file is not None:
 
                 # Detalhamento dos componentes de custo
                 componentes = (
-                    df_cancel[["C_TEUS", "C_OPER", "C_DOC", "C_ARM", "C_INSP"]]
-                    .sum()
+                    custos['componentes']
                     .rename(index={
                         "C_TEUS": "THC (Terminal Handling Charge)",
                         "C_OPER": "Taxa de Cancelamento",
@@ -1062,7 +1080,7 @@ if uploaded_file is not None:
                     st.dataframe(componentes_formatado, hide_index=True, use_container_width=True)
                 with col2:
                     st.plotly_chart(
-                        px.pie(componentes, values="Valor Total (BRL)",
+                        figura_em_cache(px.pie, componentes, values="Valor Total (BRL)",
                             names="Tipo de Custo",
                             title="Distribuição dos Custos"),
                         use_container_width=True
@@ -1071,15 +1089,7 @@ if uploaded_file is not None:
                 # Análise por armador (se disponível)
                 if col_armador is not None:
                     st.subheader("Análise de Custos por Armador")
-                    custos_por_armador = (df_cancel.groupby(col_armador)["CUSTO_TOTAL"]
-                                        .agg(['sum', 'mean', 'count'])
-                                        .reset_index()
-                                        .rename(columns={
-                                            'sum': 'Custo Total',
-                                            'mean': 'Custo Médio',
-                                            'count': 'Quantidade'
-                                        })
-                                        .sort_values('Custo Total', ascending=False))
+                    custos_por_armador = custos['por_armador'].copy()
 
                     # Formatar valores monetários
                     custos_por_armador['Custo Total'] = custos_por_armador['Custo Total'].apply(lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
@@ -1098,18 +1108,18 @@ if uploaded_file is not None:
                         # Para o gráfico, remover o R$ e converter para float
                         custos_por_armador_graf = custos_por_armador.head(10).copy()
                         custos_por_armador_graf['Custo Total'] = custos_por_armador_graf['Custo Total'].str.replace('R$ ', '').str.replace('.', '').str.replace(',', '.').astype(float)
-                        fig = px.bar(
-                            custos_por_armador_graf,
+                        fig = figura_em_cache(
+                            px.bar, custos_por_armador_graf,
                             x=col_armador,
                             y='Custo Total',
                             title='Top 10 Armadores por Custo Total',
                             color='Custo Total',
-                            color_continuous_scale='Viridis'
-                        )
-                        fig.update_layout(
-                            xaxis_title="Armador",
-                            yaxis_title="Custo Total (BRL)",
-                            showlegend=False
+                            color_continuous_scale='Viridis',
+                            layout=dict(
+                                xaxis_title="Armador",
+                                yaxis_title="Custo Total (BRL)",
+                                showlegend=False,
+                            ),
                         )
                         st.plotly_chart(fig, use_container_width=True)
 
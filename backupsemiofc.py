@@ -22,6 +22,8 @@ import plotly.graph_objects as go
 from datetime import datetime
 import os
 
+from artefatos import cancelamentos, dataset, tabela_custos
+
 # Formatação de moeda BRL
 def br_currency(x: float) -> str:
     return f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
@@ -129,38 +131,31 @@ if not uploaded_file:
     st.warning("Por favor, carregue um arquivo Excel ou selecione o arquivo padrão para iniciar a análise.")
     st.stop()
 
-# Leitura e pré-processamento
-df = pd.read_excel(uploaded_file)
-df.columns = df.columns.str.strip()
+# Leitura e pré-processamento (apenas as colunas mapeadas, com nomes canônicos) pelo
+# armazém de artefatos, compartilhada entre sessões e processos pelo hash do conteúdo
+fonte = dataset(
+    default_file if use_default else uploaded_file,
+    ("navio", "status", "data", "etd", "rota", "servico", "armador", "conteineres")
+)
+df, colunas = fonte.valor
 
 # Mapeamento de colunas essenciais
-col_navio       = 'Navio / Viagem1'         if 'Navio / Viagem'         in df.columns else None
-col_status      = 'Situação'               if 'Situação'               in df.columns else None
-col_data        = 'Estimativa Chegada ETA' if 'Estimativa Chegada ETA' in df.columns else None
-col_etd         = 'Estimativa Saída ETD'   if 'Estimativa Saída ETD'   in df.columns else None
-col_rota        = 'De / Para'              if 'De / Para'              in df.columns else None
-col_servico     = 'Serviço'                if 'Serviço'                in df.columns else None
-col_armador     = 'Armador'                if 'Armador'                in df.columns else None
-col_conteineres = 'Movs'                   if 'Movs'                   in df.columns else None
+col_navio       = colunas.get("navio")
+col_status      = colunas.get("status")
+col_data        = colunas.get("data")
+col_etd         = colunas.get("etd")
+col_rota        = colunas.get("rota")
+col_servico     = colunas.get("servico")
+col_armador     = colunas.get("armador")
+col_conteineres = colunas.get("conteineres")
 
 if not col_navio or not col_status:
-    st.error("As colunas obrigatórias 'Navio / Viagem' e 'Situação' não foram encontradas.")
+    st.error("As colunas obrigatórias 'Navio / Viagem1' e 'Situação' não foram encontradas.")
     st.stop()
 
-# Filtrar apenas cancelamentos
-df[col_status] = df[col_status].astype(str).str.strip().str.lower()
-mask_cancel = df[col_status].isin(['cancelado','cancelada','rejeitado','rej.','canceled'])
-df_canc = df.loc[mask_cancel].copy()
-
-# Converter datas e extrair período mês-ano
-if col_data:
-    df_canc[col_data] = pd.to_datetime(df_canc[col_data], dayfirst=True, errors='coerce')
-    df_canc.dropna(subset=[col_data], inplace=True)
-    df_canc['Y-M'] = df_canc[col_data].dt.to_period('M').astype(str)
-
-# Converter TEUs para numérico
-if col_conteineres:
-    df_canc[col_conteineres] = pd.to_numeric(df_canc[col_conteineres], errors='coerce').fillna(0)
+# Filtrar apenas cancelamentos, com as datas convertidas e o período mês-ano
+# (etapa do armazém de artefatos, reaproveitada pelos outros scripts)
+cancelados = cancelamentos(fonte, col_status, col_data)
 
 # Calcular custos por cancelamento
 C = {
@@ -172,13 +167,10 @@ C = {
     "INSP": insp
 }
 
-if col_conteineres:
-    df_canc["C_TEUS"]      = df_canc[col_conteineres] * C["THC"]
-    df_canc["C_OPER"]      = C["OPER"]
-    df_canc["C_DOC"]       = C["DOC"]
-    df_canc["C_ARM"]       = df_canc[col_conteineres] * C["ARM_DAY"] * C["ARM_DAYS"]
-    df_canc["C_INSP"]      = C["INSP"]
-    df_canc["CUSTO_TOTAL"] = df_canc[["C_TEUS","C_OPER","C_DOC","C_ARM","C_INSP"]].sum(axis=1)
+# TEUs numéricos e colunas de custo, uma tabela por combinação de custos
+df_canc = (tabela_custos(cancelados, col_conteineres, C) if col_conteineres else cancelados).valor
+# Cópia rasa: os artefatos são compartilhados e as abas abaixo alteram colunas
+df_canc = df_canc.copy(deep=False)
 
 # Criação das abas
 tabs = st.tabs([
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de conjuntos de dados compartilhado entre as sessões do processo.
+
+Cada sessão do Streamlit que abre o arquivo padrão (ou envia a mesma
+planilha) passaria pela leitura completa. `ler_compartilhado` identifica o
+arquivo pelo hash do conteúdo, lê uma única vez e entrega a mesma instância
+a todas as sessões: cada chamada recebe uma cópia rasa, então, com
+copy-on-write, nenhuma sessão altera os dados vistos pelas outras.
+
+O cache é LRU com orçamento em bytes (memória dos DataFrames) e registra
+acertos, falhas e remoções. Leituras simultâneas da mesma chave esperam pela
+primeira em vez de ler de novo.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+ORCAMENTO_DADOS_BYTES = 512 * 1024 * 1024
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+# (caminho, mtime, tamanho) -> hash, para não reler o arquivo padrão a cada rerun
+_hashes_arquivos: dict[tuple, str] = {}
+
+
+def hash_conteudo(origem) -> str:
+    """Hash BLAKE2b do conteúdo de um caminho ou objeto de arquivo (volta ao início depois)."""
+    if isinstance(origem, (str, os.PathLike)):
+        info = os.stat(origem)
+        chave = (os.fspath(origem), info.st_mtime_ns, info.st_size)
+        if chave not in _hashes_arquivos:
+            with open(origem, "rb") as arquivo:
+                _hashes_arquivos[chave] = hash_conteudo(arquivo)
+        return _hashes_arquivos[chave]
+
+    h = hashlib.blake2b(digest_size=20)
+    if hasattr(origem, "getbuffer"):  # BytesIO / UploadedFile: conteúdo já em memória
+        h.update(origem.getbuffer())
+    else:
+        origem.seek(0)
+        for bloco in iter(lambda: origem.read(TAMANHO_BLOCO_HASH), b""):
+            h.update(bloco)
+    origem.seek(0)
+    return h.hexdigest()
+
+
+def tamanho_bytes(valor) -> int:
+    """Memória ocupada por DataFrames/Séries, também dentro de tuplas, listas e dicionários."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, dict):
+        return sum(tamanho_bytes(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(tamanho_bytes(v) for v in valor)
+    # Arrays e estruturas que informam o próprio tamanho (ex.: CuboDistintos, MatrizOD)
+    nbytes = getattr(valor, "nbytes", None)
+    return nbytes if isinstance(nbytes, int) else 0
+
+
+def _copia_rasa(valor):
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        return valor.copy(deep=False)
+    if isinstance(valor, tuple):
+        return tuple(_copia_rasa(v) for v in valor)
+    if isinstance(valor, list):
+        return [_copia_rasa(v) for v in valor]
+    if isinstance(valor, dict):
+        return {k: _copia_rasa(v) for k, v in valor.items()}
+    return valor
+
+
+class CacheDados:
+    """LRU de conjuntos de dados limitado pelo total de bytes, com leitura única por chave."""
+
+    def __init__(self, orcamento_bytes: int = ORCAMENTO_DADOS_BYTES):
+        self.orcamento_bytes = orcamento_bytes
+        self._entradas: OrderedDict[tuple, tuple] = OrderedDict()  # chave -> (valor, bytes)
+        self._trava = threading.Lock()
+        self._carregando: dict[tuple, threading.Lock] = {}
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def _buscar(self, chave):
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return entrada[0]
+        return None
+
+    def obter(self, chave: tuple, carregar):
+        """Valor da chave; `carregar()` roda só na primeira vez, mesmo com sessões concorrentes."""
+        valor = self._buscar(chave)
+        if valor is not None:
+            return _copia_rasa(valor)
+
+        with self._trava:
+            trava_chave = self._carregando.setdefault(chave, threading.Lock())
+        with trava_chave:
+            # Outra sessão pode ter terminado a leitura enquanto esperávamos
+            valor = self._buscar(chave)
+            if valor is None:
+                valor = carregar()
+                self._guardar(chave, valor)
+        with self._trava:
+            self._carregando.pop(chave, None)
+        return _copia_rasa(valor)
+
+    def _guardar(self, chave, valor):
+        tamanho = tamanho_bytes(valor)
+        with self._trava:
+            self.falhas += 1
+            if tamanho > self.orcamento_bytes:
+                return
+            self._entradas[chave] = (valor, tamanho)
+            self.bytes += tamanho
+            # Descarta os menos usados até caber no orçamento
+            while self.bytes > self.orcamento_bytes:
+                _, (_, removido) = self._entradas.popitem(last=False)
+                self.bytes -= removido
+                self.remocoes += 1
+
+    def estatisticas(self) -> dict:
+        with self._trava:
+            return {"conjuntos": len(self._entradas), "bytes": self.bytes, "acertos": self.acertos,
+                    "falhas": self.falhas, "remocoes": self.remocoes}
+
+
+_cache = CacheDados()
+
+
+def ler_compartilhado(origem, leitor, *parametros, cache: CacheDados | None = None):
+    """`leitor(origem, *parametros)` com o resultado compartilhado por hash do conteúdo.
+
+    `parametros` (ex.: os campos lidos) entram na chave junto com o nome do
+    leitor, então leituras diferentes do mesmo arquivo não se confundem.
+    """
+    cache = _cache if cache is None else cache
+    chave = (hash_conteudo(origem), f"{leitor.__module__}.{leitor.__qualname__}", *parametros)
+
+    def carregar():
+        try:
+            return leitor(origem, *parametros)
+        finally:
+            if hasattr(origem, "seek"):
+                origem.seek(0)
+
+    return cache.obter(chave, carregar)
+
+
+def obter_compartilhado(chave: tuple, carregar, cache: CacheDados | None = None):
+    """Como `ler_compartilhado`, para fontes sem arquivo único (ex.: dataset particionado)."""
+    return (_cache if cache is None else cache).obter(chave, carregar)
+
+
+def consultar_compartilhado(chave: tuple, cache: CacheDados | None = None):
+    """Valor da chave se já estiver no cache compartilhado, ou None (nada é carregado)."""
+    valor = (_cache if cache is None else cache)._buscar(chave)
+    return None if valor is None else _copia_rasa(valor)
+
+
+def estatisticas() -> dict:
+    """Conjuntos, bytes, acertos, falhas e remoções do cache compartilhado."""
+    return _cache.estatisticas()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de figuras Plotly entre reruns do Streamlit.
+
+A cada interação o Streamlit reexecuta o script inteiro e todas as figuras
+(`px.bar`, `px.pie`, `px.line`...) são montadas e validadas de novo, mesmo
+com os dados inalterados. `figura_em_cache` identifica cada figura por um
+hash do agregado de entrada, do tipo de gráfico, dos parâmetros, do ajuste
+de layout/altura e do tema do Plotly, e guarda o JSON já validado. Num
+acerto a figura é reconstruída desse JSON sem validação, pulando a montagem.
+
+O cache é LRU com orçamento em bytes (tamanho do JSON das figuras) e é
+compartilhado por todas as sessões do processo.
+"""
+
+import hashlib
+import json
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+ORCAMENTO_FIGURAS_BYTES = 64 * 1024 * 1024
+
+
+class CacheFiguras:
+    """LRU de JSON de figuras limitado pelo total de bytes."""
+
+    def __init__(self, orcamento_bytes: int = ORCAMENTO_FIGURAS_BYTES):
+        self.orcamento_bytes = orcamento_bytes
+        self._entradas: OrderedDict[str, str] = OrderedDict()
+        self._trava = threading.Lock()
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    def obter(self, chave: str) -> str | None:
+        with self._trava:
+            figura_json = self._entradas.get(chave)
+            if figura_json is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return figura_json
+
+    def guardar(self, chave: str, figura_json: str):
+        tamanho = len(figura_json)
+        if tamanho > self.orcamento_bytes:
+            return
+        with self._trava:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior)
+            self._entradas[chave] = figura_json
+            self.bytes += tamanho
+            # Descarta as menos usadas até caber no orçamento
+            while self.bytes > self.orcamento_bytes:
+                _, removida = self._entradas.popitem(last=False)
+                self.bytes -= len(removida)
+
+    def limpar(self):
+        with self._trava:
+            self._entradas.clear()
+            self.bytes = 0
+
+
+_cache = CacheFiguras()
+
+
+def _alimentar(h, valor):
+    """Acrescenta ao hash o conteúdo de `valor` (DataFrames, arrays, coleções e escalares)."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        if isinstance(valor, pd.DataFrame):
+            h.update(repr((list(valor.columns), list(valor.dtypes))).encode())
+        else:
+            h.update(repr((valor.name, valor.dtype)).encode())
+        try:
+            h.update(pd.util.hash_pandas_object(valor, index=True).to_numpy().tobytes())
+        except TypeError:  # células não hasheáveis (listas, dicionários)
+            h.update(pickle.dumps(valor))
+    elif isinstance(valor, np.ndarray):
+        h.update(repr((valor.dtype, valor.shape)).encode())
+        h.update(np.ascontiguousarray(valor).tobytes() if valor.dtype != object else pickle.dumps(valor))
+    elif isinstance(valor, dict):
+        for chave in sorted(valor, key=str):
+            h.update(repr(chave).encode())
+            _alimentar(h, valor[chave])
+    elif isinstance(valor, (list, tuple)):
+        h.update(f"{type(valor).__name__}[{len(valor)}]".encode())
+        for item in valor:
+            _alimentar(h, item)
+    elif callable(valor):
+        h.update(f"{getattr(valor, '__module__', '')}.{getattr(valor, '__qualname__', repr(valor))}".encode())
+    else:
+        h.update(repr(valor).encode())
+    h.update(b"\x1f")
+
+
+def chave_figura(construtor, dados, parametros: dict) -> str:
+    """Hash do agregado, do construtor, dos parâmetros e do tema padrão do Plotly."""
+    h = hashlib.sha1()
+    _alimentar(h, construtor)
+    _alimentar(h, pio.templates.default)
+    _alimentar(h, dados)
+    _alimentar(h, parametros)
+    return h.hexdigest()
+
+
+def figura_em_cache(construtor, dados=None, *, layout: dict | None = None, ajuste=None,
+                    altura: int | None = None, cache: CacheFiguras | None = None, **parametros) -> go.Figure:
+    """Figura de `construtor(dados, **parametros)`, montada só quando não está no cache.
+
+    `layout` vai para `fig.update_layout` e `ajuste(fig, altura)` (ex.:
+    `ajustar_layout_grafico`) é aplicado em seguida; ambos entram na chave.
+    """
+    cache = _cache if cache is None else cache
+    chave = chave_figura(construtor, dados, {**parametros, "_layout": layout, "_ajuste": ajuste, "_altura": altura})
+    figura_json = cache.obter(chave)
+    if figura_json is not None:
+        # O JSON veio de uma figura já validada; reconstruir sem validar é ~10x mais rápido
+        return go.Figure(json.loads(figura_json), _validate=False)
+
+    fig = construtor(**parametros) if dados is None else construtor(dados, **parametros)
+    if layout:
+        fig.update_layout(**layout)
+    if ajuste is not None:
+        fig = ajuste(fig) if altura is None else ajuste(fig, altura)
+    cache.guardar(chave, fig.to_json())
+    return fig
+
+
+def estatisticas() -> dict:
+    """Figuras, bytes, acertos e falhas do cache compartilhado."""
+    return {"figuras": len(_cache), "bytes": _cache.bytes, "acertos": _cache.acertos, "falhas": _cache.falhas}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Comparação entre dois snapshots da programação de navios.
+
+Cada exportação da programação é um retrato do porto. `comparar_snapshots`
+junta dois retratos pela chave da viagem com uma tabela hash
+(`pd.Index.get_indexer`) e devolve, de forma vetorizada, as transições de
+situação (ex.: programado -> cancelado), os deslocamentos de ETA/ETD em horas
+e as escalas que entraram ou saíram da programação.
+
+Viagens repetidas no mesmo arquivo são pareadas pela ordem de ocorrência.
+"""
+
+import numpy as np
+import pandas as pd
+
+from dados_navios import VALORES_CANCELADOS, para_datas
+
+CHAVE_VIAGEM = 'Navio / Viagem'
+COL_NAVIO = 'Navio / Viagem1'
+COL_STATUS = 'Situação'
+COL_ETA = 'Estimativa Chegada ETA'
+COL_ETD = 'Estimativa Saída ETD'
+
+
+def _chaves(df: pd.DataFrame, col_chave: str) -> pd.Index:
+    viagem = df[col_chave].astype("string").str.strip().fillna("")
+    ocorrencia = viagem.groupby(viagem, sort=False).cumcount().astype("string")
+    return pd.Index(viagem + "#" + ocorrencia)
+
+
+def _datas(df: pd.DataFrame, coluna: str | None) -> pd.Series:
+    if coluna is None or coluna not in df.columns:
+        return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    return para_datas(df[coluna])
+
+
+def _situacao(df: pd.DataFrame, col_status: str) -> pd.Series:
+    return df[col_status].astype(str).str.strip().str.lower()
+
+
+def comparar_snapshots(anterior: pd.DataFrame, atual: pd.DataFrame, col_chave: str = CHAVE_VIAGEM,
+                       col_status: str = COL_STATUS, col_eta: str = COL_ETA, col_etd: str = COL_ETD,
+                       col_navio: str = COL_NAVIO) -> dict:
+    """Compara dois snapshots e devolve um dicionário de DataFrames.
+
+    Chaves: 'comuns' (viagens nos dois arquivos, com situação e datas antes/depois),
+    'mudancas' (as comuns que mudaram de situação), 'transicoes' (contagem por par
+    de situações), 'novos_cancelamentos', 'adicionadas' e 'removidas'.
+    """
+    chaves_ant, chaves_atu = _chaves(anterior, col_chave), _chaves(atual, col_chave)
+
+    # Junção hash: posição de cada viagem atual no snapshot anterior (-1 = nova)
+    pos_ant = chaves_ant.get_indexer(chaves_atu)
+    comum = pos_ant >= 0
+    idx_atu = np.flatnonzero(comum)
+    idx_ant = pos_ant[comum]
+
+    sit_ant = _situacao(anterior, col_status).to_numpy()
+    sit_atu = _situacao(atual, col_status).to_numpy()
+    eta_ant, eta_atu = _datas(anterior, col_eta).to_numpy(), _datas(atual, col_eta).to_numpy()
+    etd_ant, etd_atu = _datas(anterior, col_etd).to_numpy(), _datas(atual, col_etd).to_numpy()
+    horas = np.timedelta64(1, "h")
+
+    comuns = pd.DataFrame({
+        "Viagem": atual[col_chave].to_numpy()[idx_atu],
+        "Navio": atual[col_navio].to_numpy()[idx_atu] if col_navio in atual.columns else None,
+        "Situação anterior": sit_ant[idx_ant],
+        "Situação atual": sit_atu[idx_atu],
+        "ETA anterior": eta_ant[idx_ant],
+        "ETA atual": eta_atu[idx_atu],
+        "Δ ETA (h)": (eta_atu[idx_atu] - eta_ant[idx_ant]) / horas,
+        "ETD anterior": etd_ant[idx_ant],
+        "ETD atual": etd_atu[idx_atu],
+        "Δ ETD (h)": (etd_atu[idx_atu] - etd_ant[idx_ant]) / horas,
+    })
+
+    mudou = comuns["Situação anterior"].to_numpy() != comuns["Situação atual"].to_numpy()
+    mudancas = comuns.loc[mudou]
+    transicoes = (
+        mudancas.groupby(["Situação anterior", "Situação atual"]).size()
+        .reset_index(name="Viagens")
+        .sort_values("Viagens", ascending=False, ignore_index=True)
+    )
+    novos_cancelamentos = mudancas.loc[
+        mudancas["Situação atual"].isin(VALORES_CANCELADOS)
+        & ~mudancas["Situação anterior"].isin(VALORES_CANCELADOS)
+    ]
+
+    # Viagens do snapshot anterior que não aparecem no atual
+    presentes = np.zeros(len(anterior), dtype=bool)
+    presentes[idx_ant] = True
+
+    return {
+        "comuns": comuns,
+        "mudancas": mudancas.reset_index(drop=True),
+        "transicoes": transicoes,
+        "novos_cancelamentos": novos_cancelamentos.reset_index(drop=True),
+        "adicionadas": atual.iloc[np.flatnonzero(~comum)].reset_index(drop=True),
+        "removidas": anterior.iloc[np.flatnonzero(~presentes)].reset_index(drop=True),
+    }
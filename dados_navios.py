@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Regras comuns de preparação dos dados de programação de navios.
+
+Centraliza o filtro de cancelamentos, a conversão de datas e o cálculo de
+custos usados pelo dashboard (`app.py`), pelo script de análise
+(`analise_navios.py`) e pelo processamento em lotes
+(`processamento_lotes.py`), para que todos produzam os mesmos números.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Valores da coluna 'Situação' considerados cancelamento
+VALORES_CANCELADOS = ['cancelado', 'cancelada', 'rejeitado', 'rej.', 'canceled']
+
+# Custos de referência 2024-25 (mesmas chaves da sidebar do dashboard)
+CUSTOS_PADRAO = {
+    "THC": 1200.0,      # R$ / TEU
+    "OPER": 1150.0,     # R$ / cancelamento (taxa do terminal)
+    "DOC": 950.0,       # R$ / operação (despachante)
+    "ARM_DAY": 575.0,   # R$ / TEU / dia
+    "ARM_DAYS": 2,      # dias de armazenagem
+    "INSP": 95.0        # R$ / contêiner (scanner)
+}
+
+COLUNAS_CUSTO = ["C_TEUS", "C_OPER", "C_DOC", "C_ARM", "C_INSP"]
+
+# Formato das datas nas exportações; o que não casar cai na conversão genérica (dia primeiro)
+FORMATO_DATA = '%d/%m/%Y %H:%M'
+
+
+def mascara_cancelamento(status: pd.Series) -> pd.Series:
+    """Devolve a máscara booleana das linhas com situação de cancelamento."""
+    return status.astype(str).str.strip().str.lower().isin(VALORES_CANCELADOS)
+
+
+def filtrar_cancelamentos(df: pd.DataFrame, col_status: str) -> pd.DataFrame:
+    """Devolve apenas as linhas canceladas, com a coluna de status normalizada.
+
+    O `df` de entrada não é alterado; a seleção por máscara já produz um
+    DataFrame próprio, então não há cópia extra.
+    """
+    status = df[col_status].astype(str).str.strip().str.lower()
+    cancelados = status.isin(VALORES_CANCELADOS)
+    df_canc = df.loc[cancelados]
+    df_canc[col_status] = status[cancelados]
+    return df_canc
+
+
+def preparar_cancelamentos(df: pd.DataFrame, col_status: str, col_data: str | None = None,
+                           convertidas: dict | None = None, mascara=None) -> pd.DataFrame:
+    """Cancelamentos com datas convertidas e 'Y-M', copiando só as linhas canceladas.
+
+    Equivale a `filtrar_cancelamentos` + `converter_datas`, mas monta cada
+    coluna uma única vez a partir das posições selecionadas. `convertidas`
+    (coluna -> Série já convertida, ex. da validação) substitui as colunas
+    brutas e `mascara` restringe as linhas antes do filtro.
+    """
+    convertidas = convertidas or {}
+    status = df[col_status].astype(str).str.strip().str.lower()
+    selecao = status.isin(VALORES_CANCELADOS).to_numpy()
+    if mascara is not None:
+        selecao = selecao & mascara
+    datas = None
+    if col_data:
+        datas = convertidas.get(col_data)
+        if datas is None:
+            datas = para_datas(df[col_data])
+            convertidas = {**convertidas, col_data: datas}
+        selecao = selecao & datas.notna().to_numpy()
+    linhas = np.flatnonzero(selecao)
+
+    colunas = {}
+    for coluna in df.columns:
+        origem = status if coluna == col_status else convertidas.get(coluna, df[coluna])
+        colunas[coluna] = origem.take(linhas).reset_index(drop=True)
+    df_canc = pd.DataFrame(colunas).set_axis(df.index[linhas])
+    if col_data:
+        df_canc['Y-M'] = df_canc[col_data].dt.to_period('M').astype(str)
+    return df_canc
+
+
+def para_datas(serie: pd.Series) -> pd.Series:
+    """Converte uma coluna de datas, tentando primeiro o formato das exportações."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    datas = pd.to_datetime(serie, format=FORMATO_DATA, errors='coerce')
+    falhas = datas.isna() & serie.notna()
+    if falhas.any():
+        datas[falhas] = pd.to_datetime(serie[falhas], dayfirst=True, errors='coerce')
+    return datas
+
+
+def converter_datas(df: pd.DataFrame, col_data: str) -> pd.DataFrame:
+    """Converte a coluna de data, descarta datas inválidas e cria a coluna 'Y-M'."""
+    df[col_data] = pd.to_datetime(df[col_data], dayfirst=True, errors='coerce')
+    df.dropna(subset=[col_data], inplace=True)
+    df['Y-M'] = df[col_data].dt.to_period('M').astype(str)
+    return df
+
+
+def custo_por_cancelamento(teus: pd.Series, custos: dict | None = None) -> pd.Series:
+    """Custo total de cada cancelamento ('CUSTO_TOTAL') sem materializar as colunas de componentes."""
+    c = CUSTOS_PADRAO if custos is None else custos
+    teus = pd.to_numeric(teus, errors='coerce').fillna(0)
+    # Mesma ordem de soma de `calcular_custos` (C_TEUS + C_OPER + C_DOC + C_ARM + C_INSP)
+    return (teus * c["THC"] + c["OPER"] + c["DOC"] + teus * c["ARM_DAY"] * c["ARM_DAYS"] + c["INSP"]).rename("CUSTO_TOTAL")
+
+
+def calcular_custos(df: pd.DataFrame, col_teus: str, custos: dict | None = None) -> pd.DataFrame:
+    """Converte os TEUs para numérico e adiciona as colunas de custo por cancelamento."""
+    c = CUSTOS_PADRAO if custos is None else custos
+    df[col_teus] = pd.to_numeric(df[col_teus], errors='coerce').fillna(0)
+    df["C_TEUS"] = df[col_teus] * c["THC"]
+    df["C_OPER"] = c["OPER"]
+    df["C_DOC"] = c["DOC"]
+    df["C_ARM"] = df[col_teus] * c["ARM_DAY"] * c["ARM_DAYS"]
+    df["C_INSP"] = c["INSP"]
+    df["CUSTO_TOTAL"] = df[COLUNAS_CUSTO].sum(axis=1)
+    return df
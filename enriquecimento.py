@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Tabelas versionadas de aliases e enriquecimento para Armador, País e Serviço.
+
+A planilha traz rótulos truncados e inconsistentes (`GERMANY, FEDERAL REPU`,
+códigos de armador misturados com nomes, `UCLA ` com espaço sobrando...).
+Cada tabela resolve um rótulo bruto para um rótulo canônico e um atributo
+derivado:
+
+- Armador -> nome do armador e aliança (`Aliança`)
+- País    -> nome do país (bandeira) e região (`Região`)
+- Serviço -> nome do serviço e rota comercial (`Rota Comercial`)
+
+`enriquecer` aplica as tabelas como um remapeamento de códigos categóricos:
+a consulta acontece uma vez por categoria distinta e as linhas só trocam de
+código (uma indexação inteira), então agrupar pelos atributos enriquecidos
+custa o mesmo que agrupar pela coluna original. Rótulos fora das tabelas
+mantêm o texto normalizado e recebem o atributo 'Não Mapeado'.
+
+Ao editar uma tabela, incremente `VERSAO_TABELAS`: a versão entra na chave
+dos caches do dashboard.
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+VERSAO_TABELAS = "2025.2"
+
+NAO_INFORMADO = "Não Informado"
+NAO_MAPEADO = "Não Mapeado"
+
+# Código do armador -> (nome, aliança)
+ARMADORES = {
+    "MSC":   ("MSC", "MSC (independente)"),
+    "MSK":   ("Maersk", "Gemini Cooperation"),
+    "HLC":   ("Hapag-Lloyd", "Gemini Cooperation"),
+    "ALI":   ("Aliança", "Gemini Cooperation"),
+    "HSG":   ("Hamburg Süd", "Gemini Cooperation"),
+    "CMA":   ("CMA CGM", "Ocean Alliance"),
+    "MER":   ("Mercosul Line", "Ocean Alliance"),
+    "COSCO": ("COSCO", "Ocean Alliance"),
+    "LOG":   ("Log-In", "Independente"),
+    "BBC":   ("BBC Chartering", "Independente"),
+    "SAGA":  ("Saga Welco", "Independente"),
+    "CCO":   ("COSCO Specialized Carriers", "Independente"),
+    "CSSC":  ("CSSC Shipping", "Independente"),
+    "CLC":   ("CLC", "Independente"),
+    "GOC":   ("G2 Ocean", "Independente"),
+    "ZPM":   ("ZPMC", "Independente"),
+    "MDL":   ("MDL", "Independente"),
+    "UKN":   (NAO_INFORMADO, NAO_INFORMADO),
+    "TBN":   (NAO_INFORMADO, NAO_INFORMADO),
+}
+ALIASES_ARMADORES = {
+    "MCS": "MSC",
+    "MEDITERRANEAN SHIPPING COMPANY": "MSC",
+    "MAERSK": "MSK",
+    "MAERSK LINE": "MSK",
+    "HAPAG-LLOYD": "HLC",
+    "HAPAG LLOYD": "HLC",
+    "ALIANCA": "ALI",
+    "HAMBURG SUD": "HSG",
+    "CMA CGM": "CMA",
+    "MERCOSUL LINE": "MER",
+    "COSCO SHIPPING": "COSCO",
+    "CSL": "COSCO",
+    "COSCO SHIPPING LINES": "COSCO",
+    "G2 OCEAN": "GOC",
+    "ZPMC": "ZPM",
+    "LOG-IN": "LOG",
+    "LOG IN": "LOG",
+    "TO BE NOMINATED": "TBN",
+    "UNKNOWN": "UKN",
+}
+
+# País (como vem da planilha) -> (nome, região)
+PAISES = {
+    "BRASIL":              ("Brasil", "América do Sul"),
+    "LIBERIA":             ("Libéria", "África"),
+    "MALTA":               ("Malta", "Europa"),
+    "GERMANY":             ("Alemanha", "Europa"),
+    "PANAMA":              ("Panamá", "América Central e Caribe"),
+    "SINGAPORE":           ("Singapura", "Ásia"),
+    "HONG KONG":           ("Hong Kong", "Ásia"),
+    "PORTUGAL":            ("Portugal", "Europa"),
+    "CYPRUS":              ("Chipre", "Europa"),
+    "MARSHALL ISLANDS":    ("Ilhas Marshall", "Oceania"),
+    "CHINA":               ("China", "Ásia"),
+    "ANTIGUA AND BARBUDA": ("Antígua e Barbuda", "América Central e Caribe"),
+    "BAHAMAS":             ("Bahamas", "América Central e Caribe"),
+    "NORWAY":              ("Noruega", "Europa"),
+    "KOREA, REPUBLIC OF":  ("Coreia do Sul", "Ásia"),
+    "NETHERLANDS":         ("Países Baixos", "Europa"),
+    "DENMARK":             ("Dinamarca", "Europa"),
+    "UNITED KINGDOM":      ("Reino Unido", "Europa"),
+    "BELIZE":              ("Belize", "América Central e Caribe"),
+    "UNITED STATES":       ("Estados Unidos", "América do Norte"),
+    "FINLAND":             ("Finlândia", "Europa"),
+    "LITHUANIA":           ("Lituânia", "Europa"),
+    "BARBADOS":            ("Barbados", "América Central e Caribe"),
+}
+ALIASES_PAISES = {
+    "BRAZIL": "BRASIL",
+    "GERMANY, FEDERAL REPU": "GERMANY",
+    "GERMANY, FEDERAL REPUBLIC OF": "GERMANY",
+    "ALEMANHA": "GERMANY",
+    "KOREA, REPUBLIC": "KOREA, REPUBLIC OF",
+    "SOUTH KOREA": "KOREA, REPUBLIC OF",
+    "THE NETHERLANDS": "NETHERLANDS",
+    "HOLLAND": "NETHERLANDS",
+    "UNITED STATES OF AMERICA": "UNITED STATES",
+    "USA": "UNITED STATES",
+    "ANTIGUA & BARBUDA": "ANTIGUA AND BARBUDA",
+}
+
+# Serviço -> (nome, rota comercial)
+SERVICOS = {
+    "NWC/SAEC/ECX I EUROPA": ("NWC/SAEC/ECX I Europa", "América do Sul - Norte da Europa"),
+    "WMED - MSE":            ("WMED - MSE", "América do Sul - Mediterrâneo"),
+    "BOSSA NOVA":            ("Bossa Nova", "América do Sul - Mediterrâneo"),
+    "NEW TANGO / SEC":       ("New Tango / SEC", "América do Sul - Norte da Europa"),
+    "USA - STRING 1":        ("USA - String 1", "América do Sul - América do Norte"),
+    "BRAZEX":                ("Brazex", "América do Sul - América do Norte"),
+    "BRAZEX 2":              ("Brazex 2", "América do Sul - América do Norte"),
+    "UCLA":                  ("UCLA", "América do Sul - América do Norte"),
+    "COSCO":                 ("COSCO", "América do Sul - Ásia"),
+    "ATLANTICO SUL":         ("Atlântico Sul", "Cabotagem / Mercosul"),
+    "ALCT SLING 1 N":        ("ALCT Sling 1 N", "Cabotagem / Mercosul"),
+    "ALCT SLING 1 S":        ("ALCT Sling 1 S", "Cabotagem / Mercosul"),
+    "ALCT SLING 2 N":        ("ALCT Sling 2 N", "Cabotagem / Mercosul"),
+    "ALCT SLING 2 S":        ("ALCT Sling 2 S", "Cabotagem / Mercosul"),
+    "MANAUS":                ("Manaus", "Cabotagem / Mercosul"),
+    "SANTANA":               ("Santana", "Cabotagem / Mercosul"),
+    "SEA NB":                ("SEA NB", "Cabotagem / Mercosul"),
+    "SEA SB":                ("SEA SB", "Cabotagem / Mercosul"),
+    "NEXCO":                 ("Nexco", "Cabotagem / Mercosul"),
+    "TRAMP":                 ("Tramp", "Tramp (sem linha regular)"),
+    "EXTRA CALL":            ("Extra Call", "Escala extra"),
+}
+ALIASES_SERVICOS = {
+    "NWC / SAEC / ECX I EUROPA": "NWC/SAEC/ECX I EUROPA",
+    "WMED-MSE": "WMED - MSE",
+    "USA-STRING 1": "USA - STRING 1",
+    "ATLANTICO-SUL": "ATLANTICO SUL",
+    "NEW TANGO/SEC": "NEW TANGO / SEC",
+}
+
+
+def normalizar_rotulo(valor) -> str:
+    """Maiúsculas, sem acentos e com espaços simples, para a consulta nas tabelas."""
+    texto = unicodedata.normalize("NFKD", str(valor)).encode("ascii", "ignore").decode()
+    return re.sub(r"\s+", " ", texto).strip().upper()
+
+
+class TabelaEnriquecimento:
+    """Tabela de aliases de um campo: rótulo bruto -> (rótulo canônico, atributo)."""
+
+    def __init__(self, campo: str, atributo: str, registros: dict, aliases: dict):
+        self.campo = campo
+        self.atributo = atributo
+        self.registros = {normalizar_rotulo(k): v for k, v in registros.items()}
+        self.aliases = {normalizar_rotulo(k): normalizar_rotulo(v) for k, v in aliases.items()}
+
+    def resolver(self, valor) -> tuple[str, str]:
+        if pd.isna(valor) or not str(valor).strip():
+            return NAO_INFORMADO, NAO_INFORMADO
+        chave = normalizar_rotulo(valor)
+        chave = self.aliases.get(chave, chave)
+        return self.registros.get(chave, (re.sub(r"\s+", " ", str(valor)).strip(), NAO_MAPEADO))
+
+
+TABELAS = {
+    "armador": TabelaEnriquecimento("armador", "Aliança", ARMADORES, ALIASES_ARMADORES),
+    "pais":    TabelaEnriquecimento("pais", "Região", PAISES, ALIASES_PAISES),
+    "servico": TabelaEnriquecimento("servico", "Rota Comercial", SERVICOS, ALIASES_SERVICOS),
+}
+ATRIBUTOS = tuple(tabela.atributo for tabela in TABELAS.values())
+
+
+def _recodificar(codigos: np.ndarray, valores: list[str]) -> pd.Categorical:
+    """Categorical das linhas a partir de um valor por categoria antiga.
+
+    `valores` traz um último elemento para as linhas ausentes: o código -1
+    indexa justamente essa posição.
+    """
+    novos, categorias = pd.factorize(pd.Index(valores, dtype=object), sort=True)
+    return pd.Categorical.from_codes(novos[codigos], categorias).remove_unused_categories()
+
+
+def remapear(serie: pd.Series, tabela: TabelaEnriquecimento) -> tuple[pd.Series, pd.Series]:
+    """Rótulos canônicos e atributo de `serie`, com uma consulta por categoria distinta."""
+    categorica = serie.astype("category")
+    resolvidos = [tabela.resolver(valor) for valor in categorica.cat.categories]
+    resolvidos.append((NAO_INFORMADO, NAO_INFORMADO))
+    codigos = categorica.cat.codes.to_numpy()
+    rotulos = _recodificar(codigos, [rotulo for rotulo, _ in resolvidos])
+    atributos = _recodificar(codigos, [atributo for _, atributo in resolvidos])
+    return (pd.Series(rotulos, index=serie.index, name=serie.name),
+            pd.Series(atributos, index=serie.index, name=tabela.atributo))
+
+
+def enriquecer(df: pd.DataFrame, colunas: dict) -> pd.DataFrame:
+    """`df` com Armador, País e Serviço canônicos e as colunas Aliança, Região e Rota Comercial.
+
+    `colunas` é o mapa campo lógico -> coluna de `mapeamento_colunas`; campos
+    ausentes são ignorados. As demais colunas são compartilhadas com `df`.
+    """
+    novas = {}
+    for campo, tabela in TABELAS.items():
+        coluna = colunas.get(campo)
+        if coluna and coluna in df.columns:
+            novas[coluna], novas[tabela.atributo] = remapear(df[coluna], tabela)
+    return df.assign(**novas) if novas else df
+
+
+def cobertura(df: pd.DataFrame) -> dict[str, float]:
+    """Fração das linhas com rótulo encontrado nas tabelas, por atributo enriquecido."""
+    return {atributo: float((df[atributo] != NAO_MAPEADO).mean())
+            for atributo in ATRIBUTOS if atributo in df.columns and len(df)}
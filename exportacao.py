@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Exportação em fluxo de tabelas para Parquet, CSV e XLSX.
+
+Cada formato grava o DataFrame em lotes de `tamanho_lote` linhas direto no
+arquivo de destino, então a memória extra fica limitada a um lote:
+
+- CSV: cabeçalho no primeiro lote, os demais anexados;
+- Parquet: um row group por lote (`pyarrow.parquet.ParquetWriter`);
+- XLSX: `openpyxl` em modo `write_only`, que grava as linhas à medida que
+  chegam; tabelas acima do limite de linhas do Excel continuam em novas abas.
+
+`exportar_em_segundo_plano` roda a gravação em um pool de threads para não
+travar o dashboard. Cada exportação grava um arquivo próprio (nome legível +
+identificador único), então sessões que exportam a mesma tabela não
+sobrescrevem uma à outra; o nome legível (`nome_arquivo`) fica só para o
+download. Arquivos com mais de `IDADE_MAXIMA_EXPORTACAO_S` são removidos a
+cada nova exportação.
+"""
+
+import os
+import re
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from importacao_tardia import importar_tardio
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; só é necessário para .parquet
+    pa = pq = None
+
+# Carregado só na primeira exportação para .xlsx
+openpyxl = importar_tardio("openpyxl")
+
+DIR_EXPORTACOES = "exportacoes"
+TAMANHO_LOTE_EXPORTACAO = 50_000
+LIMITE_LINHAS_XLSX = 1_048_575  # linhas de dados por aba (a primeira é o cabeçalho)
+IDADE_MAXIMA_EXPORTACAO_S = 6 * 3600
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="exportacao")
+
+
+def _lotes(df: pd.DataFrame, tamanho_lote: int):
+    for inicio in range(0, len(df), tamanho_lote):
+        yield df.iloc[inicio:inicio + tamanho_lote]
+
+
+def exportar_csv(df: pd.DataFrame, destino: str, tamanho_lote: int = TAMANHO_LOTE_EXPORTACAO) -> str:
+    with open(destino, "w", encoding="utf-8-sig", newline="") as arquivo:
+        df.iloc[:0].to_csv(arquivo, index=False)
+        for lote in _lotes(df, tamanho_lote):
+            lote.to_csv(arquivo, index=False, header=False)
+    return destino
+
+
+def exportar_parquet(df: pd.DataFrame, destino: str, tamanho_lote: int = TAMANHO_LOTE_EXPORTACAO) -> str:
+    if pq is None:
+        raise ImportError("Exportação para .parquet requer o pacote 'pyarrow'.")
+    # Colunas de texto/mistas viram string para o esquema ser o mesmo em todos os lotes
+    tipos = {col: "string" for col in df.columns[df.dtypes == object]}
+    esquema = pa.Schema.from_pandas(df.iloc[:0].astype(tipos), preserve_index=False)
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for lote in _lotes(df, tamanho_lote):
+            escritor.write_table(pa.Table.from_pandas(lote.astype(tipos), schema=esquema, preserve_index=False))
+    return destino
+
+
+def _nome_aba(nome: str, parte: int) -> str:
+    nome = re.sub(r"[\[\]:*?/\\]", "_", nome)[:28]
+    return nome if parte == 0 else f"{nome} {parte + 1}"
+
+
+def exportar_xlsx(tabelas: dict[str, pd.DataFrame], destino: str,
+                  tamanho_lote: int = TAMANHO_LOTE_EXPORTACAO) -> str:
+    """Grava cada tabela em uma aba; aceita um DataFrame único ou um dicionário nome -> DataFrame."""
+    if isinstance(tabelas, pd.DataFrame):
+        tabelas = {"Dados": tabelas}
+    wb = openpyxl.Workbook(write_only=True)
+    for nome, df in tabelas.items():
+        cabecalho = [str(col) for col in df.columns]
+        for parte, inicio in enumerate(range(0, max(len(df), 1), LIMITE_LINHAS_XLSX)):
+            aba = wb.create_sheet(_nome_aba(nome, parte))
+            aba.append(cabecalho)
+            for lote in _lotes(df.iloc[inicio:inicio + LIMITE_LINHAS_XLSX], tamanho_lote):
+                # Nulos (NaN/NaT/NA) viram células vazias
+                for linha in lote.astype(object).where(lote.notna(), None).itertuples(index=False, name=None):
+                    aba.append(linha)
+    wb.save(destino)
+    return destino
+
+
+FORMATOS = {"csv": exportar_csv, "parquet": exportar_parquet, "xlsx": exportar_xlsx}
+
+
+def _base_arquivo(nome: str) -> str:
+    nome = unicodedata.normalize("NFKD", nome).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^0-9A-Za-z_-]+", "_", nome).strip("_").lower() or "exportacao"
+
+
+def nome_arquivo(nome: str, formato: str) -> str:
+    """Nome legível oferecido no download (ex.: 'serie_mensal.csv')."""
+    return f"{_base_arquivo(nome)}.{formato}"
+
+
+def caminho_exportacao(nome: str, formato: str, destino: str = DIR_EXPORTACOES) -> str:
+    """Caminho único para uma exportação: o nome legível seguido de um identificador aleatório."""
+    os.makedirs(destino, exist_ok=True)
+    return os.path.join(destino, f"{_base_arquivo(nome)}_{uuid.uuid4().hex}.{formato}")
+
+
+def limpar_exportacoes(destino: str = DIR_EXPORTACOES, idade_maxima_s: float = IDADE_MAXIMA_EXPORTACAO_S) -> int:
+    """Remove as exportações gravadas há mais de `idade_maxima_s`; devolve quantas foram removidas."""
+    if not os.path.isdir(destino):
+        return 0
+    limite = time.time() - idade_maxima_s
+    removidas = 0
+    for entrada in os.scandir(destino):
+        try:
+            if entrada.is_file() and entrada.stat().st_mtime < limite:
+                os.remove(entrada.path)
+                removidas += 1
+        except FileNotFoundError:  # removida por outra sessão ao mesmo tempo
+            pass
+    return removidas
+
+
+def exportar(df: pd.DataFrame, nome: str, formato: str, destino: str = DIR_EXPORTACOES) -> str:
+    """Grava a tabela no formato pedido em um arquivo próprio e devolve o seu caminho."""
+    limpar_exportacoes(destino)
+    caminho = caminho_exportacao(nome, formato, destino)
+    if formato == "xlsx":
+        return exportar_xlsx({nome: df}, caminho)
+    return FORMATOS[formato](df, caminho)
+
+
+def exportar_em_segundo_plano(df: pd.DataFrame, nome: str, formato: str, destino: str = DIR_EXPORTACOES):
+    """Agenda a exportação em uma thread e devolve o `Future` com o caminho do arquivo."""
+    return _executor.submit(exportar, df, nome, formato, destino)
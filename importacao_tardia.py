@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Importação tardia de módulos pesados.
+
+`importar_tardio` devolve o módulo registrado em `sys.modules`, mas só
+executa o seu código no primeiro acesso a um atributo
+(`importlib.util.LazyLoader`). Assim `plotly.express` e `openpyxl` não pesam
+na inicialização do dashboard até que um gráfico ou uma planilha precise deles.
+"""
+
+import importlib.util
+import sys
+
+
+def importar_tardio(nome: str):
+    """Módulo `nome`, carregado apenas quando um atributo dele for usado."""
+    if nome in sys.modules:
+        return sys.modules[nome]
+    spec = importlib.util.find_spec(nome)
+    if spec is None:
+        raise ModuleNotFoundError(f"Módulo '{nome}' não encontrado.", name=nome)
+    carregador = importlib.util.LazyLoader(spec.loader)
+    spec.loader = carregador
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    carregador.exec_module(modulo)
+    return modulo
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Índice bitmap para filtros combinados do dashboard.
+
+Para cada dimensão (Armador, Serviço, Berço, País, Tipo, mês...) guarda um
+bitset compactado (`np.packbits`) por valor da categoria, construído uma única
+vez. Uma combinação de filtros vira OR dos bitsets dentro de cada dimensão e
+AND entre dimensões, sem voltar a comparar strings: cada operação percorre
+apenas n/8 bytes por valor selecionado.
+"""
+
+import numpy as np
+import pandas as pd
+
+NAO_INFORMADO = "Não Informado"
+
+# Quantidade de bits ligados em cada byte, para contar linhas sem descompactar
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class IndiceBitmap:
+    """Bitsets por valor de cada dimensão de um DataFrame, na ordem posicional das linhas."""
+
+    def __init__(self, df: pd.DataFrame, dimensoes: dict[str, str]):
+        """`dimensoes` mapeia o nome exibido da dimensão para a coluna do DataFrame."""
+        self.n_linhas = len(df)
+        self._todas = np.packbits(np.ones(self.n_linhas, dtype=bool))
+        self.bitsets: dict[str, dict[str, np.ndarray]] = {}
+        for nome, coluna in dimensoes.items():
+            if coluna and coluna in df.columns:
+                self.bitsets[nome] = self._construir(df[coluna])
+
+    def _construir(self, serie: pd.Series) -> dict[str, np.ndarray]:
+        valores = serie.astype("string").fillna(NAO_INFORMADO)
+        codigos, categorias = pd.factorize(valores, sort=True)
+
+        # Agrupa as posições por código com uma única ordenação estável
+        ordem = np.argsort(codigos, kind="stable")
+        limites = np.cumsum(np.bincount(codigos, minlength=len(categorias)))[:-1]
+
+        bitsets = {}
+        for categoria, posicoes in zip(categorias, np.split(ordem, limites)):
+            mascara = np.zeros(self.n_linhas, dtype=bool)
+            mascara[posicoes] = True
+            bitsets[str(categoria)] = np.packbits(mascara)
+        return bitsets
+
+    @property
+    def dimensoes(self) -> list[str]:
+        return list(self.bitsets)
+
+    def valores(self, dimensao: str) -> list[str]:
+        return list(self.bitsets.get(dimensao, {}))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for bitsets in self.bitsets.values() for b in bitsets.values())
+
+    def bitset(self, selecoes: dict[str, list[str]]) -> np.ndarray:
+        """Resolve os filtros em um bitset: OR dentro de cada dimensão, AND entre dimensões.
+
+        Dimensões ausentes ou com lista vazia não restringem o resultado.
+        """
+        resultado = self._todas.copy()
+        for dimensao, valores in selecoes.items():
+            if not valores or dimensao not in self.bitsets:
+                continue
+            bitsets = self.bitsets[dimensao]
+            uniao = np.zeros_like(resultado)
+            for valor in valores:
+                if valor in bitsets:
+                    np.bitwise_or(uniao, bitsets[valor], out=uniao)
+            np.bitwise_and(resultado, uniao, out=resultado)
+        return resultado
+
+    def mascara(self, selecoes: dict[str, list[str]]) -> np.ndarray:
+        """Máscara booleana das linhas que atendem aos filtros."""
+        return np.unpackbits(self.bitset(selecoes), count=self.n_linhas).astype(bool)
+
+    def posicoes(self, selecoes: dict[str, list[str]]) -> np.ndarray:
+        """Posições (para `iloc`) das linhas que atendem aos filtros."""
+        return np.flatnonzero(self.mascara(selecoes))
+
+    def contar(self, selecoes: dict[str, list[str]]) -> int:
+        """Quantidade de linhas selecionadas, sem descompactar o bitset."""
+        return int(_POPCOUNT[self.bitset(selecoes)].sum(dtype=np.int64))
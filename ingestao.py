@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestão contínua de uma pasta monitorada de exportações de programação.
+
+O terminal deixa novas exportações (.xlsx) em uma pasta compartilhada várias
+vezes ao dia. `MonitorPasta` varre a pasta a cada poucos segundos, detecta
+arquivos novos ou alterados (primeiro por mtime/tamanho, depois pelo hash do
+conteúdo, então um arquivo apenas "tocado" não é reconvertido) e envia cada um
+a um pool de processos que:
+
+- lê a planilha para o armazém de artefatos (leitura mapeada e validada do
+  dashboard, da API e do relatório, e leitura completa dos demais scripts), de
+  modo que nenhuma sessão pague a leitura do .xlsx nem a validação no caminho
+  da requisição
+- calcula os números da Visão Geral (com e sem o descarte de inconsistentes)
+- sorteia a amostra estratificada da prévia do dashboard
+- opcionalmente grava o dataset particionado, com o terminal vindo do nome do arquivo
+
+O estado de cada arquivo e os agregados vão para `manifesto_ingestao.json`,
+gravado de forma atômica a cada mudança; o dashboard consulta esse manifesto
+(`registro_mais_recente`) para saber qual é a programação mais recente.
+
+Uso:
+    python ingestao.py /mnt/exportacoes
+    python ingestao.py /mnt/exportacoes --workers 2 --intervalo 2 --particionar
+    python ingestao.py /mnt/exportacoes --uma-vez
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from artefatos import DIR_ARTEFATOS, ArmazemArtefatos, amostra, dataset, dataset_validado
+from cache_dados import hash_conteudo
+from mapeamento_colunas import CAMPOS_APP
+from particionamento import escrever_particoes
+from snapshot_padrao import resumo_visao_geral
+
+ARQUIVO_MANIFESTO = "manifesto_ingestao.json"
+# Incrementar quando o formato do manifesto mudar
+VERSAO_MANIFESTO = 1
+INTERVALO_PADRAO_S = 2.0
+# Arquivos modificados há menos que isso ainda podem estar sendo copiados
+ESTABILIDADE_S = 1.0
+
+
+def _agora() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _resumo_json(resumo: dict) -> dict:
+    periodo = resumo["periodo"]
+    return {**resumo, "periodo": [str(periodo[0]), str(periodo[1])] if periodo else None}
+
+
+def converter(caminho: str, raiz_artefatos: str = DIR_ARTEFATOS, particionar: bool = False) -> dict:
+    """Lê `caminho` para o armazém de artefatos e devolve hash, linhas e Visão Geral (roda no pool)."""
+    inicio = time.perf_counter()
+    # Estado do arquivo antes da leitura: se ele mudar durante a conversão, a próxima varredura percebe
+    info = os.stat(caminho)
+    hash_arquivo = hash_conteudo(caminho)
+    armazem = ArmazemArtefatos(raiz_artefatos)
+
+    lido = dataset(caminho, CAMPOS_APP, armazem=armazem)
+    dataset(caminho, armazem=armazem)
+    amostra(lido, armazem=armazem)
+    df, colunas, validacao = dataset_validado(caminho, CAMPOS_APP, armazem=armazem).valor
+    resultado = {
+        "hash": hash_arquivo,
+        "mtime_ns": info.st_mtime_ns,
+        "tamanho": info.st_size,
+        "linhas": len(df),
+        "inconsistentes": int((~validacao.limpa).sum()),
+        "visao_geral": {
+            "sem_inconsistentes": _resumo_json(resumo_visao_geral(df, colunas, validacao, True)),
+            "todos": _resumo_json(resumo_visao_geral(df, colunas, validacao, False)),
+        },
+    }
+    if particionar:
+        terminal = os.path.splitext(os.path.basename(caminho))[0]
+        resultado["linhas_particionadas"] = escrever_particoes(caminho, terminal=terminal)
+    resultado["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+def carregar_manifesto(caminho: str = ARQUIVO_MANIFESTO) -> dict:
+    """Manifesto gravado pelo monitor, ou um manifesto vazio se não existir ou for de outra versão."""
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            manifesto = json.load(arquivo)
+    except (OSError, ValueError):
+        return {}
+    return manifesto if manifesto.get("versao") == VERSAO_MANIFESTO else {}
+
+
+def registro_mais_recente(manifesto: dict) -> dict | None:
+    """Registro do arquivo mais recente já convertido, ou None."""
+    return next((registro for registro in manifesto.get("arquivos", [])
+                 if registro["caminho"] == manifesto.get("mais_recente")), None)
+
+
+class MonitorPasta:
+    """Varre uma pasta de .xlsx, converte o que mudou em um pool de processos e mantém o manifesto."""
+
+    def __init__(self, pasta: str, manifesto: str = ARQUIVO_MANIFESTO, workers: int | None = None,
+                 raiz_artefatos: str = DIR_ARTEFATOS, particionar: bool = False,
+                 estabilidade_s: float = ESTABILIDADE_S):
+        self.pasta = os.path.abspath(pasta)
+        self.manifesto = manifesto
+        self.raiz_artefatos = os.path.abspath(raiz_artefatos)
+        self.particionar = particionar
+        self.estabilidade_s = estabilidade_s
+        # Retoma o manifesto anterior: arquivos já convertidos com o mesmo hash não são refeitos
+        self.arquivos: dict[str, dict] = {item["caminho"]: item
+                                          for item in carregar_manifesto(manifesto).get("arquivos", [])}
+        self._executor = ProcessPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1))
+        self._pendentes: dict[Future, str] = {}
+
+    def _listar_pasta(self) -> dict[str, os.stat_result]:
+        encontrados = {}
+        for entrada in os.scandir(self.pasta):
+            # '~$...' são os arquivos de trava que o Excel cria ao lado da planilha aberta
+            if entrada.is_file() and entrada.name.lower().endswith(".xlsx") and not entrada.name.startswith("~$"):
+                encontrados[entrada.path] = entrada.stat()
+        return encontrados
+
+    def varrer(self) -> tuple[list[str], bool]:
+        """Arquivos novos ou alterados a converter e se o manifesto mudou (ex.: arquivo removido)."""
+        encontrados = self._listar_pasta()
+        em_conversao = set(self._pendentes.values())
+        removidos = [caminho for caminho in self.arquivos if caminho not in encontrados]
+        for caminho in removidos:
+            del self.arquivos[caminho]
+
+        novos, alterado = [], bool(removidos)
+        agora = time.time()
+        for caminho, info in encontrados.items():
+            registro = self.arquivos.get(caminho)
+            if caminho in em_conversao or agora - info.st_mtime < self.estabilidade_s:
+                continue
+            if registro and (registro["mtime_ns"], registro["tamanho"]) == (info.st_mtime_ns, info.st_size):
+                continue
+            hash_arquivo = hash_conteudo(caminho)
+            if registro and registro["hash"] == hash_arquivo and registro["status"] == "pronto":
+                registro.update(mtime_ns=info.st_mtime_ns, tamanho=info.st_size)
+                alterado = True
+                continue
+            # Um arquivo já convertido continua valendo, com o hash anterior, até a nova conversão terminar
+            if registro is None or registro["status"] != "pronto":
+                self.arquivos[caminho] = {
+                    "arquivo": os.path.basename(caminho), "caminho": caminho, "hash": hash_arquivo,
+                    "mtime_ns": info.st_mtime_ns, "tamanho": info.st_size,
+                    "status": "convertendo", "detectado_em": _agora(),
+                }
+            novos.append(caminho)
+        return novos, alterado or bool(novos)
+
+    def _concluir(self, futuro: Future):
+        caminho = self._pendentes.pop(futuro)
+        registro = self.arquivos.get(caminho)
+        if registro is None:
+            return  # removido da pasta durante a conversão
+        try:
+            registro.update(futuro.result(), status="pronto", convertido_em=_agora(), erro=None)
+            print(f"[{registro['convertido_em']}] {registro['arquivo']}: {registro['linhas']:,} linhas "
+                  f"em {registro['duracao_s']:.1f} s")
+        except Exception as erro:
+            registro.update(status="erro", erro=f"{type(erro).__name__}: {erro}")
+            print(f"[{_agora()}] {registro['arquivo']}: erro na conversão ({registro['erro']})")
+
+    def processar(self) -> int:
+        """Uma varredura: envia o que mudou ao pool e recolhe as conversões concluídas."""
+        novos, alterado = self.varrer()
+        for caminho in novos:
+            futuro = self._executor.submit(converter, caminho, self.raiz_artefatos, self.particionar)
+            self._pendentes[futuro] = caminho
+        concluidos = [futuro for futuro in self._pendentes if futuro.done()]
+        for futuro in concluidos:
+            self._concluir(futuro)
+        if alterado or concluidos:
+            self.gravar_manifesto()
+        return len(concluidos)
+
+    def aguardar(self):
+        """Espera as conversões em andamento e grava o manifesto final."""
+        wait(list(self._pendentes))
+        for futuro in list(self._pendentes):
+            self._concluir(futuro)
+        self.gravar_manifesto()
+
+    def mais_recente(self) -> dict | None:
+        """Arquivo convertido com o maior mtime (a programação mais nova da pasta)."""
+        prontos = [registro for registro in self.arquivos.values() if registro["status"] == "pronto"]
+        return max(prontos, key=lambda registro: registro["mtime_ns"], default=None)
+
+    def gravar_manifesto(self):
+        recente = self.mais_recente()
+        manifesto = {
+            "versao": VERSAO_MANIFESTO,
+            "pasta": self.pasta,
+            "atualizado_em": _agora(),
+            "mais_recente": recente["caminho"] if recente else None,
+            "arquivos": sorted(self.arquivos.values(), key=lambda registro: registro["mtime_ns"], reverse=True),
+        }
+        # Grava em um temporário e renomeia: quem consulta nunca vê um manifesto pela metade
+        temporario = f"{self.manifesto}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(manifesto, arquivo, ensure_ascii=False, indent=2)
+        os.replace(temporario, self.manifesto)
+
+    def executar(self, intervalo_s: float = INTERVALO_PADRAO_S):
+        """Laço do monitor: varre a pasta a cada `intervalo_s` segundos até Ctrl+C."""
+        try:
+            while True:
+                self.processar()
+                time.sleep(intervalo_s)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.fechar()
+
+    def fechar(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitora uma pasta de exportações (.xlsx) e as converte.")
+    parser.add_argument("pasta", help="Pasta compartilhada com as exportações")
+    parser.add_argument("--manifesto", default=ARQUIVO_MANIFESTO, help="Arquivo JSON do manifesto")
+    parser.add_argument("--workers", type=int, default=None, help="Processos de conversão")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_PADRAO_S, help="Segundos entre varreduras")
+    parser.add_argument("--raiz-artefatos", default=DIR_ARTEFATOS, help="Diretório do armazém de artefatos")
+    parser.add_argument("--particionar", action="store_true",
+                        help="Grava também o dataset particionado (terminal = nome do arquivo)")
+    parser.add_argument("--uma-vez", action="store_true", help="Converte o que mudou e termina")
+    args = parser.parse_args()
+
+    monitor = MonitorPasta(args.pasta, args.manifesto, args.workers, args.raiz_artefatos, args.particionar)
+    if args.uma_vez:
+        monitor.processar()
+        monitor.aguardar()
+        monitor.fechar()
+    else:
+        print(f"Monitorando {monitor.pasta} a cada {args.intervalo:g} s (Ctrl+C para sair)")
+        monitor.executar(args.intervalo)
+
+
+if __name__ == "__main__":
+    main()
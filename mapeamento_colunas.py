@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Mapeamento dos cabeçalhos da planilha para os campos lógicos da análise.
+
+Cada exportação pode trazer variações de cabeçalho (espaços sobrando como em
+'Início Operação ', acentos, maiúsculas, pequenas diferenças de grafia). O
+cabeçalho é identificado por uma impressão digital (hash dos nomes) e cada
+campo lógico é resolvido em duas passadas: primeiro por igualdade dos nomes
+normalizados, depois por similaridade (`difflib`) entre os cabeçalhos que
+sobraram. O resultado fica em cache por impressão digital, e a leitura passa
+o filtro dos campos como `usecols`, então as colunas não usadas nem são
+convertidas.
+"""
+
+import difflib
+import functools
+import hashlib
+import re
+import threading
+import unicodedata
+
+import pandas as pd
+
+from processamento_lotes import _extensao
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; só é necessário para .parquet
+    pq = None
+
+# Campo lógico -> nomes aceitos, em ordem de preferência; o primeiro é o nome canônico
+CAMPOS = {
+    "navio": ["Navio / Viagem1", "Navio", "Nome do Navio"],
+    "viagem": ["Navio / Viagem", "Viagem"],
+    "status": ["Situação", "Status"],
+    "data": ["Estimativa Chegada ETA", "Chegada ETA"],
+    "etd": ["Estimativa Saída ETD", "Saída ETD"],
+    "etb": ["Estimativa Atracação ETB", "ETB"],
+    "chegada_barra": ["Chegada na Barra"],
+    "atracacao": ["Atracação"],
+    "rota": ["De / Para", "Rota"],
+    "servico": ["Serviço"],
+    "armador": ["Armador"],
+    "conteineres": ["Movs", "TEUs"],
+    "berco": ["Berço"],
+    "pais": ["País"],
+    "tipo": ["Tipo", "Tipo de Navio"],
+    "motivo": ["MotivoCancelamento", "Motivo do Cancelamento"],
+    "inicio_operacao": ["Início Operação"],
+    "fim_operacao": ["Fim Operação"],
+    "comprimento": ["Comprimento"],
+    "largura": ["Largura"],
+    "deadline": ["Deadline Dry", "Deadline"],
+    "recebimento_cheio": ["Início Recebimento Cheio"],
+    "recebimento_vazio": ["Início Recebimento Vazio"],
+}
+
+# Campos lógicos usados pelo dashboard (app.py), pela API e pelo relatório (analise_navios.py);
+# só essas colunas são lidas da planilha
+CAMPOS_APP = ["navio", "viagem", "status", "data", "etd", "etb", "chegada_barra", "atracacao",
+              "inicio_operacao", "fim_operacao", "rota", "servico", "armador", "conteineres", "berco",
+              "pais", "tipo", "motivo", "comprimento", "largura", "deadline", "recebimento_cheio",
+              "recebimento_vazio"]
+
+# Similaridade mínima (difflib) para aceitar um cabeçalho parecido
+LIMIAR_SIMILARIDADE = 0.85
+
+_MAPEAMENTOS: dict[str, dict[str, str]] = {}
+_trava = threading.Lock()
+
+
+def normalizar_cabecalho(nome) -> str:
+    """Minúsculas, sem acentos, sem pontuação e com espaços simples."""
+    texto = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^0-9a-z]+", " ", texto.lower()).strip()
+
+
+def impressao_digital(cabecalho) -> str:
+    """Hash estável da linha de cabeçalho (nomes e ordem)."""
+    return hashlib.sha1("\x1f".join(map(str, cabecalho)).encode("utf-8")).hexdigest()
+
+
+def _resolver(cabecalho: list[str]) -> dict[str, str]:
+    normalizados = {}
+    for nome in cabecalho:
+        # Em nomes repetidos ('Armador', 'Armador.1') vale a primeira ocorrência
+        normalizados.setdefault(normalizar_cabecalho(nome), nome)
+
+    mapa, usados = {}, set()
+    # 1ª passada: igualdade após normalização
+    for campo, aceitos in CAMPOS.items():
+        for aceito in aceitos:
+            nome = normalizados.get(normalizar_cabecalho(aceito))
+            if nome is not None and nome not in usados:
+                mapa[campo] = nome
+                usados.add(nome)
+                break
+    # 2ª passada: similaridade, apenas entre os cabeçalhos ainda livres
+    for campo, aceitos in CAMPOS.items():
+        if campo in mapa:
+            continue
+        livres = [n for n in normalizados if normalizados[n] not in usados]
+        for aceito in aceitos:
+            parecidos = difflib.get_close_matches(normalizar_cabecalho(aceito), livres, n=1,
+                                                  cutoff=LIMIAR_SIMILARIDADE)
+            if parecidos:
+                mapa[campo] = normalizados[parecidos[0]]
+                usados.add(mapa[campo])
+                break
+    return mapa
+
+
+def resolver_mapeamento(cabecalho) -> dict[str, str]:
+    """Campo lógico -> nome da coluna no cabeçalho, com cache por impressão digital."""
+    cabecalho = list(cabecalho)
+    chave = impressao_digital(cabecalho)
+    with _trava:
+        mapa = _MAPEAMENTOS.get(chave)
+    if mapa is None:
+        mapa = _resolver(cabecalho)
+        with _trava:
+            _MAPEAMENTOS[chave] = mapa
+    return dict(mapa)
+
+
+def nomes_canonicos(mapa: dict[str, str]) -> dict[str, str]:
+    """Nome da coluna no arquivo -> nome canônico do campo (para `rename`)."""
+    return {nome: CAMPOS[campo][0] for campo, nome in mapa.items()}
+
+
+@functools.lru_cache(maxsize=4096)
+def _relevante(nome, campos: tuple) -> bool:
+    """Se o cabeçalho pode corresponder a algum dos campos pedidos (filtro do `usecols`)."""
+    normalizado = normalizar_cabecalho(nome)
+    for campo in campos:
+        for aceito in CAMPOS[campo]:
+            alvo = normalizar_cabecalho(aceito)
+            if normalizado == alvo or difflib.SequenceMatcher(None, normalizado, alvo).ratio() >= LIMIAR_SIMILARIDADE:
+                return True
+    return False
+
+
+def aplicar_mapeamento(df: pd.DataFrame, campos=None) -> tuple[pd.DataFrame, dict[str, str]]:
+    """Mantém só as colunas mapeadas, com os nomes canônicos, e devolve campo -> coluna."""
+    df.columns = df.columns.str.strip()
+    mapa = resolver_mapeamento(df.columns)
+    if campos is not None:
+        mapa = {campo: nome for campo, nome in mapa.items() if campo in campos}
+    df = df.loc[:, df.columns.isin(list(mapa.values()))].rename(columns=nomes_canonicos(mapa))
+    return df, {campo: CAMPOS[campo][0] for campo in mapa}
+
+
+def ler_com_mapeamento(origem, campos=None) -> tuple[pd.DataFrame, dict[str, str]]:
+    """Lê apenas as colunas dos campos pedidos, já com os nomes canônicos.
+
+    O filtro de cabeçalhos vai como `usecols` para o leitor, então colunas sem
+    correspondência não são convertidas. Campos não encontrados ficam de fora
+    do dicionário devolvido.
+    """
+    campos = tuple(campos or CAMPOS)
+    extensao = _extensao(origem)
+    if extensao == ".parquet":
+        if pq is None:
+            raise ImportError("Leitura de .parquet requer o pacote 'pyarrow'.")
+        nomes = pq.ParquetFile(origem).schema_arrow.names
+        df = pd.read_parquet(origem, columns=[nome for nome in nomes if _relevante(nome, campos)])
+    else:
+        leitor = pd.read_csv if extensao == ".csv" else pd.read_excel
+        df = leitor(origem, usecols=lambda nome: _relevante(nome, campos))
+    if hasattr(origem, "seek"):
+        origem.seek(0)
+    return aplicar_mapeamento(df, campos)
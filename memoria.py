@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Orçamento de memória por etapa do fluxo de dados.
+
+`RelatorioMemoria` registra os DataFrames de cada etapa (leitura, preparação
+dos cancelamentos, filtros, colunas derivadas) e separa, para cada etapa, os
+bytes totais dos bytes novos: colunas cujo buffer já apareceu numa etapa
+anterior são vistas compartilhadas (copy-on-write do pandas) e não contam de
+novo. A soma dos bytes novos é a memória que o fluxo realmente mantém.
+
+O RSS atual e o pico do processo vêm de `/proc/self/statm` e do módulo
+`resource`; onde não existem (Windows) ficam como None.
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _enderecos(serie: pd.Series) -> tuple:
+    """Endereços dos buffers de dados da coluna (NumPy ou Arrow)."""
+    arr = serie.array
+    if hasattr(arr, "__arrow_array__"):
+        chunks = arr.__arrow_array__()
+        chunks = getattr(chunks, "chunks", [chunks])
+        return tuple(buf.address for chunk in chunks for buf in chunk.buffers() if buf is not None)
+    try:
+        return (serie.to_numpy(copy=False).__array_interface__["data"][0],)
+    except (AttributeError, TypeError, ValueError):
+        return (id(arr),)
+
+
+def rss_atual() -> int | None:
+    """Memória residente atual do processo, em bytes."""
+    try:
+        with open("/proc/self/statm") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def rss_pico() -> int | None:
+    """Pico de memória residente do processo, em bytes."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB; macOS, em bytes
+    return pico if os.uname().sysname == "Darwin" else pico * 1024
+
+
+class RelatorioMemoria:
+    """Bytes mantidos por etapa, sem contar duas vezes os buffers compartilhados."""
+
+    def __init__(self):
+        self.etapas = []
+        self._vistos = set()
+
+    def registrar(self, etapa: str, df: pd.DataFrame | None):
+        if df is None:
+            return
+        total = novos = 0
+        for coluna in df.columns:
+            serie = df[coluna]
+            tamanho = int(serie.memory_usage(deep=True, index=False))
+            enderecos = _enderecos(serie)
+            total += tamanho
+            if not self._vistos.issuperset(enderecos):
+                novos += tamanho
+                self._vistos.update(enderecos)
+        self.etapas.append({"Etapa": etapa, "Linhas": len(df), "Colunas": df.shape[1],
+                            "MB": total / 1e6, "MB novos": novos / 1e6})
+
+    def tabela(self) -> pd.DataFrame:
+        tabela = pd.DataFrame(self.etapas, columns=["Etapa", "Linhas", "Colunas", "MB", "MB novos"])
+        return tabela.round({"MB": 2, "MB novos": 2})
+
+    @property
+    def mb_mantidos(self) -> float:
+        return sum(etapa["MB novos"] for etapa in self.etapas)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Padrões de calendário das chegadas: dia da semana x hora e mês x dia da semana.
+
+`MatrizCalendario` extrai dia da semana, hora e mês direto dos inteiros de
+`datetime64` (sem `dt.day_name()` nem strings), combina grupo, linha e coluna
+em um código inteiro por escala e conta tudo com um único `np.bincount`. Os
+códigos são montados uma vez sobre todas as escalas programadas; cada
+contagem (todas as escalas, só as canceladas...) é outro bincount sobre uma
+máscara, o que permite normalizar os cancelamentos pelas escalas programadas
+da mesma célula.
+"""
+
+import numpy as np
+import pandas as pd
+
+from dados_navios import para_datas
+
+NAO_INFORMADO = "Não Informado"
+
+DIAS_SEMANA = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
+HORAS = [f"{h:02d}h" for h in range(24)]
+MESES = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+
+# Eixo -> rótulos (o tamanho do eixo é o número de rótulos)
+EIXOS = {"dia_semana": DIAS_SEMANA, "hora": HORAS, "mes": MESES}
+
+
+def componentes_data(datas: pd.Series) -> dict[str, np.ndarray]:
+    """Dia da semana (0 = segunda), hora e mês (0 = janeiro) como inteiros; -1 nas datas ausentes."""
+    valores = para_datas(datas).to_numpy(dtype="datetime64[ns]")
+    validas = ~np.isnat(valores)
+    dias = valores.astype("datetime64[D]")
+    # 01/01/1970 foi uma quinta-feira: +3 alinha a contagem de dias com segunda = 0
+    dia_semana = (dias.astype(np.int64) + 3) % 7
+    hora = (valores.astype("datetime64[h]") - dias).astype(np.int64)
+    mes = dias.astype("datetime64[M]").astype(np.int64) % 12
+    return {eixo: np.where(validas, valor, -1).astype(np.int16)
+            for eixo, valor in (("dia_semana", dia_semana), ("hora", hora), ("mes", mes))}
+
+
+class MatrizCalendario:
+    """Contagens grupo x linha x coluna de um campo de data, uma escala por linha do DataFrame."""
+
+    def __init__(self, datas: pd.Series, linhas: str = "dia_semana", colunas: str = "hora",
+                 grupos: pd.Series | None = None):
+        self.linhas, self.colunas = linhas, colunas
+        componentes = componentes_data(datas)
+        linha, coluna = componentes[linhas], componentes[colunas]
+        if grupos is None:
+            codigos_grupo, self.grupos = np.zeros(len(datas), dtype=np.int64), np.array(["Todos"], dtype=object)
+        else:
+            codigos_grupo, self.grupos = pd.factorize(grupos.astype("string").fillna(NAO_INFORMADO), sort=True)
+            self.grupos = np.asarray(self.grupos, dtype=object)
+        self.forma = (len(self.grupos), len(EIXOS[linhas]), len(EIXOS[colunas]))
+        self.validas = linha >= 0
+        # Código único por escala: (grupo, linha, coluna) em ordem row-major
+        self.codigos = (codigos_grupo * self.forma[1] + linha) * self.forma[2] + coluna
+
+    def contar(self, mascara=None, grupo: str | None = None) -> np.ndarray:
+        """Matriz linha x coluna das escalas em `mascara` de um grupo (ou de todos)."""
+        selecao = self.validas if mascara is None else self.validas & np.asarray(mascara, dtype=bool)
+        contagens = np.bincount(self.codigos[selecao], minlength=int(np.prod(self.forma))).reshape(self.forma)
+        if grupo is None:
+            return contagens.sum(axis=0)
+        return contagens[list(self.grupos).index(grupo)]
+
+    def taxa(self, mascara, grupo: str | None = None) -> np.ndarray:
+        """Fração das escalas de cada célula que estão em `mascara` (NaN onde não há escalas)."""
+        parte, todas = self.contar(mascara, grupo), self.contar(None, grupo)
+        return np.divide(parte, todas, out=np.full(todas.shape, np.nan), where=todas > 0)
+
+    def tabela(self, matriz: np.ndarray) -> pd.DataFrame:
+        """Matriz linha x coluna com os rótulos dos eixos."""
+        return pd.DataFrame(matriz, index=EIXOS[self.linhas], columns=EIXOS[self.colunas])
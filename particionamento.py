@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Dataset particionado por ano, mês e terminal (layout Hive).
+
+A ingestão percorre a planilha em lotes (ver `processamento_lotes`) e grava
+cada lote em arquivos Parquet sob
+
+    dados_particionados/ano=2024/mes=03/terminal=padrao/parte-00000.parquet
+
+usando o mês da 'Estimativa Chegada ETA'. A leitura poda as partições pelos
+nomes de diretório antes de abrir qualquer arquivo, então um filtro dos
+últimos 3 meses lê apenas 3 meses de dados.
+
+Uso pela linha de comando:
+
+    python particionamento.py "ProgramacaoDeNavios (1) (1).xlsx" --terminal padrao
+"""
+
+import argparse
+import os
+import re
+import shutil
+
+import pandas as pd
+
+from processamento_lotes import TAMANHO_LOTE_PADRAO, ler_lotes
+
+DIR_PARTICOES = "dados_particionados"
+COLUNA_PARTICAO = "Estimativa Chegada ETA"
+TERMINAL_PADRAO = "padrao"
+SEM_DATA = "__HIVE_DEFAULT_PARTITION__"
+
+
+def normalizar_terminal(nome: str) -> str:
+    """Converte o nome do terminal em um valor seguro para nome de diretório."""
+    return re.sub(r"[^0-9A-Za-z_-]+", "_", str(nome).strip()).strip("_").lower() or TERMINAL_PADRAO
+
+
+def _preparar_para_parquet(lote: pd.DataFrame) -> pd.DataFrame:
+    # Colunas de texto/mistas viram string (mantendo nulos) para o Parquet aceitar o lote
+    for coluna in lote.columns[lote.dtypes == object]:
+        lote[coluna] = lote[coluna].astype("string")
+    return lote
+
+
+def escrever_particoes(origem, destino: str = DIR_PARTICOES, terminal: str = TERMINAL_PADRAO,
+                       col_data: str = COLUNA_PARTICAO, tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> int:
+    """Grava a origem no layout `ano=/mes=/terminal=` e devolve o número de linhas escritas.
+
+    As partições existentes do mesmo terminal são substituídas, já que cada
+    exportação de programação é um retrato completo do terminal.
+    """
+    terminal = normalizar_terminal(terminal)
+    for caminho in _diretorios_terminal(destino, terminal):
+        shutil.rmtree(caminho)
+
+    total = 0
+    for n_lote, lote in enumerate(ler_lotes(origem, tamanho_lote=tamanho_lote)):
+        datas = pd.to_datetime(lote[col_data], dayfirst=True, errors="coerce")
+        anos = datas.dt.year.astype("Int64").astype("string").fillna(SEM_DATA)
+        meses = datas.dt.month.astype("Int64").map(lambda m: f"{m:02d}", na_action="ignore").fillna(SEM_DATA)
+        lote = _preparar_para_parquet(lote)
+
+        for (ano, mes), parte in lote.groupby([anos, meses], sort=False):
+            pasta = os.path.join(destino, f"ano={ano}", f"mes={mes}", f"terminal={terminal}")
+            os.makedirs(pasta, exist_ok=True)
+            parte.to_parquet(os.path.join(pasta, f"parte-{n_lote:05d}.parquet"), index=False)
+        total += len(lote)
+    return total
+
+
+def _diretorios_terminal(destino: str, terminal: str):
+    if not os.path.isdir(destino):
+        return []
+    return [linha.caminho for linha in listar_particoes(destino).itertuples() if linha.terminal == terminal]
+
+
+def listar_particoes(destino: str = DIR_PARTICOES) -> pd.DataFrame:
+    """Lista as partições existentes (ano, mes, terminal, caminho) lendo apenas os diretórios."""
+    particoes = []
+    if os.path.isdir(destino):
+        for dir_ano in os.scandir(destino):
+            if not (dir_ano.is_dir() and dir_ano.name.startswith("ano=")):
+                continue
+            for dir_mes in os.scandir(dir_ano.path):
+                if not (dir_mes.is_dir() and dir_mes.name.startswith("mes=")):
+                    continue
+                for dir_term in os.scandir(dir_mes.path):
+                    if dir_term.is_dir() and dir_term.name.startswith("terminal="):
+                        particoes.append({
+                            "ano": dir_ano.name.split("=", 1)[1],
+                            "mes": dir_mes.name.split("=", 1)[1],
+                            "terminal": dir_term.name.split("=", 1)[1],
+                            "caminho": dir_term.path,
+                        })
+    return pd.DataFrame(particoes, columns=["ano", "mes", "terminal", "caminho"])
+
+
+def podar_particoes(particoes: pd.DataFrame, inicio=None, fim=None, terminais=None) -> pd.DataFrame:
+    """Mantém apenas as partições que podem conter linhas do intervalo e dos terminais pedidos."""
+    selecionadas = particoes
+    if terminais:
+        selecionadas = selecionadas[selecionadas["terminal"].isin(terminais)]
+    if inicio is not None or fim is not None:
+        # Linhas sem data não pertencem a nenhum intervalo
+        selecionadas = selecionadas[(selecionadas["ano"] != SEM_DATA) & (selecionadas["mes"] != SEM_DATA)]
+        # Mês como inteiro (ano * 12 + mês) para comparar sem materializar datas
+        periodo = selecionadas["ano"].astype(int) * 12 + selecionadas["mes"].astype(int)
+        manter = pd.Series(True, index=selecionadas.index)
+        if inicio is not None:
+            inicio = pd.Timestamp(inicio)
+            manter &= periodo >= inicio.year * 12 + inicio.month
+        if fim is not None:
+            fim = pd.Timestamp(fim)
+            manter &= periodo <= fim.year * 12 + fim.month
+        selecionadas = selecionadas[manter]
+    return selecionadas
+
+
+def ler_particoes(destino: str = DIR_PARTICOES, inicio=None, fim=None, terminais=None,
+                  colunas: list[str] | None = None, col_data: str = COLUNA_PARTICAO) -> pd.DataFrame:
+    """Lê apenas as partições que sobrevivem à poda e aplica o filtro fino de datas nas linhas.
+
+    `inicio` e `fim` são datas inclusivas; `terminais` é uma lista de nomes normalizados.
+    """
+    selecionadas = podar_particoes(listar_particoes(destino), inicio, fim, terminais)
+    if colunas is not None and col_data not in colunas and (inicio is not None or fim is not None):
+        colunas = [*colunas, col_data]
+
+    partes = []
+    for linha in selecionadas.itertuples():
+        for nome in sorted(os.listdir(linha.caminho)):
+            if nome.endswith(".parquet"):
+                parte = pd.read_parquet(os.path.join(linha.caminho, nome), columns=colunas)
+                parte["terminal"] = linha.terminal
+                partes.append(parte)
+    if not partes:
+        return pd.DataFrame(columns=colunas or [])
+    df = pd.concat(partes, ignore_index=True)
+
+    if inicio is not None or fim is not None:
+        datas = pd.to_datetime(df[col_data], dayfirst=True, errors="coerce")
+        manter = datas.notna()
+        if inicio is not None:
+            manter &= datas >= pd.Timestamp(inicio)
+        if fim is not None:
+            manter &= datas < pd.Timestamp(fim) + pd.Timedelta(days=1)
+        df = df.loc[manter].reset_index(drop=True)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grava a planilha no dataset particionado por ano/mês/terminal.")
+    parser.add_argument("arquivo", help="Planilha de programação (.xlsx, .csv ou .parquet)")
+    parser.add_argument("--terminal", default=TERMINAL_PADRAO, help="Nome do terminal da planilha")
+    parser.add_argument("--destino", default=DIR_PARTICOES, help="Diretório raiz do dataset particionado")
+    args = parser.parse_args()
+
+    linhas = escrever_particoes(args.arquivo, args.destino, args.terminal)
+    print(f"{linhas} linhas gravadas em '{args.destino}' (terminal={normalizar_terminal(args.terminal)}).")
+    print(listar_particoes(args.destino).groupby("terminal").size().rename("partições").to_string())
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Pré-cálculo em segundo plano das análises do dashboard `backup.py`.
+
+Assim que um arquivo é carregado, `PreComputacao` prepara uma base única
+(as mesmas normalizações que as abas faziam em sequência sobre `df_cancel`) e
+dispara cada análise em um pool de threads. Cada resultado fica disponível
+assim que termina; a aba que precisa dele antes disso apenas espera o seu
+próprio cálculo, enquanto as demais continuam rodando.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from dados_navios import COLUNAS_CUSTO, calcular_custos, para_datas
+from enriquecimento import enriquecer
+
+# Nome da análise -> função(base, colunas); preenchido pelo decorador `analise`
+ANALISES = {}
+
+
+def analise(nome):
+    def registrar(funcao):
+        ANALISES[nome] = funcao
+        return funcao
+    return registrar
+
+
+def _contagem(serie: pd.Series, nome: str) -> pd.DataFrame:
+    contagem = serie.value_counts().reset_index()
+    contagem.columns = [nome, 'Cancelamentos']
+    return contagem
+
+
+def preparar_base(df_cancel: pd.DataFrame, colunas: dict) -> pd.DataFrame:
+    """Cópia de `df_cancel` com as conversões de tipo e limpezas usadas pelas abas."""
+    # Cópia rasa: com copy-on-write só as colunas convertidas abaixo ganham memória nova
+    base = df_cancel.copy(deep=False)
+    col_tipo = colunas.get('tipo')
+
+    if col_tipo is not None:
+        base[col_tipo] = base[col_tipo].astype(str).str.strip().str.capitalize()
+    if colunas.get('conteineres') is not None:
+        base[colunas['conteineres']] = pd.to_numeric(base[colunas['conteineres']], errors='coerce')
+    # Armador, País e Serviço com os rótulos canônicos das tabelas de enriquecimento
+    base = enriquecer(base, colunas)
+
+    # Tempo de permanência em horas: ETA/ETD ou, na falta delas, início/fim de operação
+    if 'Estimativa Chegada ETA' in base.columns and 'Estimativa Saída ETD' in base.columns:
+        inicio, fim = 'Estimativa Chegada ETA', 'Estimativa Saída ETD'
+    elif 'Início Operação' in base.columns and 'Fim Operação' in base.columns:
+        inicio, fim = 'Início Operação', 'Fim Operação'
+    else:
+        inicio = fim = None
+    if inicio is not None:
+        # Datas dd/mm/aaaa das exportações: `para_datas` não troca dia e mês quando o dia é <= 12
+        base[inicio] = para_datas(base[inicio])
+        base[fim] = para_datas(base[fim])
+        base['Tempo_Permanencia'] = (base[fim] - base[inicio]).dt.total_seconds() / 3600
+
+    for coluna in ('Comprimento', 'Largura'):
+        if coluna in base.columns:
+            base[coluna] = pd.to_numeric(base[coluna], errors='coerce')
+    return base
+
+
+@analise("rotas")
+def contar_rotas(base, colunas):
+    if colunas.get('rota') is None:
+        return None
+    return _contagem(base[colunas['rota']], 'Rota')
+
+
+@analise("tipos")
+def contar_tipos(base, colunas):
+    if colunas.get('tipo') is None:
+        return None
+    return _contagem(base[colunas['tipo']], 'TipoNavio')
+
+
+@analise("conteineres")
+def estatisticas_conteineres(base, colunas):
+    col_conteineres = colunas.get('conteineres')
+    if col_conteineres is None:
+        return None
+    validos = base[[col_conteineres]].dropna()
+    return {"validos": validos, "estatisticas": validos[col_conteineres].describe().reset_index()}
+
+
+@analise("armadores")
+def contar_armadores(base, colunas):
+    if colunas.get('armador') is None:
+        return None
+    return _contagem(base[colunas['armador']], 'Armador')
+
+
+@analise("permanencia")
+def tempo_permanencia(base, colunas):
+    if 'Tempo_Permanencia' not in base.columns:
+        return None
+    col_armador = colunas.get('armador')
+    df_tempo = base.loc[base['Tempo_Permanencia'] > 0, ['Tempo_Permanencia', *([col_armador] if col_armador else [])]]
+    por_armador = None
+    if col_armador is not None:
+        por_armador = (df_tempo.groupby(col_armador)['Tempo_Permanencia'].mean().reset_index()
+                       .sort_values('Tempo_Permanencia', ascending=False))
+    return {"tempos": df_tempo, "por_armador": por_armador}
+
+
+@analise("servicos")
+def contar_servicos(base, colunas):
+    if 'Serviço' not in base.columns:
+        return None
+    return _contagem(base['Serviço'], 'Serviço')
+
+
+@analise("dimensoes")
+def dimensoes_navios(base, colunas):
+    if not ('Comprimento' in base.columns and 'Largura' in base.columns):
+        return None
+    extras = [colunas['status']] if colunas.get('status') else []
+    return base[['Comprimento', 'Largura', *extras]].dropna(subset=['Comprimento', 'Largura'])
+
+
+@analise("correlacao")
+def matriz_correlacao(base, colunas):
+    colunas_numericas = base.select_dtypes(include=[np.number]).columns.tolist()
+    if len(colunas_numericas) <= 1:
+        return None
+    return base[colunas_numericas].corr()
+
+
+@analise("custos")
+def analise_custos(base, colunas):
+    col_conteineres, col_data, col_armador = colunas.get('conteineres'), colunas.get('data'), colunas.get('armador')
+    if col_conteineres is None:
+        return None
+    extras = [c for c in (col_data, col_armador) if c is not None]
+    df_custos = calcular_custos(base[[col_conteineres, *extras]], col_conteineres)
+
+    mensais = None
+    if col_data is not None:
+        mensais = (df_custos.groupby(pd.to_datetime(df_custos[col_data]).dt.to_period("M").rename("Mes"))
+                   ["CUSTO_TOTAL"].sum().round(2).reset_index()
+                   .assign(Mes=lambda d: d["Mes"].astype(str)))
+
+    por_armador = None
+    if col_armador is not None:
+        por_armador = (df_custos.groupby(col_armador)["CUSTO_TOTAL"]
+                       .agg(['sum', 'mean', 'count'])
+                       .reset_index()
+                       .rename(columns={'sum': 'Custo Total', 'mean': 'Custo Médio', 'count': 'Quantidade'})
+                       .sort_values('Custo Total', ascending=False))
+
+    return {
+        "total": df_custos["CUSTO_TOTAL"],
+        "teus": df_custos[col_conteineres].sum(),
+        "componentes": df_custos[COLUNAS_CUSTO].sum(),
+        "mensais": mensais,
+        "por_armador": por_armador,
+    }
+
+
+class PreComputacao:
+    """Dispara todas as análises em threads e entrega cada resultado quando fica pronto."""
+
+    def __init__(self, df_cancel: pd.DataFrame, colunas: dict, max_threads: int | None = None):
+        self.colunas = colunas
+        executor = ThreadPoolExecutor(max_workers=max_threads or min(len(ANALISES), os.cpu_count() or 1),
+                                      thread_name_prefix="precomputacao")
+        # A base é a primeira tarefa da fila; as análises esperam por ela
+        self._base = executor.submit(preparar_base, df_cancel, colunas)
+        self.futuros = {
+            nome: executor.submit(lambda funcao=funcao: funcao(self._base.result(), colunas))
+            for nome, funcao in ANALISES.items()
+        }
+        executor.shutdown(wait=False)
+
+    def resultado(self, nome: str):
+        """Resultado da análise, aguardando apenas ela se ainda estiver em cálculo."""
+        return self.futuros[nome].result()
+
+    @property
+    def prontas(self) -> int:
+        return sum(futuro.done() for futuro in self.futuros.values())
+
+    @property
+    def total(self) -> int:
+        return len(self.futuros)
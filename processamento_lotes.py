@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Processamento em lotes (out-of-core) da programação de navios.
+
+Lê a planilha em blocos de linhas, aplica em cada bloco o filtro de
+cancelamento, a conversão de datas e o cálculo de custos de `dados_navios`
+e guarda apenas agregados parciais (contagens, somas, médias e histogramas),
+que são mesclados ao final. Nenhum bloco é mantido após ser processado, então
+a memória de pico fica limitada ao tamanho de um lote.
+
+As contagens por dimensão (navio, rota, armador...) ficam em sketches Top-K
+de tamanho fixo (ver `sketches`); a recontagem exata só roda sob demanda,
+com `recontar_exato`.
+"""
+
+import math
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from importacao_tardia import importar_tardio
+from sketches import CuboDistintos, ResumoTopK
+from dados_navios import (
+    CUSTOS_PADRAO,
+    calcular_custos,
+    converter_datas,
+    filtrar_cancelamentos,
+)
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow é opcional; só é necessário para .parquet
+    pq = None
+
+# Carregado só quando uma planilha é percorrida em lotes
+openpyxl = importar_tardio("openpyxl")
+
+TAMANHO_LOTE_PADRAO = 50_000
+LARGURA_BIN_TEUS = 100
+
+
+def _nomes_unicos(cabecalho) -> list[str]:
+    """Remove espaços e numera nomes repetidos como o pandas ('Movs', 'Movs.1')."""
+    vistos = Counter()
+    nomes = []
+    for valor in cabecalho:
+        nome = str(valor).strip() if valor is not None else "Unnamed"
+        if vistos[nome]:
+            nomes.append(f"{nome}.{vistos[nome]}")
+        else:
+            nomes.append(nome)
+        vistos[nome] += 1
+    return nomes
+
+
+def _extensao(origem) -> str:
+    nome = origem if isinstance(origem, (str, os.PathLike)) else getattr(origem, "name", "")
+    return os.path.splitext(str(nome))[1].lower() or ".xlsx"
+
+
+def ler_cabecalho(origem) -> list[str]:
+    """Lê apenas a linha de cabeçalho da planilha, sem carregar os dados."""
+    extensao = _extensao(origem)
+    if extensao == ".csv":
+        colunas = pd.read_csv(origem, nrows=0).columns
+        if hasattr(origem, "seek"):
+            origem.seek(0)
+        return _nomes_unicos(colunas)
+    if extensao == ".parquet":
+        return _nomes_unicos(pq.ParquetFile(origem).schema_arrow.names)
+    wb = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+    try:
+        cabecalho = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+    if hasattr(origem, "seek"):
+        origem.seek(0)
+    return _nomes_unicos(cabecalho)
+
+
+def ler_lotes(origem, tamanho_lote: int = TAMANHO_LOTE_PADRAO, colunas: list[str] | None = None):
+    """Gera DataFrames de até `tamanho_lote` linhas a partir de .xlsx, .csv ou .parquet.
+
+    Se `colunas` for informado, apenas essas colunas são materializadas em cada lote.
+    """
+    extensao = _extensao(origem)
+
+    if extensao == ".csv":
+        usecols = (lambda c: c.strip() in colunas) if colunas else None
+        for lote in pd.read_csv(origem, chunksize=tamanho_lote, usecols=usecols):
+            lote.columns = lote.columns.str.strip()
+            yield lote
+        return
+
+    if extensao == ".parquet":
+        if pq is None:
+            raise ImportError("Leitura de .parquet em lotes requer o pacote 'pyarrow'.")
+        arquivo = pq.ParquetFile(origem)
+        for batch in arquivo.iter_batches(batch_size=tamanho_lote, columns=colunas):
+            lote = batch.to_pandas()
+            lote.columns = lote.columns.str.strip()
+            yield lote
+        return
+
+    # Excel: modo somente leitura do openpyxl percorre as linhas sem carregar a planilha
+    wb = openpyxl.load_workbook(origem, read_only=True, data_only=True)
+    try:
+        linhas = wb.active.iter_rows(values_only=True)
+        nomes = _nomes_unicos(next(linhas, ()))
+        if colunas:
+            indices = [i for i, nome in enumerate(nomes) if nome in colunas]
+        else:
+            indices = list(range(len(nomes)))
+        nomes_lote = [nomes[i] for i in indices]
+
+        buffer = []
+        for linha in linhas:
+            buffer.append([linha[i] if i < len(linha) else None for i in indices])
+            if len(buffer) >= tamanho_lote:
+                yield pd.DataFrame(buffer, columns=nomes_lote)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=nomes_lote)
+    finally:
+        wb.close()
+
+
+class AgregadosLotes:
+    """Agregados parciais mescláveis de cancelamentos (contagens, somas, médias e histogramas)."""
+
+    def __init__(self, dimensoes: list[str], largura_bin: float = LARGURA_BIN_TEUS,
+                 dimensoes_cubo: list[str] | None = None, medidas_distintas: dict[str, str] | None = None):
+        self.dimensoes = list(dimensoes)
+        self.cubo = None
+        if dimensoes_cubo and medidas_distintas:
+            self.cubo = CuboDistintos(dimensoes_cubo, medidas_distintas)
+        self.largura_bin = largura_bin
+        self.total_registros = 0
+        self.total_cancelados = 0
+        self.resumos = {dim: ResumoTopK() for dim in self.dimensoes}
+        self.mensal = Counter()
+        self.soma_teus = 0.0
+        self.n_teus = 0
+        self.soma_custo = 0.0
+        self.n_custo = 0
+        self.custo_por_armador = Counter()
+        self.custo_mensal = Counter()
+        self.histograma_teus = Counter()
+        self.data_min = None
+        self.data_max = None
+
+    # ------------------------------------------------------------------
+    # Atualização e mescla
+    # ------------------------------------------------------------------
+    def atualizar(self, df_canc: pd.DataFrame, n_registros: int, col_data: str | None = None,
+                  col_teus: str | None = None, col_armador: str | None = None, n_teus: int | None = None):
+        """Acumula os agregados de um lote já filtrado e preparado.
+
+        `n_teus` é a quantidade de TEUs informados no lote, para quando `col_teus`
+        já teve os ausentes preenchidos com 0 (por `calcular_custos`); por padrão,
+        os valores não nulos de `col_teus`.
+        """
+        self.total_registros += n_registros
+        self.total_cancelados += len(df_canc)
+
+        for dim in self.dimensoes:
+            if dim in df_canc.columns:
+                self.resumos[dim].atualizar(df_canc[dim])
+
+        if self.cubo is not None:
+            self.cubo.atualizar(df_canc)
+
+        if col_data and 'Y-M' in df_canc.columns and not df_canc.empty:
+            self.mensal.update(df_canc['Y-M'].value_counts().to_dict())
+            menor, maior = df_canc[col_data].min(), df_canc[col_data].max()
+            self.data_min = menor if self.data_min is None else min(self.data_min, menor)
+            self.data_max = maior if self.data_max is None else max(self.data_max, maior)
+
+        if col_teus and col_teus in df_canc.columns:
+            teus = df_canc[col_teus].to_numpy(dtype=float)
+            self.soma_teus += float(np.nansum(teus))
+            self.n_teus += int(np.count_nonzero(~np.isnan(teus))) if n_teus is None else n_teus
+            bins = np.floor(teus / self.largura_bin).astype(np.int64)
+            self.histograma_teus.update(dict(zip(*np.unique(bins, return_counts=True))))
+
+        if "CUSTO_TOTAL" in df_canc.columns:
+            self.soma_custo += float(df_canc["CUSTO_TOTAL"].sum())
+            self.n_custo += len(df_canc)
+            if col_armador and col_armador in df_canc.columns:
+                por_armador = df_canc.groupby(df_canc[col_armador].fillna("Não Informado"))["CUSTO_TOTAL"].sum()
+                self.custo_por_armador.update(por_armador.to_dict())
+            if 'Y-M' in df_canc.columns:
+                self.custo_mensal.update(df_canc.groupby('Y-M')["CUSTO_TOTAL"].sum().to_dict())
+
+    def mesclar(self, outro: "AgregadosLotes") -> "AgregadosLotes":
+        """Incorpora os agregados de outro processamento (outro arquivo, terminal ou período)."""
+        if outro.largura_bin != self.largura_bin:
+            raise ValueError("Não é possível mesclar histogramas com larguras de bin diferentes.")
+        self.total_registros += outro.total_registros
+        self.total_cancelados += outro.total_cancelados
+        for dim, resumo in outro.resumos.items():
+            if dim in self.resumos:
+                self.resumos[dim].mesclar(resumo)
+            else:
+                self.dimensoes.append(dim)
+                self.resumos[dim] = resumo
+        if outro.cubo is not None:
+            self.cubo = outro.cubo if self.cubo is None else self.cubo.mesclar(outro.cubo)
+        self.mensal.update(outro.mensal)
+        self.soma_teus += outro.soma_teus
+        self.n_teus += outro.n_teus
+        self.soma_custo += outro.soma_custo
+        self.n_custo += outro.n_custo
+        self.custo_por_armador.update(outro.custo_por_armador)
+        self.custo_mensal.update(outro.custo_mensal)
+        self.histograma_teus.update(outro.histograma_teus)
+        for data in (outro.data_min, outro.data_max):
+            if data is not None:
+                self.data_min = data if self.data_min is None else min(self.data_min, data)
+                self.data_max = data if self.data_max is None else max(self.data_max, data)
+        return self
+
+    # ------------------------------------------------------------------
+    # Resultados
+    # ------------------------------------------------------------------
+    @property
+    def media_teus(self) -> float:
+        """Média de TEUs só dos cancelamentos com TEUs informados."""
+        return self.soma_teus / self.n_teus if self.n_teus else math.nan
+
+    @property
+    def custo_medio(self) -> float:
+        return self.soma_custo / self.n_custo if self.n_custo else math.nan
+
+    def top(self, dimensao: str, n: int = 10) -> pd.DataFrame:
+        """Top `n` valores de uma dimensão (lido do sketch) com o erro máximo de cada contagem."""
+        return self.resumos[dimensao].top(n, nome=dimensao)
+
+    def serie_mensal(self) -> pd.DataFrame:
+        cnt_m = pd.DataFrame(sorted(self.mensal.items()), columns=["Y-M", "Cancelamentos"])
+        cnt_m["Y-M"] = pd.to_datetime(cnt_m["Y-M"], format="%Y-%m")
+        return cnt_m
+
+    def custos_por_armador(self, n: int = 10) -> pd.DataFrame:
+        return pd.DataFrame(self.custo_por_armador.most_common(n), columns=["Armador", "Prejuízo"])
+
+    def histograma(self) -> pd.DataFrame:
+        """Histograma de TEUs com bins de largura fixa `largura_bin`."""
+        itens = sorted(self.histograma_teus.items())
+        return pd.DataFrame({
+            "Início": [int(b) * self.largura_bin for b, _ in itens],
+            "Fim": [(int(b) + 1) * self.largura_bin for b, _ in itens],
+            "Frequência": [c for _, c in itens],
+        })
+
+
+def recontar_exato(origem, col_status: str, dimensao: str, n: int = 10,
+                   tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> pd.DataFrame:
+    """Recontagem exata do Top `n` de uma dimensão, lendo só as duas colunas necessárias."""
+    contagem = Counter()
+    for lote in ler_lotes(origem, tamanho_lote=tamanho_lote, colunas=[col_status, dimensao]):
+        lote_canc = filtrar_cancelamentos(lote, col_status)
+        contagem.update(lote_canc[dimensao].dropna().astype(str).value_counts().to_dict())
+    return pd.DataFrame(contagem.most_common(n), columns=[dimensao, "Cancelamentos"])
+
+
+def processar_em_lotes(origem, col_status: str, col_data: str | None = None,
+                       col_teus: str | None = None, col_armador: str | None = None,
+                       dimensoes: list[str] | None = None, custos: dict | None = None,
+                       medidas_distintas: dict[str, str] | None = None,
+                       tamanho_lote: int = TAMANHO_LOTE_PADRAO) -> AgregadosLotes:
+    """Percorre a origem em lotes e devolve os agregados de cancelamentos mesclados.
+
+    `medidas_distintas` (nome -> coluna) liga o cubo HyperLogLog por mês e
+    armador, com contagens aproximadas de valores distintos por célula.
+    """
+    dimensoes = [d for d in (dimensoes or []) if d]
+    medidas_distintas = {nome: col for nome, col in (medidas_distintas or {}).items() if col}
+    colunas = {col_status, col_data, col_teus, col_armador, *dimensoes, *medidas_distintas.values()} - {None}
+    dimensoes_cubo = [d for d in ('Y-M' if col_data else None, col_armador) if d]
+    agregados = AgregadosLotes(dimensoes, dimensoes_cubo=dimensoes_cubo, medidas_distintas=medidas_distintas)
+
+    for lote in ler_lotes(origem, tamanho_lote=tamanho_lote, colunas=list(colunas)):
+        n_registros = len(lote)
+        lote_canc = filtrar_cancelamentos(lote, col_status)
+        del lote
+        if col_data:
+            converter_datas(lote_canc, col_data)
+        n_teus = None
+        if col_teus:
+            # Contados antes de `calcular_custos` preencher os ausentes com 0
+            n_teus = int(pd.to_numeric(lote_canc[col_teus], errors='coerce').notna().sum())
+            calcular_custos(lote_canc, col_teus, custos or CUSTOS_PADRAO)
+        agregados.atualizar(lote_canc, n_registros, col_data, col_teus, col_armador, n_teus)
+
+    return agregados
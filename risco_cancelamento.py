@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Risco de cancelamento das escalas programadas (regressão logística em NumPy).
+
+As escalas já encerradas da programação são o histórico rotulado
+(cancelada = 1, concluída = 0); as que ainda estão programadas são
+pontuadas. Atributos, todos das colunas existentes:
+
+- Armador, Serviço, Berço, Tipo e País (rótulos canônicos de
+  `enriquecimento`), em one-hot; categorias com menos de `MIN_OCORRENCIAS`
+  escalas no treino caem na categoria de referência
+- Comprimento e Largura padronizados, com indicador de ausência
+- mês e dia da semana da ETA
+- antecedência: horas entre o Deadline Dry e a ETA e dias entre o início do
+  recebimento de cheios e a ETA
+
+O ajuste é por Newton (IRLS) com penalização L2, sobre a matriz de atributos
+inteira: poucas iterações de álgebra matricial, segundos mesmo no histórico
+completo. O modelo é ajustado nas escalas encerradas mais antigas e
+calibrado por Platt nas últimas `FRACAO_VALIDACAO` (por ETA); é esse mesmo
+modelo que pontua, então AUC, Brier e a tabela de calibração da validação
+temporal descrevem as probabilidades exibidas. Todas as escalas programadas
+(fora as já em operação) são pontuadas em uma única multiplicação
+matriz-vetor.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from dados_navios import VALORES_CANCELADOS, custo_por_cancelamento, para_datas
+from enriquecimento import NAO_INFORMADO, enriquecer
+
+# Situações de escalas realizadas (rótulo 0); as demais, fora os cancelamentos, são programadas
+SITUACOES_CONCLUIDAS = ['fechado', 'fechada', 'encerrado', 'encerrada', 'concluido', 'concluído',
+                        'finalizado', 'operado']
+# Situações de escalas em andamento: sem rótulo, mas também não são mais programadas
+SITUACOES_EM_ANDAMENTO = ['em operação', 'em operacao', 'operando', 'atracado', 'atracada', 'em andamento']
+CAMPOS_CATEGORICOS = ["armador", "servico", "berco", "tipo", "pais"]
+CAMPOS_NUMERICOS = ["comprimento", "largura"]
+# Antecedência: nome do atributo -> (campo de data anterior à ETA, unidade em horas)
+ANTECEDENCIAS = {
+    "Deadline → ETA (h)": ("deadline", 1),
+    "Recebimento cheio → ETA (d)": ("recebimento_cheio", 24),
+}
+MIN_OCORRENCIAS = 5
+L2_PADRAO = 1.0
+FRACAO_VALIDACAO = 0.2
+N_FAIXAS_CALIBRACAO = 10
+MIN_CANCELAMENTOS = 10
+
+
+def rotulos(status: pd.Series) -> np.ndarray:
+    """1 = cancelada, 0 = concluída, -1 = ainda programada (sem rótulo)."""
+    normalizado = status.astype(str).str.strip().str.lower()
+    return np.select([normalizado.isin(VALORES_CANCELADOS).to_numpy(),
+                      normalizado.isin(SITUACOES_CONCLUIDAS).to_numpy()], [1, 0], default=-1)
+
+
+def em_andamento(status: pd.Series) -> np.ndarray:
+    """Escalas já em curso (ex.: 'Em operação'), que `rotulos` marca como -1."""
+    return status.astype(str).str.strip().str.lower().isin(SITUACOES_EM_ANDAMENTO).to_numpy()
+
+
+def com_datas(df: pd.DataFrame, colunas: dict, convertidas: dict | None = None) -> pd.DataFrame:
+    """`df` (cópia rasa) com a ETA e as datas de antecedência já convertidas, uma única vez.
+
+    `convertidas` (coluna -> Série já convertida, ex. da validação) evita
+    converter de novo o que já foi convertido.
+    """
+    convertidas = convertidas or {}
+    datas = {}
+    for campo in ["data", *(campo for campo, _ in ANTECEDENCIAS.values())]:
+        coluna = colunas.get(campo)
+        if coluna:
+            datas[coluna] = convertidas[coluna] if coluna in convertidas else para_datas(df[coluna])
+    return df.assign(**datas)
+
+
+def atributos_brutos(df: pd.DataFrame, colunas: dict) -> pd.DataFrame:
+    """Atributos do modelo por escala, antes da codificação (categorias, números e antecedências)."""
+    base = enriquecer(df, colunas)
+    eta = para_datas(df[colunas["data"]])
+    brutos = {}
+    for campo in CAMPOS_CATEGORICOS:
+        if colunas.get(campo):
+            brutos[campo] = base[colunas[campo]].astype("string").str.strip().fillna(NAO_INFORMADO)
+    for campo in CAMPOS_NUMERICOS:
+        if colunas.get(campo):
+            brutos[campo] = pd.to_numeric(df[colunas[campo]], errors="coerce")
+    brutos["mes"] = eta.dt.month.astype("Int64").astype("string").fillna(NAO_INFORMADO)
+    brutos["dia_semana"] = eta.dt.dayofweek.astype("Int64").astype("string").fillna(NAO_INFORMADO)
+    for nome, (campo, horas) in ANTECEDENCIAS.items():
+        if colunas.get(campo):
+            brutos[nome] = (eta - para_datas(df[colunas[campo]])).dt.total_seconds() / 3600 / horas
+    return pd.DataFrame(brutos, index=df.index)
+
+
+class Codificador:
+    """One-hot das categorias frequentes e padronização dos números (com indicador de ausência)."""
+
+    def __init__(self, brutos: pd.DataFrame, min_ocorrencias: int = MIN_OCORRENCIAS):
+        self.categorias, self.numericos = {}, {}
+        self.nomes = ["Intercepto"]
+        for coluna in brutos.columns:
+            valores = brutos[coluna]
+            if pd.api.types.is_numeric_dtype(valores):
+                validos = valores.dropna()
+                # Limites nos quantis extremos: antecedências de meses não dominam o ajuste
+                inferior, superior = (validos.quantile([0.01, 0.99]).to_numpy() if len(validos) else (0.0, 0.0))
+                recortados = validos.clip(inferior, superior)
+                self.numericos[coluna] = (inferior, superior, recortados.mean() if len(validos) else 0.0,
+                                          recortados.std() if len(validos) > 1 and recortados.std() > 0 else 1.0)
+                self.nomes += [coluna, f"{coluna} ausente"]
+            else:
+                contagens = valores.value_counts()
+                self.categorias[coluna] = pd.Index(sorted(contagens.index[contagens >= min_ocorrencias]))
+                self.nomes += [f"{coluna} = {categoria}" for categoria in self.categorias[coluna]]
+
+    def transformar(self, brutos: pd.DataFrame) -> np.ndarray:
+        n = len(brutos)
+        X = np.zeros((n, len(self.nomes)))
+        X[:, 0] = 1.0
+        linhas, posicao = np.arange(n), 1
+        for coluna in brutos.columns:
+            if coluna in self.numericos:
+                inferior, superior, media, desvio = self.numericos[coluna]
+                valores = brutos[coluna].to_numpy(dtype=float, na_value=np.nan)
+                ausentes = np.isnan(valores)
+                X[:, posicao] = np.where(ausentes, 0.0, (np.clip(valores, inferior, superior) - media) / desvio)
+                X[:, posicao + 1] = ausentes
+                posicao += 2
+            elif coluna in self.categorias:
+                # Categorias fora do vocabulário (código -1) ficam na referência: todos os indicadores em zero
+                codigos = self.categorias[coluna].get_indexer(brutos[coluna])
+                conhecidas = codigos >= 0
+                X[linhas[conhecidas], posicao + codigos[conhecidas]] = 1.0
+                posicao += len(self.categorias[coluna])
+        return X
+
+
+def _sigmoide(z: np.ndarray) -> np.ndarray:
+    return np.exp(-np.logaddexp(0.0, -z))
+
+
+def ajustar_logistica(X: np.ndarray, y: np.ndarray, l2: float = L2_PADRAO,
+                      max_iter: int = 50, tolerancia: float = 1e-8) -> np.ndarray:
+    """Pesos da regressão logística por Newton (IRLS); a primeira coluna (intercepto) não é penalizada."""
+    penalizacao = np.full(X.shape[1], float(l2))
+    penalizacao[0] = 0.0
+    pesos = np.zeros(X.shape[1])
+    for _ in range(max_iter):
+        p = _sigmoide(X @ pesos)
+        gradiente = X.T @ (p - y) + penalizacao * pesos
+        # X' W X montada como R'R, com R = raiz(W) X
+        raiz = X * np.sqrt(p * (1 - p))[:, None]
+        hessiana = raiz.T @ raiz + np.diag(penalizacao + 1e-9)
+        passo = np.linalg.solve(hessiana, gradiente)
+        pesos -= passo
+        if np.abs(passo).max() < tolerancia:
+            break
+    return pesos
+
+
+def auc(y: np.ndarray, p: np.ndarray) -> float:
+    """Área sob a curva ROC pela estatística de Mann-Whitney (empates com posto médio)."""
+    positivos = int(y.sum())
+    negativos = len(y) - positivos
+    if not positivos or not negativos:
+        return float("nan")
+    postos = pd.Series(p).rank().to_numpy()
+    return float((postos[y == 1].sum() - positivos * (positivos + 1) / 2) / (positivos * negativos))
+
+
+def tabela_calibracao(y: np.ndarray, p: np.ndarray, n_faixas: int = N_FAIXAS_CALIBRACAO) -> pd.DataFrame:
+    """Probabilidade média prevista x taxa observada por faixa (quantis) de probabilidade."""
+    faixas = pd.qcut(p, n_faixas, labels=False, duplicates="drop")
+    tabela = pd.DataFrame({"faixa": faixas, "Prevista": p, "Observada": y}).groupby("faixa")
+    return tabela.agg(Prevista=("Prevista", "mean"), Observada=("Observada", "mean"),
+                      Escalas=("Observada", "size")).reset_index(drop=True)
+
+
+class ModeloRisco:
+    """Regressão logística calibrada sobre as escalas encerradas da programação."""
+
+    def __init__(self, codificador: Codificador, pesos: np.ndarray, platt: np.ndarray,
+                 metricas: dict, calibracao: pd.DataFrame):
+        self.codificador = codificador
+        self.pesos = pesos
+        self.platt = platt
+        self.metricas = metricas
+        self.calibracao = calibracao
+
+    @classmethod
+    def treinar(cls, df: pd.DataFrame, colunas: dict, l2: float = L2_PADRAO,
+                fracao_validacao: float = FRACAO_VALIDACAO, convertidas: dict | None = None) -> "ModeloRisco":
+        """Ajusta o modelo nas escalas encerradas de `df` (campos lógicos em `colunas`)."""
+        inicio = time.perf_counter()
+        df = com_datas(df, colunas, convertidas)
+        y_todos = rotulos(df[colunas["status"]])
+        rotuladas = y_todos >= 0
+        if (y_todos == 1).sum() < MIN_CANCELAMENTOS or (y_todos == 0).sum() < MIN_CANCELAMENTOS:
+            raise ValueError("Histórico insuficiente: são necessárias ao menos "
+                             f"{MIN_CANCELAMENTOS} escalas canceladas e {MIN_CANCELAMENTOS} concluídas.")
+        brutos = atributos_brutos(df.loc[rotuladas], colunas)
+        y = y_todos[rotuladas].astype(float)
+
+        # Validação temporal: as escalas encerradas mais recentes (por ETA) ficam fora do treino
+        ordem = np.argsort(para_datas(df.loc[rotuladas, colunas["data"]]).to_numpy(), kind="stable")
+        corte = int(len(ordem) * (1 - fracao_validacao))
+        treino, validacao = ordem[:corte], ordem[corte:]
+        codificador = Codificador(brutos.iloc[treino])
+        pesos = ajustar_logistica(codificador.transformar(brutos.iloc[treino]), y[treino], l2)
+        z_validacao = codificador.transformar(brutos.iloc[validacao]) @ pesos
+        # Platt: logística de uma variável (o escore) ajustada na validação. O modelo que pontua é
+        # este mesmo (sem reajuste no histórico inteiro), para que a calibração e as métricas valham
+        platt = ajustar_logistica(np.column_stack([np.ones(len(validacao)), z_validacao]), y[validacao], 1e-6)
+        p_validacao = _sigmoide(platt[0] + platt[1] * z_validacao)
+        p_clip = np.clip(p_validacao, 1e-12, 1 - 1e-12)
+        metricas = {
+            "escalas_treino": len(treino),
+            "escalas_validacao": len(validacao),
+            "atributos": len(codificador.nomes),
+            "taxa_base": float(y.mean()),
+            "auc_validacao": auc(y[validacao], p_validacao),
+            "brier_validacao": float(np.mean((p_validacao - y[validacao]) ** 2)),
+            "log_loss_validacao": float(-np.mean(y[validacao] * np.log(p_clip)
+                                                 + (1 - y[validacao]) * np.log(1 - p_clip))),
+            "tempo_treino_s": time.perf_counter() - inicio,
+        }
+        return cls(codificador, pesos, platt, metricas, tabela_calibracao(y[validacao], p_validacao))
+
+    def pontuar(self, df: pd.DataFrame, colunas: dict) -> np.ndarray:
+        """Probabilidade calibrada de cancelamento de cada linha de `df`, em uma chamada."""
+        z = self.codificador.transformar(atributos_brutos(df, colunas)) @ self.pesos
+        return _sigmoide(self.platt[0] + self.platt[1] * z)
+
+    def fatores(self, n: int = 10) -> pd.DataFrame:
+        """Atributos de maior peso (em módulo), com a razão de chances correspondente."""
+        tabela = pd.DataFrame({"Atributo": self.codificador.nomes[1:], "Peso": self.pesos[1:]})
+        tabela["Razão de chances"] = np.exp(tabela["Peso"])
+        return tabela.reindex(tabela["Peso"].abs().sort_values(ascending=False).index).head(n).reset_index(drop=True)
+
+
+def data_referencia(df: pd.DataFrame, colunas: dict) -> pd.Timestamp:
+    """'Hoje' da exportação: a última ETA entre as escalas já encerradas."""
+    encerradas = rotulos(df[colunas["status"]]) >= 0
+    return para_datas(df.loc[encerradas, colunas["data"]]).max()
+
+
+def riscos_programados(modelo: ModeloRisco, df: pd.DataFrame, colunas: dict, custos: dict | None = None,
+                       horizonte_dias: int | None = None, convertidas: dict | None = None) -> pd.DataFrame:
+    """Escalas ainda programadas com a probabilidade de cancelamento, TEUs e custo esperados em risco.
+
+    As escalas já em operação (`SITUACOES_EM_ANDAMENTO`) não entram.
+
+    Com `horizonte_dias`, ficam só as escalas com ETA até essa distância da
+    data de referência da exportação (as atrasadas, com ETA anterior, ficam).
+    """
+    df = com_datas(df, colunas, convertidas)
+    status = df[colunas["status"]]
+    programadas = df.loc[(rotulos(status) == -1) & ~em_andamento(status)]
+    eta = para_datas(programadas[colunas["data"]])
+    if horizonte_dias is not None:
+        limite = data_referencia(df, colunas) + pd.Timedelta(days=horizonte_dias)
+        programadas, eta = programadas.loc[eta <= limite], eta[eta <= limite]
+
+    probabilidade = modelo.pontuar(programadas, colunas)
+    riscos = pd.DataFrame({"ETA": eta}, index=programadas.index)
+    for campo in ["navio", "viagem", "armador", "servico", "berco"]:
+        if colunas.get(campo):
+            riscos[colunas[campo]] = programadas[colunas[campo]]
+    riscos["Probabilidade"] = probabilidade
+    if colunas.get("conteineres"):
+        teus = pd.to_numeric(programadas[colunas["conteineres"]], errors="coerce").fillna(0)
+        riscos["TEUs"] = teus
+        riscos["TEUs em risco"] = probabilidade * teus
+        riscos["Custo esperado"] = probabilidade * custo_por_cancelamento(teus, custos)
+    return riscos.sort_values("Probabilidade", ascending=False, kind="stable", ignore_index=True)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Rotas origem-destino a partir da coluna 'De / Para'.
+
+A coluna traz o porto anterior e o próximo porto como texto livre
+(`PACTB / BMFPT`, ` / FIMAN`...), então o mesmo par escrito de formas
+diferentes caía em grupos diferentes. `codificar_rotas` separa os dois
+códigos com operações vetorizadas de string, normaliza (maiúsculas, sem
+espaços) e troca cada código por um ID inteiro, uma única vez por fonte.
+
+`MatrizOD` guarda a matriz origem x destino em formato esparso (coordenadas):
+só as células com cancelamentos existem, então milhares de portos não
+materializam uma matriz densa de n² posições. Dela saem os pares mais
+cancelados, os totais por porto e as arestas do gráfico de rede.
+"""
+
+import numpy as np
+import pandas as pd
+
+NAO_INFORMADO = "Não Informado"
+
+
+def separar_rotas(serie: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Porto anterior e próximo porto de 'De / Para', normalizados (ausente -> NA)."""
+    partes = serie.astype("string").str.split("/", n=1, expand=True).reindex(columns=[0, 1])
+    portos = []
+    for coluna in (0, 1):
+        codigo = partes[coluna].astype("string").str.replace(r"\s+", "", regex=True).str.upper()
+        portos.append(codigo.mask(codigo == ""))
+    return portos[0], portos[1]
+
+
+def codificar_rotas(serie: pd.Series) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """IDs inteiros de origem e destino por linha e a tabela de portos (ID -> código).
+
+    Origem e destino compartilham a mesma numeração; portos ausentes recebem
+    o último ID, rotulado como 'Não Informado'.
+    """
+    origem, destino = separar_rotas(serie)
+    codigos, portos = pd.factorize(pd.concat([origem, destino], ignore_index=True), sort=True)
+    codigos = np.where(codigos < 0, len(portos), codigos).astype(np.int32)
+    portos = np.append(np.asarray(portos, dtype=object), NAO_INFORMADO)
+    return codigos[:len(serie)], codigos[len(serie):], portos
+
+
+class MatrizOD:
+    """Matriz esparsa origem x destino de cancelamentos e TEUs (uma entrada por par presente)."""
+
+    def __init__(self, origem_ids: np.ndarray, destino_ids: np.ndarray, portos: np.ndarray,
+                 teus: np.ndarray | None = None):
+        self.portos = portos
+        n = len(portos)
+        # Cada par vira um índice linear; np.unique agrupa as linhas de cada célula
+        lineares = origem_ids.astype(np.int64) * n + destino_ids
+        celulas, inverso = np.unique(lineares, return_inverse=True)
+        self.origem = (celulas // n).astype(np.int32)
+        self.destino = (celulas % n).astype(np.int32)
+        self.cancelamentos = np.bincount(inverso, minlength=len(celulas))
+        pesos = np.zeros(len(lineares)) if teus is None else np.nan_to_num(np.asarray(teus, dtype=float))
+        self.teus = np.bincount(inverso, weights=pesos, minlength=len(celulas))
+
+    @classmethod
+    def de_serie(cls, serie: pd.Series, teus: pd.Series | None = None) -> "MatrizOD":
+        """Matriz direto da coluna 'De / Para' (e dos TEUs na mesma ordem)."""
+        origem, destino, portos = codificar_rotas(serie)
+        return cls(origem, destino, portos, None if teus is None else teus.to_numpy())
+
+    @property
+    def n_portos(self) -> int:
+        return len(self.portos)
+
+    @property
+    def nnz(self) -> int:
+        """Quantidade de pares origem-destino presentes."""
+        return len(self.cancelamentos)
+
+    @property
+    def nbytes(self) -> int:
+        return self.origem.nbytes + self.destino.nbytes + self.cancelamentos.nbytes + self.teus.nbytes
+
+    @property
+    def _id_nao_informado(self) -> int:
+        return self.n_portos - 1
+
+    @property
+    def sem_porto_informado(self) -> int:
+        """Cancelamentos sem o porto anterior ou o próximo porto."""
+        ausente = (self.origem == self._id_nao_informado) | (self.destino == self._id_nao_informado)
+        return int(self.cancelamentos[ausente].sum())
+
+    def pares(self, n: int | None = None, medida: str = "Cancelamentos",
+              incluir_nao_informado: bool = True) -> pd.DataFrame:
+        """Pares origem-destino ordenados pela medida ('Cancelamentos' ou 'TEUs')."""
+        selecao = np.arange(self.nnz)
+        if not incluir_nao_informado:
+            selecao = selecao[(self.origem != self._id_nao_informado) & (self.destino != self._id_nao_informado)]
+        valores = (self.cancelamentos if medida == "Cancelamentos" else self.teus)[selecao]
+        # Ordem estável: empates seguem a ordem dos códigos
+        selecao = selecao[np.argsort(-valores, kind="stable")][:n]
+        origem, destino = self.portos[self.origem[selecao]], self.portos[self.destino[selecao]]
+        return pd.DataFrame({
+            "Rota": [f"{o} / {d}" for o, d in zip(origem, destino)],
+            "Origem": origem,
+            "Destino": destino,
+            "Cancelamentos": self.cancelamentos[selecao],
+            "TEUs": self.teus[selecao].astype(np.int64),
+        })
+
+    def por_porto(self, incluir_nao_informado: bool = False) -> pd.DataFrame:
+        """Cancelamentos e TEUs de cada porto como origem e como destino."""
+        totais = pd.DataFrame({
+            "Porto": self.portos,
+            "Cancelamentos (origem)": np.bincount(self.origem, self.cancelamentos, self.n_portos).astype(np.int64),
+            "Cancelamentos (destino)": np.bincount(self.destino, self.cancelamentos, self.n_portos).astype(np.int64),
+            "TEUs (origem)": np.bincount(self.origem, self.teus, self.n_portos).astype(np.int64),
+            "TEUs (destino)": np.bincount(self.destino, self.teus, self.n_portos).astype(np.int64),
+        })
+        totais["Cancelamentos"] = totais["Cancelamentos (origem)"] + totais["Cancelamentos (destino)"]
+        if not incluir_nao_informado:
+            totais = totais.iloc[:-1]
+        return totais[totais["Cancelamentos"] > 0].sort_values("Cancelamentos", ascending=False,
+                                                               kind="stable", ignore_index=True)
+
+    def top_origens(self, n: int = 10, medida: str = "Cancelamentos") -> pd.DataFrame:
+        return self._top("origem", n, medida)
+
+    def top_destinos(self, n: int = 10, medida: str = "Cancelamentos") -> pd.DataFrame:
+        return self._top("destino", n, medida)
+
+    def _top(self, lado: str, n: int, medida: str) -> pd.DataFrame:
+        ids = self.origem if lado == "origem" else self.destino
+        totais = pd.DataFrame({
+            "Porto": self.portos,
+            "Cancelamentos": np.bincount(ids, self.cancelamentos, self.n_portos).astype(np.int64),
+            "TEUs": np.bincount(ids, self.teus, self.n_portos).astype(np.int64),
+        }).iloc[:-1]  # sem 'Não Informado'
+        totais = totais[totais["Cancelamentos"] > 0]
+        return totais.sort_values(medida, ascending=False, kind="stable", ignore_index=True).head(n)
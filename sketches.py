@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""
+Estruturas probabilísticas (sketches) mescláveis usadas na ingestão.
+
+- `SpaceSaving`: os k itens mais frequentes de um fluxo. Todo item com
+  frequência real acima de N/k está garantidamente entre os monitorados, e a
+  contagem de cada item superestima a real em no máximo o seu `erro` (<= N/k).
+- `CountMin`: estimativa pontual de frequência. Com largura ceil(e/epsilon) e
+  profundidade ceil(ln(1/delta)), a estimativa nunca subestima e excede a real
+  em no máximo epsilon*N com probabilidade 1 - delta.
+- `ResumoTopK`: combina os dois para uma dimensão (navio, rota, armador...).
+  O Top-K vem do Space-Saving e cada contagem é limitada também pelo
+  Count-Min, já que ambos são limites superiores.
+- `HyperLogLog`: contagem aproximada de valores distintos em 2^p registradores
+  de 1 byte (erro padrão ~1.04/sqrt(2^p)); mesclar é o máximo elemento a elemento.
+- `CuboDistintos`: registradores HyperLogLog por célula (mês x armador...),
+  que se agregam para qualquer combinação de dimensões e períodos.
+- `KLL`: quantis aproximados com compactadores por nível. Cada compactação
+  ordena um nível e promove um elemento de cada par (de posição par ou ímpar,
+  ao acaso) com o dobro do peso; o erro de rank fica em ~1.65/k da
+  contagem e mesclar é concatenar os níveis e compactar de novo.
+- `CuboQuantis`: um KLL por célula e medida, para p50/p90/p99 de qualquer fatia.
+"""
+
+import heapq
+import math
+
+import numpy as np
+import pandas as pd
+
+# Constantes para o hash multiplicativo de cada linha do Count-Min
+_PRIMO_HASH = np.uint64(0x9E3779B97F4A7C15)
+_UINT64_MAX = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _contagens_lote(serie: pd.Series) -> pd.Series:
+    """Contagem exata dos valores de um lote (os nulos são ignorados)."""
+    return serie.dropna().astype(str).value_counts(sort=False)
+
+
+class SpaceSaving:
+    """Resumo Space-Saving ponderado com k contadores."""
+
+    def __init__(self, k: int = 1024):
+        self.k = k
+        self.total = 0
+        self._contadores: dict[str, list[int]] = {}  # item -> [contagem, erro]
+        self._heap: list[tuple[int, str]] = []       # (contagem, item), com entradas obsoletas
+        self._ordenado = None
+
+    def _menor(self) -> str:
+        # Descarta entradas obsoletas até encontrar o menor contador vigente
+        while True:
+            contagem, item = self._heap[0]
+            atual = self._contadores.get(item)
+            if atual is not None and atual[0] == contagem:
+                return item
+            heapq.heappop(self._heap)
+
+    def adicionar(self, item: str, peso: int = 1, erro: int = 0):
+        self.total += peso
+        self._ordenado = None
+        contador = self._contadores.get(item)
+        if contador is not None:
+            contador[0] += peso
+            contador[1] += erro
+        elif len(self._contadores) < self.k:
+            contador = self._contadores[item] = [peso, erro]
+        else:
+            removido = self._menor()
+            minimo = self._contadores.pop(removido)[0]
+            contador = self._contadores[item] = [minimo + peso, minimo + erro]
+        heapq.heappush(self._heap, (contador[0], item))
+        if len(self._heap) > 4 * self.k:
+            self._heap = [(c, i) for i, (c, _) in self._contadores.items()]
+            heapq.heapify(self._heap)
+
+    def atualizar(self, contagens: pd.Series):
+        """Incorpora as contagens exatas de um lote (valor -> quantidade)."""
+        for item, peso in contagens.items():
+            self.adicionar(item, int(peso))
+
+    def _minimo(self) -> int:
+        """Contagem que um item fora do resumo pode ter (o menor contador, se o resumo está cheio)."""
+        return self._contadores[self._menor()][0] if len(self._contadores) >= self.k else 0
+
+    def mesclar(self, outro: "SpaceSaving") -> "SpaceSaving":
+        """Soma os itens comuns; o ausente de um resumo cheio recebe o mínimo dele na contagem e no erro.
+
+        Depois ficam os k maiores, e cada contagem continua limitando a real por cima
+        (contagem >= real >= contagem - erro):
+
+        >>> a, b = SpaceSaving(2), SpaceSaving(2)
+        >>> a.atualizar(pd.Series({"x": 10, "a": 3}))
+        >>> b.atualizar(pd.Series({"x": 5, "c": 6, "d": 6}))
+        >>> reais = {"x": 15, "a": 3, "c": 6, "d": 6}
+        >>> a.mesclar(b).top()
+        [('x', 16, 6), ('d', 14, 8)]
+        >>> all(c >= reais[item] >= c - e for item, c, e in a.top())
+        True
+        """
+        minimo_self, minimo_outro = self._minimo(), outro._minimo()
+        mesclados = {}
+        for item in self._contadores.keys() | outro._contadores.keys():
+            contagem_self, erro_self = self._contadores.get(item, (minimo_self, minimo_self))
+            contagem_outro, erro_outro = outro._contadores.get(item, (minimo_outro, minimo_outro))
+            mesclados[item] = [contagem_self + contagem_outro, erro_self + erro_outro]
+        maiores = heapq.nlargest(self.k, mesclados.items(), key=lambda par: (par[1][0], par[0]))
+        self._contadores = dict(maiores)
+        self._heap = [(c, i) for i, (c, _) in self._contadores.items()]
+        heapq.heapify(self._heap)
+        self.total += outro.total
+        self._ordenado = None
+        return self
+
+    @property
+    def erro_maximo(self) -> float:
+        """Limite garantido de superestimação de qualquer contagem (N/k)."""
+        return self.total / self.k
+
+    def top(self, n: int = 10) -> list[tuple[str, int, int]]:
+        """Os `n` itens de maior contagem estimada como (item, contagem, erro)."""
+        if self._ordenado is None:
+            self._ordenado = sorted(
+                ((item, c, e) for item, (c, e) in self._contadores.items()),
+                key=lambda t: (-t[1], t[0])
+            )
+        return self._ordenado[:n]
+
+
+class CountMin:
+    """Sketch Count-Min com hashes multiplicativos vetorizados."""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01, semente: int = 42):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.largura = math.ceil(math.e / epsilon)
+        self.profundidade = math.ceil(math.log(1 / delta))
+        self.semente = semente
+        rng = np.random.default_rng(semente)
+        self._a = rng.integers(1, 2**63, size=self.profundidade, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, size=self.profundidade, dtype=np.uint64)
+        self.tabela = np.zeros((self.profundidade, self.largura), dtype=np.int64)
+        self.total = 0
+
+    def _indices(self, itens) -> np.ndarray:
+        h = pd.util.hash_array(np.asarray(itens, dtype=object)) * _PRIMO_HASH
+        with np.errstate(over="ignore"):
+            mistura = h[None, :] * self._a[:, None] + self._b[:, None]
+        return ((mistura >> np.uint64(32)) % np.uint64(self.largura)).astype(np.intp)
+
+    def atualizar(self, contagens: pd.Series):
+        if contagens.empty:
+            return
+        indices = self._indices(contagens.index.to_numpy())
+        pesos = contagens.to_numpy(dtype=np.int64)
+        for linha in range(self.profundidade):
+            np.add.at(self.tabela[linha], indices[linha], pesos)
+        self.total += int(pesos.sum())
+
+    def estimar(self, itens) -> np.ndarray:
+        """Limite superior da frequência de cada item."""
+        indices = self._indices(itens)
+        return self.tabela[np.arange(self.profundidade)[:, None], indices].min(axis=0)
+
+    def mesclar(self, outro: "CountMin") -> "CountMin":
+        if (outro.largura, outro.profundidade, outro.semente) != (self.largura, self.profundidade, self.semente):
+            raise ValueError("Só é possível mesclar sketches Count-Min com os mesmos parâmetros.")
+        self.tabela += outro.tabela
+        self.total += outro.total
+        return self
+
+
+class ResumoTopK:
+    """Top-K aproximado de uma dimensão: Space-Saving limitado pelo Count-Min."""
+
+    def __init__(self, k: int = 1024, epsilon: float = 0.001, delta: float = 0.01):
+        self.space_saving = SpaceSaving(k)
+        self.count_min = CountMin(epsilon, delta)
+
+    def atualizar(self, serie: pd.Series):
+        """Incorpora um lote de valores (por exemplo, a coluna de um lote de cancelamentos)."""
+        contagens = _contagens_lote(serie)
+        self.space_saving.atualizar(contagens)
+        self.count_min.atualizar(contagens)
+
+    def mesclar(self, outro: "ResumoTopK") -> "ResumoTopK":
+        self.space_saving.mesclar(outro.space_saving)
+        self.count_min.mesclar(outro.count_min)
+        return self
+
+    @property
+    def total(self) -> int:
+        return self.space_saving.total
+
+    @property
+    def erro_maximo(self) -> float:
+        return min(self.space_saving.erro_maximo, self.count_min.epsilon * self.total)
+
+    def top(self, n: int = 10, nome: str = "Valor") -> pd.DataFrame:
+        """DataFrame com os `n` maiores: valor, contagem estimada e erro máximo da contagem."""
+        itens = self.space_saving.top(n)
+        top = pd.DataFrame(itens, columns=[nome, "Cancelamentos", "Erro máx."])
+        if not top.empty:
+            limite_cm = self.count_min.estimar(top[nome].to_numpy())
+            ajustada = np.minimum(top["Cancelamentos"].to_numpy(), limite_cm)
+            top["Erro máx."] = np.maximum(top["Erro máx."] - (top["Cancelamentos"] - ajustada), 0)
+            top["Cancelamentos"] = ajustada
+            top = top.sort_values("Cancelamentos", ascending=False, kind="stable").reset_index(drop=True)
+        return top
+
+
+def _hash64(valores) -> np.ndarray:
+    """Hash de 64 bits dos valores (como texto), estável entre execuções."""
+    return pd.util.hash_array(np.asarray(valores, dtype=str).astype(object)) * _PRIMO_HASH
+
+
+def _zeros_a_esquerda(x: np.ndarray) -> np.ndarray:
+    """Quantidade de zeros à esquerda de cada uint64 (busca binária vetorizada)."""
+    x = x.copy()
+    zeros = np.zeros(len(x), dtype=np.int64)
+    for passo in (32, 16, 8, 4, 2, 1):
+        sem_bits = x <= (_UINT64_MAX >> np.uint64(passo))
+        zeros[sem_bits] += passo
+        x[sem_bits] <<= np.uint64(passo)
+    zeros[x == 0] = 64
+    return zeros
+
+
+class HyperLogLog:
+    """Registradores HyperLogLog com precisão p (2^p registradores de 1 byte)."""
+
+    def __init__(self, precisao: int = 11):
+        self.precisao = precisao
+        self.m = 1 << precisao
+        self.registradores = np.zeros(self.m, dtype=np.uint8)
+
+    def posicoes(self, valores) -> tuple[np.ndarray, np.ndarray]:
+        """Registrador e rank de cada valor; útil para distribuir um lote entre várias células."""
+        h = _hash64(valores)
+        indices = (h >> np.uint64(64 - self.precisao)).astype(np.intp)
+        restante = h << np.uint64(self.precisao)
+        ranks = np.minimum(_zeros_a_esquerda(restante), 64 - self.precisao) + 1
+        return indices, ranks.astype(np.uint8)
+
+    def adicionar_posicoes(self, indices: np.ndarray, ranks: np.ndarray):
+        np.maximum.at(self.registradores, indices, ranks)
+
+    def atualizar(self, valores):
+        valores = pd.Series(valores).dropna()
+        if not valores.empty:
+            self.adicionar_posicoes(*self.posicoes(valores.to_numpy()))
+
+    def mesclar(self, outro: "HyperLogLog") -> "HyperLogLog":
+        if outro.precisao != self.precisao:
+            raise ValueError("Só é possível mesclar HyperLogLog com a mesma precisão.")
+        np.maximum(self.registradores, outro.registradores, out=self.registradores)
+        return self
+
+    @property
+    def erro_padrao(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def estimar(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        bruta = alpha * m * m / np.sum(np.ldexp(1.0, -self.registradores.astype(np.int64)))
+        vazios = int(np.count_nonzero(self.registradores == 0))
+        # Correção para cardinalidades pequenas (contagem linear)
+        if bruta <= 2.5 * m and vazios:
+            return int(round(m * math.log(m / vazios)))
+        return int(round(bruta))
+
+
+class CuboDistintos:
+    """Cubo de cancelamentos com registradores HyperLogLog por célula.
+
+    Cada célula (uma combinação de valores de `dimensoes`, por exemplo mês e
+    armador) guarda a contagem exata de cancelamentos e um HyperLogLog por
+    medida (navios, viagens, rotas). Qualquer agregação sobre as dimensões é
+    resolvida mesclando os registradores das células, sem voltar às linhas.
+    """
+
+    def __init__(self, dimensoes: list[str], medidas: dict[str, str], precisao: int = 11):
+        """`medidas` mapeia o nome da medida (ex.: 'Navios distintos') para a coluna de origem."""
+        self.dimensoes = list(dimensoes)
+        self.medidas = dict(medidas)
+        self.precisao = precisao
+        self.celulas: dict[tuple, dict] = {}
+
+    def _nova_celula(self) -> dict:
+        return {"n": 0, "hll": {nome: HyperLogLog(self.precisao) for nome in self.medidas}}
+
+    def atualizar(self, df: pd.DataFrame):
+        """Incorpora um lote de cancelamentos (com as colunas das dimensões e medidas)."""
+        if df.empty:
+            return
+        chaves = [df[d].astype("string").fillna("Não Informado") for d in self.dimensoes]
+        grupos = df.groupby(chaves, sort=False, observed=True).indices
+
+        # Hash de cada medida calculado uma única vez para o lote inteiro
+        posicoes = {}
+        for nome, coluna in self.medidas.items():
+            valores = df[coluna]
+            validos = valores.notna().to_numpy()
+            indices, ranks = HyperLogLog(self.precisao).posicoes(valores.fillna("").to_numpy())
+            posicoes[nome] = (indices, ranks, validos)
+
+        for chave, linhas in grupos.items():
+            chave = chave if isinstance(chave, tuple) else (chave,)
+            celula = self.celulas.setdefault(chave, self._nova_celula())
+            celula["n"] += len(linhas)
+            for nome, (indices, ranks, validos) in posicoes.items():
+                linhas_validas = linhas[validos[linhas]]
+                celula["hll"][nome].adicionar_posicoes(indices[linhas_validas], ranks[linhas_validas])
+
+    def mesclar(self, outro: "CuboDistintos") -> "CuboDistintos":
+        for chave, celula in outro.celulas.items():
+            destino = self.celulas.setdefault(chave, self._nova_celula())
+            destino["n"] += celula["n"]
+            for nome, hll in celula["hll"].items():
+                destino["hll"][nome].mesclar(hll)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        return sum(h.registradores.nbytes for c in self.celulas.values() for h in c["hll"].values())
+
+    def agregar(self, por: list[str] | None = None, filtros: dict[str, list] | None = None) -> pd.DataFrame:
+        """Cancelamentos e distintos estimados agrupados por `por` (vazio = total geral).
+
+        `filtros` restringe as células consideradas (dimensão -> valores aceitos).
+        """
+        por = list(por or [])
+        posicoes_por = [self.dimensoes.index(d) for d in por]
+        filtros = {self.dimensoes.index(d): set(map(str, v)) for d, v in (filtros or {}).items() if v}
+
+        grupos: dict[tuple, dict] = {}
+        for chave, celula in self.celulas.items():
+            if any(chave[i] not in aceitos for i, aceitos in filtros.items()):
+                continue
+            destino_chave = tuple(chave[i] for i in posicoes_por)
+            destino = grupos.setdefault(destino_chave, self._nova_celula())
+            destino["n"] += celula["n"]
+            for nome, hll in celula["hll"].items():
+                destino["hll"][nome].mesclar(hll)
+
+        linhas = []
+        for chave, celula in grupos.items():
+            linha = dict(zip(por, chave))
+            linha["Cancelamentos"] = celula["n"]
+            for nome, hll in celula["hll"].items():
+                linha[nome] = hll.estimar()
+            linhas.append(linha)
+        resultado = pd.DataFrame(linhas, columns=[*por, "Cancelamentos", *self.medidas])
+        return resultado.sort_values(por).reset_index(drop=True) if por else resultado
+
+
+class KLL:
+    """Sketch de quantis KLL: um buffer por nível, com peso 2^nível por elemento."""
+
+    def __init__(self, k: int = 200, semente: int | None = None):
+        self.k = k
+        self.n = 0
+        self.niveis = [np.empty(0)]
+        self._rng = np.random.default_rng(semente)
+
+    def _capacidade(self, nivel: int) -> int:
+        # Níveis mais baixos (mais leves) guardam menos: a capacidade cai 2/3 por nível abaixo do topo
+        return max(2, int(math.ceil(self.k * (2 / 3) ** (len(self.niveis) - nivel - 1))))
+
+    def _compactar(self):
+        nivel = 0
+        while nivel < len(self.niveis):
+            buffer = self.niveis[nivel]
+            if len(buffer) > self._capacidade(nivel):
+                if nivel + 1 == len(self.niveis):
+                    self.niveis.append(np.empty(0))
+                buffer = np.sort(buffer)
+                # Com tamanho ímpar, o menor elemento fica no nível para o total de pesos fechar
+                impar = len(buffer) % 2
+                promovidos = buffer[impar + int(self._rng.integers(2))::2]
+                self.niveis[nivel] = buffer[:impar]
+                self.niveis[nivel + 1] = np.concatenate([self.niveis[nivel + 1], promovidos])
+            nivel += 1
+
+    def atualizar(self, valores):
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[~np.isnan(valores)]
+        if len(valores):
+            self.niveis[0] = np.concatenate([self.niveis[0], valores])
+            self.n += len(valores)
+            self._compactar()
+
+    def mesclar(self, *outros: "KLL") -> "KLL":
+        """Incorpora um ou mais sketches, com uma única compactação no final."""
+        altura = max(len(self.niveis), *(len(outro.niveis) for outro in outros))
+        self.niveis += [np.empty(0)] * (altura - len(self.niveis))
+        self.niveis = [np.concatenate([buffer, *(outro.niveis[nivel] for outro in outros
+                                                 if nivel < len(outro.niveis))])
+                       for nivel, buffer in enumerate(self.niveis)]
+        self.n += sum(outro.n for outro in outros)
+        self._compactar()
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self.niveis)
+
+    def quantis(self, qs) -> np.ndarray:
+        """Valores nos quantis `qs` (entre 0 e 1); NaN se o sketch estiver vazio."""
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        valores = np.concatenate(self.niveis)
+        pesos = np.concatenate([np.full(len(buffer), 2.0 ** nivel) for nivel, buffer in enumerate(self.niveis)])
+        ordem = np.argsort(valores, kind="stable")
+        acumulado = np.cumsum(pesos[ordem])
+        posicoes = np.searchsorted(acumulado, qs * acumulado[-1], side="left")
+        return valores[ordem][np.minimum(posicoes, len(valores) - 1)]
+
+
+class CuboQuantis:
+    """Cubo com um sketch KLL por célula e medida (ex.: antecedências por armador x mês).
+
+    Como o `CuboDistintos`, responde a qualquer agregação sobre as dimensões
+    mesclando as células, e cresce com novos lotes sem voltar às linhas antigas.
+    """
+
+    def __init__(self, dimensoes: list[str], medidas: list[str], k: int = 200):
+        self.dimensoes = list(dimensoes)
+        self.medidas = list(medidas)
+        self.k = k
+        self.celulas: dict[tuple, dict] = {}
+
+    def _nova_celula(self) -> dict:
+        return {medida: KLL(self.k) for medida in self.medidas}
+
+    def atualizar(self, df: pd.DataFrame):
+        """Incorpora um lote (com as colunas das dimensões e das medidas)."""
+        if df.empty:
+            return
+        chaves = [df[d].astype("string").fillna("Não Informado") for d in self.dimensoes]
+        grupos = df.groupby(chaves, sort=False, observed=True).indices
+        valores = {medida: df[medida].to_numpy(dtype=float, na_value=np.nan) for medida in self.medidas}
+        for chave, linhas in grupos.items():
+            chave = chave if isinstance(chave, tuple) else (chave,)
+            celula = self.celulas.setdefault(chave, self._nova_celula())
+            for medida, sketch in celula.items():
+                sketch.atualizar(valores[medida][linhas])
+
+    def mesclar(self, outro: "CuboQuantis") -> "CuboQuantis":
+        for chave, celula in outro.celulas.items():
+            destino = self.celulas.setdefault(chave, self._nova_celula())
+            for medida, sketch in celula.items():
+                destino[medida].mesclar(sketch)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        return sum(sketch.nbytes for celula in self.celulas.values() for sketch in celula.values())
+
+    def agregar(self, medida: str, por: list[str] | None = None, filtros: dict[str, list] | None = None,
+                quantis=(0.5, 0.9, 0.99)) -> pd.DataFrame:
+        """Escalas e quantis de `medida` agrupados por `por` (vazio = total geral).
+
+        `filtros` restringe as células consideradas (dimensão -> valores aceitos).
+        """
+        por = list(por or [])
+        posicoes_por = [self.dimensoes.index(d) for d in por]
+        filtros = {self.dimensoes.index(d): set(map(str, v)) for d, v in (filtros or {}).items() if v}
+
+        grupos: dict[tuple, list] = {}
+        for chave, celula in self.celulas.items():
+            if any(chave[i] not in aceitos for i, aceitos in filtros.items()):
+                continue
+            grupos.setdefault(tuple(chave[i] for i in posicoes_por), []).append(celula[medida])
+
+        nomes = [f"p{round(q * 100):g}" for q in quantis]
+        linhas = []
+        for chave, sketches in grupos.items():
+            sketch = KLL(self.k).mesclar(*sketches)
+            if sketch.n:
+                linhas.append({**dict(zip(por, chave)), "Escalas": sketch.n,
+                               **dict(zip(nomes, sketch.quantis(quantis)))})
+        resultado = pd.DataFrame(linhas, columns=[*por, "Escalas", *nomes])
+        return resultado.sort_values(por).reset_index(drop=True) if por else resultado
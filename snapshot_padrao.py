@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot binário do arquivo padrão para a inicialização rápida do dashboard.
+
+Ler a planilha padrão (.xlsx) é a etapa mais lenta de uma inicialização a
+frio. `gerar_snapshot` faz essa leitura com antecedência e grava em um único
+arquivo (pickle) o DataFrame já mapeado e os números da Visão Geral. O
+dashboard usa o snapshot enquanto o hash do conteúdo da planilha for o mesmo
+registrado nele; se a planilha mudar, volta à leitura normal.
+
+Uso (etapa de build/deploy):
+    python snapshot_padrao.py
+    python snapshot_padrao.py --origem planilha.xlsx --destino snapshot.pkl
+
+`registrar_primeira_pintura` acrescenta o tempo até a primeira pintura de
+cada sessão em `tempos_inicializacao.csv`, para acompanhar a evolução.
+"""
+
+import argparse
+import csv
+import os
+import pickle
+import time
+from datetime import datetime
+
+from cache_dados import hash_conteudo
+from dados_navios import preparar_cancelamentos
+from mapeamento_colunas import CAMPOS_APP, ler_com_mapeamento
+from validacao import validar
+
+ARQUIVO_PADRAO = "ProgramacaoDeNavios (1) (1).xlsx"
+ARQUIVO_SNAPSHOT = "snapshot_padrao.pkl"
+ARQUIVO_TEMPOS = "tempos_inicializacao.csv"
+# Incrementar quando o conteúdo do snapshot mudar de formato
+VERSAO_SNAPSHOT = 1
+
+
+def resumo_visao_geral(df, colunas: dict, validacao, descartar: bool) -> dict:
+    """Números da aba Visão Geral (sem filtros), com ou sem o descarte de inconsistentes."""
+    col_data, col_conteineres = colunas.get("data"), colunas.get("conteineres")
+    df_canc = preparar_cancelamentos(df, colunas["status"], col_data, validacao.convertidas,
+                                     validacao.limpa if descartar else None)
+    resumo = {
+        "total": int(validacao.limpa.sum()) if descartar else len(df),
+        "cancelados": len(df_canc),
+        "teus": int(df_canc[col_conteineres].fillna(0).sum()) if col_conteineres else None,
+        "periodo": None,
+    }
+    if col_data and not df_canc.empty:
+        resumo["periodo"] = (df_canc[col_data].min(), df_canc[col_data].max())
+    return resumo
+
+
+def gerar_snapshot(origem: str = ARQUIVO_PADRAO, destino: str = ARQUIVO_SNAPSHOT,
+                   campos=CAMPOS_APP) -> dict:
+    """Lê a planilha, valida, calcula a Visão Geral e grava tudo em `destino`."""
+    df, colunas = ler_com_mapeamento(origem, campos)
+    validacao = validar(df, colunas)
+    snapshot = {
+        "versao": VERSAO_SNAPSHOT,
+        "hash_origem": hash_conteudo(origem),
+        "campos": tuple(campos),
+        "df": df,
+        "colunas": colunas,
+        "visao_geral": {descartar: resumo_visao_geral(df, colunas, validacao, descartar)
+                        for descartar in (True, False)},
+    }
+    # Grava em um temporário e renomeia, para nunca deixar um snapshot pela metade
+    temporario = destino + ".tmp"
+    with open(temporario, "wb") as arquivo:
+        pickle.dump(snapshot, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, destino)
+    return snapshot
+
+
+def carregar_snapshot(origem: str = ARQUIVO_PADRAO, destino: str = ARQUIVO_SNAPSHOT,
+                      campos=CAMPOS_APP) -> dict | None:
+    """Snapshot de `origem`, ou None se não existir ou estiver desatualizado."""
+    if not (os.path.exists(destino) and os.path.exists(origem)):
+        return None
+    try:
+        with open(destino, "rb") as arquivo:
+            snapshot = pickle.load(arquivo)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if (snapshot.get("versao") != VERSAO_SNAPSHOT or snapshot.get("campos") != tuple(campos)
+            or snapshot.get("hash_origem") != hash_conteudo(origem)):
+        return None
+    return snapshot
+
+
+def registrar_primeira_pintura(ms: float, fonte: str, destino: str = ARQUIVO_TEMPOS):
+    """Acrescenta uma linha (momento, fonte, ms) ao histórico de tempos de inicialização."""
+    novo = not os.path.exists(destino)
+    try:
+        with open(destino, "a", newline="", encoding="utf-8") as arquivo:
+            escritor = csv.writer(arquivo)
+            if novo:
+                escritor.writerow(["momento", "fonte", "primeira_pintura_ms"])
+            escritor.writerow([datetime.now().isoformat(timespec="seconds"), fonte, f"{ms:.0f}"])
+    except OSError:
+        pass  # diretório somente leitura (ex.: hospedagem): o tempo continua visível no dashboard
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o snapshot binário do arquivo padrão.")
+    parser.add_argument("--origem", default=ARQUIVO_PADRAO, help="Planilha de origem")
+    parser.add_argument("--destino", default=ARQUIVO_SNAPSHOT, help="Arquivo do snapshot")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    snapshot = gerar_snapshot(args.origem, args.destino)
+    print(f"Snapshot gravado em {args.destino}: {len(snapshot['df']):,} linhas, "
+          f"{os.path.getsize(args.destino) / 1e6:.1f} MB em {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Datasets em Arrow IPC (Feather v2, sem compressão) abertos por mapeamento de memória.
+
+O dashboard, o relatório de linha de comando, a API e os processos de
+conversão liam cada um a sua cópia do dataset (o pickle do armazém é
+desserializado para a memória privada de cada processo). Gravado em Arrow
+IPC, o arquivo é aberto com `pa.memory_map` e as colunas chegam ao pandas
+apontando para o próprio mapeamento: texto como `str` (Arrow), números como
+arrays NumPy somente leitura. N processos compartilham uma única cópia física
+pelo page cache do sistema e abrir o arquivo custa milissegundos (só o
+cabeçalho é lido; as páginas entram sob demanda).
+
+Colunas float são gravadas com NaN no lugar de nulo, e colunas de data com
+NaT (o inteiro mínimo) no lugar de nulo: a conversão de uma coluna com nulos
+para NumPy exigiria uma cópia.
+
+O DataFrame de `abrir_arrow` é somente leitura: escrever uma célula ou
+alterar uma coluna no lugar (`df.loc[i, c] = v`, `inplace=True`) levanta
+`ValueError: assignment destination is read-only`, porque o copy-on-write só
+copia blocos compartilhados e o bloco mapeado não é. Substituir colunas
+inteiras (`df[c] = ...`) e escrever em derivados (`df.copy(deep=False)`,
+fatias, seleções por máscara) funciona; para escrever no próprio frame, faça
+antes `df = df.copy()`.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Chave dos metadados do schema com os metadados próprios (ex.: mapa de colunas)
+CHAVE_METADADOS = b"navios"
+
+
+def gravar_arrow(df: pd.DataFrame, caminho: str, metadados: dict | None = None):
+    """Grava `df` em Arrow IPC (temporário + rename); `metadados` vão no schema como JSON."""
+    tabela = pa.Table.from_pandas(df, preserve_index=None)
+    for coluna in df.columns:
+        tipo = df[coluna].dtype
+        if not (isinstance(tipo, np.dtype) and tipo.kind in "fM" and df[coluna].hasnans):
+            continue
+        valores = df[coluna].to_numpy()
+        # NaT é o int64 mínimo: gravado como valor, volta como NaT sem máscara de nulos
+        array = (pa.array(valores.view("int64"), type=pa.timestamp(np.datetime_data(tipo)[0]))
+                 if tipo.kind == "M" else pa.array(valores))
+        posicao = tabela.schema.get_field_index(str(coluna))
+        tabela = tabela.set_column(posicao, tabela.field(posicao), array)
+    if metadados is not None:
+        tabela = tabela.replace_schema_metadata({**tabela.schema.metadata,
+                                                 CHAVE_METADADOS: json.dumps(metadados).encode()})
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with pa.OSFile(temporario, "wb") as arquivo, pa.ipc.new_file(arquivo, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+    os.replace(temporario, caminho)
+
+
+def abrir_arrow(caminho: str) -> tuple[pd.DataFrame, dict | None]:
+    """DataFrame (somente leitura) com as colunas apontando para o arquivo mapeado e os metadados próprios."""
+    tabela = pa.ipc.open_file(pa.memory_map(caminho)).read_all()
+    metadados = (tabela.schema.metadata or {}).get(CHAVE_METADADOS)
+    # split_blocks: um bloco por coluna, sem consolidar (e copiar) colunas do mesmo tipo
+    df = tabela.to_pandas(split_blocks=True, self_destruct=False)
+    return df, json.loads(metadados) if metadados is not None else None
+
+
+def bytes_privados() -> int:
+    """Bytes alocados pelo Arrow neste processo (o que não veio do mapeamento)."""
+    return pa.total_allocated_bytes()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Validação da qualidade dos dados na ingestão.
+
+`validar` percorre uma única vez as colunas mapeadas (ver `mapeamento_colunas`)
+com operações vetorizadas e produz:
+
+- um relatório por coluna: nulos, falhas de conversão, valores fora do
+  intervalo, valores implausíveis e o perfil mín/quartis/máx;
+- as colunas já convertidas (datas e números), para não converter de novo;
+- a máscara de linhas limpas, reaproveitada por todas as abas.
+
+`validar_dataset` devolve também o DataFrame com as colunas convertidas; é
+esse frame (com a máscara e o relatório) que o armazém de artefatos grava
+em Arrow como `dataset_validado`.
+
+Regras: a ETA deve cair na janela dos dados (quantis extremos ± 1 ano); as
+demais datas da escala (ETD, ETB, chegada na barra, atracação, início e fim
+de operação) devem ficar a até `JANELA_ESCALA_DIAS` da ETA; as
+durações (ETD − ETA, fim − início de operação) não podem ser negativas nem
+passar de `LIMITE_DURACAO_HORAS`; `Movs` deve ser numérico e não negativo.
+Dimensões fora de `LIMITES_NUMERICOS` aparecem no relatório, mas não
+descartam a linha.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from dados_navios import para_datas
+
+JANELA_ESCALA_DIAS = 60
+LIMITE_DURACAO_HORAS = 24 * 30
+# Campo -> (mínimo, máximo) plausíveis; None = sem limite
+LIMITES_NUMERICOS = {"conteineres": (0, None), "comprimento": (20, 500), "largura": (5, 80)}
+CAMPOS_DATA = ["data", "etd", "etb", "chegada_barra", "atracacao", "inicio_operacao", "fim_operacao"]
+# Durações verificadas: nome no relatório -> (campo inicial, campo final)
+DURACOES = {
+    "Permanência (h)": ("data", "etd"),
+    "Operação (h)": ("inicio_operacao", "fim_operacao"),
+}
+QUANTIS = [0.25, 0.5, 0.75]
+
+
+class Validacao:
+    """Resultado da validação: relatório por coluna, colunas convertidas e máscara de linhas limpas."""
+
+    def __init__(self, relatorio: pd.DataFrame, convertidas: dict[str, pd.Series],
+                 limpa: np.ndarray, tempo_ms: float):
+        self.relatorio = relatorio
+        self.convertidas = convertidas
+        self.limpa = limpa
+        self.tempo_ms = tempo_ms
+
+    @property
+    def n_descartadas(self) -> int:
+        return int((~self.limpa).sum())
+
+    def aplicar_conversoes(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Substitui no DataFrame as colunas pelas versões já convertidas."""
+        for coluna, serie in self.convertidas.items():
+            df[coluna] = serie.to_numpy()
+        return df
+
+    def metadados(self) -> dict:
+        """Relatório, nomes das colunas convertidas e tempo, em tipos que o JSON aceita."""
+        return {"relatorio": self.relatorio.to_dict(orient="split", index=False),
+                "convertidas": list(self.convertidas), "tempo_ms": self.tempo_ms}
+
+    @classmethod
+    def de_metadados(cls, metadados: dict, df: pd.DataFrame, limpa: np.ndarray) -> "Validacao":
+        """Validação gravada com `metadados`, com as convertidas apontando para as colunas de `df`."""
+        relatorio = pd.DataFrame(metadados["relatorio"]["data"], columns=metadados["relatorio"]["columns"])
+        return cls(relatorio, {coluna: df[coluna] for coluna in metadados["convertidas"]},
+                   limpa, metadados["tempo_ms"])
+
+
+def _formatar(valor) -> str:
+    if isinstance(valor, pd.Timestamp):
+        return valor.strftime("%Y-%m-%d %H:%M")
+    return f"{valor:,.2f}"
+
+
+def _perfil(valores: pd.Series) -> dict:
+    # Texto, para datas e números conviverem nas mesmas colunas do relatório
+    if valores.notna().sum() == 0:
+        return {"Mín": "", "P25": "", "Mediana": "", "P75": "", "Máx": ""}
+    q = valores.quantile(QUANTIS)
+    extremos = [valores.min(), q.iloc[0], q.iloc[1], q.iloc[2], valores.max()]
+    return dict(zip(["Mín", "P25", "Mediana", "P75", "Máx"], map(_formatar, extremos)))
+
+
+def _linha(coluna, nulos, falhas, fora, implausiveis, valores) -> dict:
+    return {"Coluna": coluna, "Nulos": int(nulos), "Falhas de conversão": int(falhas),
+            "Fora do intervalo": int(fora), "Implausíveis": int(implausiveis), **_perfil(valores)}
+
+
+def validar(df: pd.DataFrame, colunas: dict[str, str]) -> Validacao:
+    """Valida as colunas mapeadas (campo -> coluna) de `df` sem alterá-lo."""
+    inicio = time.perf_counter()
+    n = len(df)
+    limpa = np.ones(n, dtype=bool)
+    linhas, convertidas, datas = [], {}, {}
+
+    # Datas: conversão única, nulos e falhas de conversão
+    for campo in CAMPOS_DATA:
+        coluna = colunas.get(campo)
+        if coluna is None:
+            continue
+        datas[campo] = convertidas[coluna] = para_datas(df[coluna])
+
+    eta = datas.get("data")
+    if eta is not None:
+        validas = eta.dropna()
+        if len(validas):
+            q = validas.quantile([0.001, 0.999])
+            janela = (q.iloc[0] - pd.DateOffset(years=1), q.iloc[1] + pd.DateOffset(years=1))
+        else:
+            janela = (pd.Timestamp.min, pd.Timestamp.max)
+
+    for campo, serie in datas.items():
+        coluna = colunas[campo]
+        nulos = df[coluna].isna().to_numpy()
+        falhas = serie.isna().to_numpy() & ~nulos
+        if campo == "data":
+            fora = ((serie < janela[0]) | (serie > janela[1])).to_numpy()
+            # A ETA é obrigatória para as análises temporais
+            limpa &= ~(nulos | falhas | fora)
+        elif eta is not None:
+            fora = ((serie - eta).abs() > pd.Timedelta(days=JANELA_ESCALA_DIAS)).to_numpy()
+            limpa &= ~(falhas | fora)
+        else:
+            fora = np.zeros(n, dtype=bool)
+            limpa &= ~falhas
+        linhas.append(_linha(coluna, nulos.sum(), falhas.sum(), fora.sum(), 0, serie))
+
+    # Durações negativas ou longas demais
+    for nome, (campo_ini, campo_fim) in DURACOES.items():
+        if campo_ini in datas and campo_fim in datas:
+            horas = (datas[campo_fim] - datas[campo_ini]).dt.total_seconds() / 3600
+            implausiveis = ((horas < 0) | (horas > LIMITE_DURACAO_HORAS)).to_numpy()
+            limpa &= ~implausiveis
+            linhas.append(_linha(nome, horas.isna().sum(), 0, 0, implausiveis.sum(), horas))
+
+    # Numéricos: texto em coluna numérica e valores fora dos limites plausíveis
+    for campo, (minimo, maximo) in LIMITES_NUMERICOS.items():
+        coluna = colunas.get(campo)
+        if coluna is None:
+            continue
+        bruta = df[coluna]
+        valores = convertidas[coluna] = pd.to_numeric(bruta, errors='coerce')
+        nulos = bruta.isna().to_numpy()
+        falhas = valores.isna().to_numpy() & ~nulos
+        implausiveis = np.zeros(n, dtype=bool)
+        if minimo is not None:
+            implausiveis |= (valores < minimo).to_numpy()
+        if maximo is not None:
+            implausiveis |= (valores > maximo).to_numpy()
+        if campo == "conteineres":
+            limpa &= ~(falhas | implausiveis)
+        linhas.append(_linha(coluna, nulos.sum(), falhas.sum(), 0, implausiveis.sum(), valores))
+
+    relatorio = pd.DataFrame(linhas)
+    return Validacao(relatorio, convertidas, limpa, (time.perf_counter() - inicio) * 1000)
+
+
+def validar_dataset(df: pd.DataFrame, colunas: dict[str, str]) -> tuple[pd.DataFrame, Validacao]:
+    """`validar` e uma cópia rasa de `df` com as colunas já convertidas (as convertidas passam a ser elas)."""
+    validacao = validar(df, colunas)
+    convertido = validacao.aplicar_conversoes(df.copy(deep=False))
+    validacao.convertidas = {coluna: convertido[coluna] for coluna in validacao.convertidas}
+    return convertido, validacao